@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""batch_insights.py
+Berechnet Kontostand-Insights und Trading-Wrapped-Punkte für alle Benutzer.
+
+Usage
+-----
+python batch_insights.py [--output insights.jsonl.gz] [--workers N]
+                         [--only transaction-insights|trading-wrapped]
+                         [--store [results_store.db]]
+
+Jeder Datensatz wird genau einmal im Hauptprozess geladen. Die Worker
+werden per fork gestartet und erben die geladenen DataFrames
+copy-on-write, verschickt werden nur Listen von Benutzer-IDs. Auf
+Plattformen ohne fork lädt jeder Worker die Daten beim ersten Zugriff
+selbst.
+
+Die Ausgabe ist gzip-komprimiertes JSON Lines, eine Zeile pro
+(Endpoint, Benutzer) mit dem Fingerabdruck des Datensatzes, aus dem sie
+berechnet wurde. Ein erneuter Aufruf mit derselben Ausgabedatei
+überspringt bereits berechnete Benutzer und setzt den Lauf fort;
+Ergebnisse einer älteren Datensatz-Version werden verworfen und neu
+berechnet.
+
+Mit `--store` landen die Ergebnisse zusätzlich im `ResultsStore`, aus dem
+die Endpoints zuerst lesen (z. B. vor einem Wrapped-Launch). Die
+Firmennamen für Trading Wrapped werden vor dem Forken für alle Benutzer
+gesammelt und gebündelt aufgelöst, die Worker stellen dann keine
+eigenen LLM-Anfragen mehr.
+
+Dependencies: pandas >=1.5
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from results_store import (
+    BANKING_CSV, TRADING_CSV, TRADING_WRAPPED, TRANSACTION_INSIGHTS, ResultsStore, dataset_fingerprint
+)
+from upstream import BATCH, priority
+
+DEFAULT_OUTPUT = "insights.jsonl.gz"
+DEFAULT_CHUNK_SIZE = 32
+
+def _user_ids(endpoint: str, csv_path: str) -> List[str]:
+    """Lädt den Datensatz eines Endpoints und gibt alle Benutzer-IDs zurück."""
+    if endpoint == TRANSACTION_INSIGHTS:
+        from transactions.banking_balance import _dataset
+        return list(_dataset(csv_path).offsets)
+    from tr_wrapped.trading_wrapped import _aggregate
+    agg_df, _ = _aggregate(csv_path)
+    return list(agg_df.index)
+
+
+def _compute_chunk(endpoint: str, csv_path: str, user_ids: List[str]) -> List[Tuple[str, Any, Optional[str]]]:
+    """Berechnet einen Block von Benutzern im Worker: (user_id, daten, fehler)."""
+    results = []
+    for user_id in user_ids:
+        try:
+            if endpoint == TRANSACTION_INSIGHTS:
+                from transactions.banking_balance import get_balance_over_time
+                data = get_balance_over_time(user_id, csv_path)
+            else:
+                from tr_wrapped.trading_wrapped import wrapped_points
+                result = wrapped_points(user_id, csv_path)
+                if result.unresolved:
+                    # Nicht speichern: ein Fehler wird beim Fortsetzen erneut berechnet
+                    results.append((user_id, None, f"Firmennamen nicht aufgelöst: {', '.join(result.unresolved)}"))
+                    continue
+                data = result.points
+            results.append((user_id, data, None))
+        except Exception as e:
+            results.append((user_id, None, str(e)))
+    return results
+
+
+def _resolve_names(csv_path: str, user_ids: List[str]):
+    """Löst die Firmennamen aller Benutzer gebündelt im Hauptprozess auf."""
+    from tr_wrapped.trading_wrapped import resolve_company_names, wrapped_isins
+
+    started = time.perf_counter()
+    isins = wrapped_isins(csv_path, user_ids)
+    print(f"Löse {len(isins)} ISINs auf")
+    # Mistral-Anfragen mit Batch-Priorität, gedrosselt auf das Limit des Anbieters
+    with priority(BATCH):
+        resolve_company_names(isins, timeout=None)
+    print(f"Firmennamen aufgelöst in {time.perf_counter() - started:.1f}s")
+
+
+def _read_done(output: str, fingerprints: Dict[str, str]) -> Tuple[List[Tuple[str, Dict[str, Any]]], bool]:
+    """Liest bereits geschriebene Ergebnisse zu den aktuellen Datensatz-Fingerabdrücken.
+
+    Liefert die gültigen Zeilen samt Datensatz und ob die Datei neu geschrieben
+    werden muss: nach einem abgebrochenen letzten Block oder wenn Ergebnisse
+    einer älteren Datensatz-Version verworfen wurden.
+    """
+    records: List[Tuple[str, Dict[str, Any]]] = []
+    rewrite = False
+    if not os.path.exists(output):
+        return records, rewrite
+    try:
+        with gzip.open(output, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    rewrite = True
+                    break
+                if record.get("fingerprint") != fingerprints.get(record["endpoint"]):
+                    rewrite = True
+                    continue
+                records.append((line, record))
+    except (EOFError, gzip.BadGzipFile):
+        rewrite = True
+    return records, rewrite
+
+
+def _repair(output: str, lines: List[str]):
+    """Schreibt die lesbaren Ergebnisse neu, damit weiter angehängt werden kann."""
+    tmp_path = output + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, output)
+
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _mp_context():
+    """Bevorzugt fork, damit die Worker die geladenen Daten erben statt sie zu picklen."""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def run(
+    endpoints: List[str],
+    output: str = DEFAULT_OUTPUT,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    paths: Optional[Dict[str, str]] = None,
+    store: Optional[ResultsStore] = None,
+) -> Dict[str, int]:
+    """Berechnet alle fehlenden (Endpoint, Benutzer)-Paare und hängt sie an *output* an.
+
+    Mit *store* werden die Ergebnisse zusätzlich unter dem aktuellen
+    Datensatz-Fingerabdruck im ResultsStore abgelegt, auch die aus einem
+    früheren Lauf bereits in *output* vorhandenen.
+    """
+    paths = paths or {TRANSACTION_INSIGHTS: BANKING_CSV, TRADING_WRAPPED: TRADING_CSV}
+    workers = workers or os.cpu_count() or 1
+
+    # Vor dem Laden: ändert sich die Datei danach noch, wird beim nächsten Lauf neu berechnet
+    fingerprints = {endpoint: dataset_fingerprint(path) for endpoint, path in paths.items()}
+    records, rewrite = _read_done(output, fingerprints)
+    if rewrite:
+        print(f"Ausgabe bereinigt, {len(records)} Ergebnisse zum aktuellen Datensatz übernommen")
+        _repair(output, [line for line, _ in records])
+    done = {(record["endpoint"], record["user_id"]) for _, record in records}
+    if done:
+        print(f"{len(done)} Ergebnisse bereits vorhanden, werden übersprungen")
+    if store is not None:
+        # Schon berechnete Ergebnisse landen auch dann im Store, wenn nichts mehr zu tun ist
+        for endpoint in endpoints:
+            existing = [(record["user_id"], record["data"]) for _, record in records if record["endpoint"] == endpoint]
+            if existing:
+                store.put_many(endpoint, fingerprints[endpoint], existing)
+                print(f"{len(existing)} vorhandene Ergebnisse für {endpoint} in den ResultsStore übernommen")
+
+    # Datensätze einmal im Hauptprozess laden, bevor die Worker geforkt werden
+    pending: Dict[str, List[str]] = {}
+    for endpoint in endpoints:
+        user_ids = _user_ids(endpoint, paths[endpoint])
+        pending[endpoint] = [u for u in user_ids if (endpoint, u) not in done]
+
+    if pending.get(TRADING_WRAPPED):
+        _resolve_names(paths[TRADING_WRAPPED], pending[TRADING_WRAPPED])
+
+    total = sum(len(u) for u in pending.values())
+    stats = {"berechnet": 0, "fehler": 0, "übersprungen": len(done)}
+    if total == 0:
+        print("Nichts zu tun")
+        return stats
+
+    print(f"Berechne {total} Ergebnisse mit {workers} Workern")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context()) as pool, \
+            gzip.open(output, "at", encoding="utf-8") as out:
+        futures = {
+            pool.submit(_compute_chunk, endpoint, paths[endpoint], chunk): endpoint
+            for endpoint, user_ids in pending.items()
+            for chunk in _chunks(user_ids, chunk_size)
+        }
+        for future in as_completed(futures):
+            endpoint = futures[future]
+            results = future.result()
+            for user_id, data, error in results:
+                if error is not None:
+                    stats["fehler"] += 1
+                    print(f"Fehler bei {endpoint} für {user_id}: {error}")
+                    continue
+                out.write(json.dumps(
+                    {"endpoint": endpoint, "user_id": user_id, "fingerprint": fingerprints[endpoint], "data": data},
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                ) + "\n")
+                stats["berechnet"] += 1
+            out.flush()
+            if store is not None:
+                store.put_many(endpoint, fingerprints[endpoint], (
+                    (user_id, data) for user_id, data, error in results if error is None
+                ))
+
+            processed = stats["berechnet"] + stats["fehler"]
+            elapsed = time.perf_counter() - started
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            eta = (total - processed) / rate if rate > 0 else 0.0
+            print(f"[{processed}/{total}] {rate:.1f} Benutzer/s, noch ca. {eta:.0f}s")
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Fertig: {stats['berechnet']} berechnet, {stats['fehler']} Fehler in {elapsed:.1f}s "
+        f"({(stats['berechnet'] + stats['fehler']) / elapsed:.1f} Benutzer/s)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Berechnet Insights für alle Benutzer.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Ausgabedatei (gzip JSON Lines)")
+    parser.add_argument("--workers", type=int, default=None, help="Anzahl Worker-Prozesse")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Benutzer pro Auftrag")
+    parser.add_argument("--only", choices=[TRANSACTION_INSIGHTS, TRADING_WRAPPED], help="Nur einen Endpoint berechnen")
+    parser.add_argument("--store", nargs="?", const="results_store.db", help="Ergebnisse auch in den ResultsStore schreiben")
+    parser.add_argument("--banking-csv", default=BANKING_CSV)
+    parser.add_argument("--trading-csv", default=TRADING_CSV)
+    args = parser.parse_args()
+
+    endpoints = [args.only] if args.only else [TRANSACTION_INSIGHTS, TRADING_WRAPPED]
+    stats = run(
+        endpoints,
+        output=args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        paths={TRANSACTION_INSIGHTS: args.banking_csv, TRADING_WRAPPED: args.trading_csv},
+        store=ResultsStore(args.store) if args.store else None,
+    )
+    sys.exit(1 if stats["fehler"] else 0)
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the backend analytics modules.
+
+Run from app/backend, e.g. ``python -m benchmarks.bench_rolling_windows``.
+``python -m benchmarks.run`` measures all modules on synthetic datasets
+from ``benchmarks.generators`` and writes comparable JSON results.
+"""
@@ -0,0 +1,87 @@
+"""Benchmark `trading_wrapped._aggregate_frame` against the former groupby-apply.
+
+Usage
+-----
+python -m benchmarks.bench_aggregate [USERS] [LEGACY_USERS]
+
+The vectorised aggregation runs on all USERS (default 100k). The former
+per-user `groupby().apply()` implementation is far slower, so it is only
+timed and compared on the first LEGACY_USERS users (default 2000).
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from tr_wrapped.trading_wrapped import _aggregate_frame
+
+COUNTRIES = ["US", "DE", "FR", "GB", "NL", "CA", "JP", "CN", "IE", "CH"]
+
+
+def synthetic_trades(users: int, mean_trades: float = 10.0, seed: int = 0) -> pd.DataFrame:
+    """Build a trade table with the helper columns `_load` adds."""
+    rng = np.random.default_rng(seed)
+    counts = rng.geometric(1.0 / mean_trades, users)
+    user_ids = np.repeat([f"user-{i:07d}" for i in range(users)], counts)
+    n = len(user_ids)
+    executed = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, n), unit="s")
+    isin = np.char.add(rng.choice(COUNTRIES, n), rng.integers(10**9, 10**10, n).astype(str))
+    df = pd.DataFrame({
+        "userId": user_ids,
+        "executedAt": executed,
+        "ISIN": isin,
+        "trade_value": rng.gamma(2.0, 250.0, n),
+    })
+    df["country"] = df["ISIN"].str.slice(0, 2).astype("category")
+    return df
+
+
+def legacy_aggregate(df: pd.DataFrame) -> pd.DataFrame:
+    """The per-user implementation `_aggregate` used before vectorisation."""
+    def user_aggs(g: pd.DataFrame) -> pd.Series:
+        out: dict[str, object] = {}
+        out["first_trade"] = g["executedAt"].min()
+        out["total_trades"] = len(g)
+        out["volume"] = g["trade_value"].sum()
+        out["largest_trade"] = g["trade_value"].max()
+        out["distinct_countries"] = g["ISIN"].str.slice(0, 2).nunique()
+        days = pd.to_datetime(g["executedAt"]).dt.normalize().drop_duplicates().sort_values()
+        longest = cur = 1
+        if days.empty:
+            longest = 0
+        else:
+            for prev, curr in zip(days[:-1], days[1:]):
+                if (curr - prev).days == 1:
+                    cur += 1
+                else:
+                    longest = max(longest, cur)
+                    cur = 1
+            longest = max(longest, cur)
+        out["longest_streak"] = longest
+        return pd.Series(out)
+
+    return df.groupby("userId")[["executedAt", "trade_value", "ISIN"]].apply(user_aggs)
+
+
+def _time(fn, *args) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    legacy_users = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    df = synthetic_trades(users)
+    print(f"{users} users, {len(df)} trades")
+
+    t_all, _ = _time(_aggregate_frame, df)
+    print(f"vectorised, all users:        {t_all:8.3f} s")
+
+    subset = df[df["userId"].isin(df["userId"].unique()[:legacy_users])]
+    t_fast, fast = _time(_aggregate_frame, subset)
+    t_slow, slow = _time(legacy_aggregate, subset)
+    pd.testing.assert_frame_equal(fast, slow, check_dtype=False)
+    print(f"vectorised, {legacy_users} users:      {t_fast:8.3f} s")
+    print(f"groupby-apply, {legacy_users} users:   {t_slow:8.3f} s  ({t_slow / t_fast:.0f}x slower, identical output)")
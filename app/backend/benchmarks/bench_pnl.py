@@ -0,0 +1,85 @@
+"""Benchmark the vectorised FIFO engine in `tr_wrapped.pnl`.
+
+Usage
+-----
+python -m benchmarks.bench_pnl [FILLS] [CHECK_FILLS]
+
+Times `realized_fills` on FILLS synthetic fills (default 2M) and checks
+it against a straightforward lot-queue implementation on the first
+CHECK_FILLS fills (default 50k).
+"""
+import sys
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+from tr_wrapped.pnl import realized_fills
+
+
+def synthetic_fills(fills: int, users: int = 20_000, isins: int = 2_000, seed: int = 0) -> pd.DataFrame:
+    """Random BUY/SELL fills; sells are rarer and sometimes exceed the open position."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "userId": rng.integers(0, users, fills).astype(str),
+        "ISIN": np.char.add("US", rng.integers(0, isins, fills).astype(str)),
+        "executedAt": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 86_400, fills), unit="s"),
+        "direction": np.where(rng.random(fills) < 0.7, "BUY", "SELL"),
+        "executionSize": rng.gamma(1.5, 5.0, fills),
+        "executionPrice": rng.gamma(4.0, 25.0, fills),
+        "executionFee": rng.choice([0.0, 1.0], fills),
+    })
+
+
+def reference_fills(df: pd.DataFrame) -> pd.DataFrame:
+    """Plain FIFO with a deque of [quantity, price, fee_per_unit] lots per position."""
+    lots = defaultdict(deque)
+    rows = []
+    ordered = df.sort_values(["userId", "ISIN", "executedAt"], kind="mergesort")
+    for user, isin, direction, size, price, fee in ordered[
+        ["userId", "ISIN", "direction", "executionSize", "executionPrice", "executionFee"]
+    ].itertuples(index=False):
+        queue = lots[(user, isin)]
+        if direction == "BUY":
+            if size > 0:
+                queue.append([size, price, fee / size])
+            continue
+        remaining, cost, buy_fees = size, 0.0, 0.0
+        while remaining > 1e-12 and queue:
+            lot = queue[0]
+            take = min(lot[0], remaining)
+            cost += take * lot[1]
+            buy_fees += take * lot[2]
+            lot[0] -= take
+            remaining -= take
+            if lot[0] <= 1e-12:
+                queue.popleft()
+        matched = size - remaining
+        rows.append((user, isin, matched, matched * price - cost - buy_fees - fee))
+    return pd.DataFrame(rows, columns=["userId", "ISIN", "matched_quantity", "realized_pnl"])
+
+
+if __name__ == "__main__":
+    fills = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    check_fills = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+
+    sample = synthetic_fills(check_fills)
+    fast = realized_fills(sample).sort_values(["userId", "ISIN", "executedAt"], kind="mergesort")
+    slow = reference_fills(sample)
+    assert np.allclose(fast["matched_quantity"], slow["matched_quantity"], atol=1e-6)
+    assert np.allclose(fast["realized_pnl"], slow["realized_pnl"], atol=1e-4)
+
+    started = time.perf_counter()
+    reference_fills(sample)
+    t_slow = time.perf_counter() - started
+    started = time.perf_counter()
+    realized_fills(sample)
+    t_check = time.perf_counter() - started
+    print(f"{check_fills} fills: vectorised {t_check:.3f} s, lot queue {t_slow:.3f} s (identical P&L)")
+
+    df = synthetic_fills(fills)
+    started = time.perf_counter()
+    result = realized_fills(df)
+    elapsed = time.perf_counter() - started
+    print(f"{fills} fills, {len(result)} sells: {elapsed:.3f} s ({fills / elapsed / 1e6:.2f}M fills/s)")
@@ -0,0 +1,73 @@
+"""Benchmark rolling cash-flow windows: prefix sums vs. a naive per-day scan.
+
+Usage
+-----
+python -m benchmarks.bench_rolling_windows [DAYS] [TX_PER_DAY]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from transactions.banking_balance import ROLLING_WINDOWS, _calculate_rolling
+
+MCCS = [5411, 5812, 5814, 5462, 5541, 5999]
+
+
+def synthetic_user(days: int, tx_per_day: int, seed: int = 0) -> pd.DataFrame:
+    """Build one user's sorted transactions with the columns `_calculate_rolling` reads."""
+    rng = np.random.default_rng(seed)
+    n = days * tx_per_day
+    booking = pd.Timestamp("2020-01-01") + pd.to_timedelta(np.sort(rng.integers(0, days, n)), unit="D")
+    credit = rng.random(n) < 0.2
+    amount = rng.gamma(2.0, 40.0, n).round(2)
+    mcc = np.where(credit, np.nan, rng.choice(MCCS, n)).astype(float)
+    return pd.DataFrame({
+        "bookingDate": booking,
+        "signed_amount": np.where(credit, amount, -amount),
+        "mcc": mcc,
+    })
+
+
+def naive_rolling(df_user: pd.DataFrame, windows=ROLLING_WINDOWS) -> dict:
+    """Reference implementation: re-sum every window for every day (O(days * n))."""
+    days = df_user["bookingDate"].dt.normalize()
+    signed = df_user["signed_amount"]
+    out = {}
+    for window in windows:
+        rolling_in, rolling_out = [], []
+        for day in pd.date_range(days.iloc[0], days.iloc[-1], freq="D"):
+            mask = (days > day - pd.Timedelta(days=window)) & (days <= day)
+            rolling_in.append(signed[mask & (signed > 0)].sum())
+            rolling_out.append(-signed[mask & (signed < 0)].sum())
+        out[str(window)] = (rolling_in[-1], rolling_out[-1], max(rolling_out))
+    return out
+
+
+def _time(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    tx_per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    df_user = synthetic_user(days, tx_per_day)
+
+    fast = _calculate_rolling(df_user)
+    slow = naive_rolling(df_user)
+    for window, (rolling_in, rolling_out, peak) in slow.items():
+        assert np.isclose(fast["fenster"][window]["einnahmen"], rolling_in, atol=0.01)
+        assert np.isclose(fast["fenster"][window]["ausgaben"], rolling_out, atol=0.01)
+        assert np.isclose(fast["fenster"][window]["maximale_ausgaben"], peak, atol=0.01)
+
+    t_fast = _time(_calculate_rolling, df_user)
+    t_slow = _time(naive_rolling, df_user, repeat=1)
+    print(f"{len(df_user)} transactions over {days} days")
+    print(f"prefix sums: {t_fast * 1000:8.2f} ms")
+    print(f"naive scan:  {t_slow * 1000:8.2f} ms  ({t_slow / t_fast:.0f}x slower)")
@@ -0,0 +1,174 @@
+"""Seeded synthetic datasets with the schemas of the two sample CSVs.
+
+    python -m benchmarks.generators banking 1M /tmp/banking_1M.csv [--users N] [--skew S] [--seed K]
+
+`banking_frame` matches *transactions/banking_sample_data.csv* and
+`trading_frame` matches *tr_wrapped/trading_sample_data.csv*, column for
+column, so the generated files can be passed wherever a CSV path is
+expected. Rows are spread over users with Zipf weights ``1 / rank**skew``:
+``skew=0`` gives every user the same expected number of rows, larger
+values concentrate activity on a few heavy users like the samples do.
+The same (rows, users, skew, seed) always produces the same file.
+"""
+import argparse
+import os
+import uuid
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SKEW = 0.7
+DEFAULT_ROWS_PER_USER = 25
+START = pd.Timestamp("2024-01-01")
+DAYS = 365
+
+BANKING_CREDIT_TYPES = (["PAYIN", "EARNINGS", "INTEREST"], [0.45, 0.32, 0.23])
+BANKING_DEBIT_TYPES = (
+    ["TRADING", "CARD", "PAYOUT", "OTHER", "CARD_ORDER"], [0.52, 0.43, 0.035, 0.009, 0.006]
+)
+MCCS = ([5411, 5812, 5999, 5541, 5462, 5814, 4111, 5912], [0.4, 0.13, 0.09, 0.07, 0.07, 0.1, 0.08, 0.06])
+
+TRADING_TYPES = (
+    ["REGULAR", "SAVINGSPLAN", "SPARECHANGE", "SAVEBACK", "BONUS"], [0.49, 0.45, 0.033, 0.018, 0.009]
+)
+COUNTRIES = (["US", "DE", "IE", "FR", "NL", "GB", "CA", "JP", "CN", "CH"],
+             [0.45, 0.15, 0.12, 0.06, 0.05, 0.05, 0.04, 0.03, 0.03, 0.02])
+
+DATE_FORMATS = {"banking": "%Y-%m-%d", "trading": "%Y-%m-%d %H:%M:%S.000"}
+
+
+def parse_size(value: str) -> int:
+    """Parse row counts such as ``10k``, ``1M`` or ``250000``."""
+    value = value.strip().lower()
+    factor = {"k": 10**3, "m": 10**6}.get(value[-1:], 1)
+    return int(float(value[:-1] if factor > 1 else value) * factor)
+
+
+def format_size(rows: int) -> str:
+    for suffix, factor in (("M", 10**6), ("k", 10**3)):
+        if rows >= factor and rows % factor == 0:
+            return f"{rows // factor}{suffix}"
+    return str(rows)
+
+
+def _zipf_weights(n: int, skew: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def _user_ids(users: int, rng: np.random.Generator) -> np.ndarray:
+    """Random version-4 style UUID strings like the ones in the samples."""
+    raw = rng.integers(0, 256, (users, 16), dtype=np.uint8)
+    return np.array([str(uuid.UUID(bytes=row.tobytes(), version=4)) for row in raw], dtype=object)
+
+
+def _rows_per_user(rows: int, users: int, skew: float, rng: np.random.Generator) -> np.ndarray:
+    """User index for every row, grouped by user, heavy users first."""
+    counts = rng.multinomial(rows, _zipf_weights(users, skew))
+    return np.repeat(np.arange(users), counts)
+
+
+def _choice(options, rng: np.random.Generator, size: int) -> np.ndarray:
+    values, weights = options
+    return np.asarray(values)[rng.choice(len(values), size, p=np.asarray(weights) / sum(weights))]
+
+
+def banking_frame(rows: int, users: Optional[int] = None, skew: float = DEFAULT_SKEW, seed: int = 0) -> pd.DataFrame:
+    """Banking transactions: userId, bookingDate, side, amount, currency, type, mcc."""
+    rng = np.random.default_rng(seed)
+    users = users or max(1, rows // DEFAULT_ROWS_PER_USER)
+    user_idx = _rows_per_user(rows, users, skew, rng)
+    day = rng.integers(0, DAYS, rows)
+    order = np.lexsort((day, user_idx))
+    user_idx, day = user_idx[order], day[order]
+
+    credit = rng.random(rows) < 0.34
+    tx_type = np.where(
+        credit, _choice(BANKING_CREDIT_TYPES, rng, rows), _choice(BANKING_DEBIT_TYPES, rng, rows)
+    )
+    # Median around 30 EUR with a long tail of large transfers, like the sample
+    amount = np.maximum(rng.lognormal(3.4, 1.6, rows), 0.01).round(2)
+    mcc = np.where(tx_type == "CARD", _choice(MCCS, rng, rows), 0)
+
+    return pd.DataFrame({
+        "userId": _user_ids(users, rng)[user_idx],
+        "bookingDate": START + pd.to_timedelta(day, unit="D"),
+        "side": np.where(credit, "CREDIT", "DEBIT"),
+        "amount": amount,
+        "currency": "EUR",
+        "type": tx_type,
+        "mcc": pd.array(np.where(mcc > 0, mcc, None), dtype="Int64"),
+    })
+
+
+def trading_frame(rows: int, users: Optional[int] = None, skew: float = DEFAULT_SKEW, seed: int = 0,
+                  isins: Optional[int] = None) -> pd.DataFrame:
+    """Trade executions: userId, executedAt, ISIN, direction, executionSize,
+    executionPrice, currency, executionFee, type."""
+    rng = np.random.default_rng(seed)
+    users = users or max(1, rows // DEFAULT_ROWS_PER_USER)
+    isins = isins or int(np.clip(rows // 200, 50, 5000))
+    user_idx = _rows_per_user(rows, users, skew, rng)
+    seconds = rng.integers(0, DAYS * 86_400, rows)
+    order = np.lexsort((seconds, user_idx))
+    user_idx, seconds = user_idx[order], seconds[order]
+
+    # A universe of instruments with a few popular ones and a base price each
+    universe = np.char.add(
+        _choice(COUNTRIES, rng, isins).astype(str),
+        np.char.zfill(rng.integers(0, 10**10, isins).astype(str), 10),
+    )
+    base_price = rng.lognormal(3.5, 1.2, isins)
+    isin_idx = rng.choice(isins, rows, p=_zipf_weights(isins, 1.0))
+
+    tx_type = _choice(TRADING_TYPES, rng, rows)
+    return pd.DataFrame({
+        "userId": _user_ids(users, rng)[user_idx],
+        "executedAt": START + pd.to_timedelta(seconds, unit="s"),
+        "ISIN": universe[isin_idx],
+        "direction": np.where(rng.random(rows) < 0.16, "SELL", "BUY"),
+        "executionSize": rng.lognormal(1.0, 1.3, rows).round(6),
+        "executionPrice": (base_price[isin_idx] * rng.normal(1.0, 0.05, rows)).clip(0.01).round(4),
+        "currency": "EUR",
+        "executionFee": np.where(tx_type == "REGULAR", 1.0, 0.0),
+        "type": tx_type,
+    })
+
+
+GENERATORS = {"banking": banking_frame, "trading": trading_frame}
+
+
+def write_csv(kind: str, df: pd.DataFrame, path: str) -> str:
+    """Write *df* in the sample CSV format of *kind* ("banking" or "trading")."""
+    df.to_csv(path, index=False, date_format=DATE_FORMATS[kind])
+    return path
+
+
+def dataset_csv(kind: str, rows: int, data_dir: str, users: Optional[int] = None,
+                skew: float = DEFAULT_SKEW, seed: int = 0) -> str:
+    """Path of a generated CSV in *data_dir*; generated only if it does not exist yet."""
+    name = f"{kind}_{format_size(rows)}_u{users or 'auto'}_s{skew:g}_seed{seed}.csv"
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        write_csv(kind, GENERATORS[kind](rows, users=users, skew=skew, seed=seed), tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic banking or trading CSV.")
+    parser.add_argument("kind", choices=sorted(GENERATORS))
+    parser.add_argument("rows", type=parse_size, help="e.g. 10k, 1M, 10M")
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=None,
+                        help=f"default: one user per {DEFAULT_ROWS_PER_USER} rows")
+    parser.add_argument("--skew", type=float, default=DEFAULT_SKEW)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = GENERATORS[args.kind](args.rows, users=args.users, skew=args.skew, seed=args.seed)
+    write_csv(args.kind, df, args.path)
+    print(f"{len(df)} rows, {df['userId'].nunique()} users -> {args.path}")
@@ -0,0 +1,77 @@
+"""Import-time budget for the API entry point.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter and
+fails (exit code 1) if importing ``main`` takes longer than the budget or
+pulls in one of the heavy modules that must only be loaded on first use.
+
+    python -m benchmarks.import_budget [--budget-ms 600] [--runs 5]
+
+The fastest of several runs is compared against the budget to keep noise
+from the machine out of the result.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = 600.0
+DEFAULT_RUNS = 5
+
+# Loaded lazily by the endpoints (or by WARMUP=eager), never by `import main`
+LAZY_MODULES = ("pandas", "numpy", "yfinance", "openai", "requests", "dotenv")
+
+
+def measure() -> Tuple[float, Dict[str, float]]:
+    """Import ``main`` once and return its cumulative import time in ms plus all top-level packages."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    packages: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            micros = int(cumulative)
+        except ValueError:  # header line
+            continue
+        top_level = name.strip().split(".")[0]
+        packages[top_level] = max(packages.get(top_level, 0.0), micros / 1000)
+    return packages.get("main", 0.0), packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    total_ms, packages = min(runs, key=lambda run: run[0])
+
+    print(f"import main: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<24} {ms:8.1f} ms")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import main took {total_ms:.0f} ms, budget is {args.budget_ms:.0f} ms")
+    eager = [name for name in LAZY_MODULES if name in packages]
+    if eager:
+        failures.append(f"imported at startup but should be lazy: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Per-worker memory and boot time of gunicorn with and without dataset preloading.
+
+Usage
+-----
+python -m benchmarks.preload_memory [--rows 500k] [--workers 4]
+                                    [--requests 200] [--output preload.json]
+
+Generates a banking and a trading CSV with `benchmarks.generators`, then
+starts ``gunicorn main:app -c gunicorn.conf.py`` twice on them, once with
+PRELOAD_DATASETS=0 (every worker loads both datasets itself, WARMUP
+loads them right after boot) and once with PRELOAD_DATASETS=1 (loaded in
+the master before fork). For each run it reports:
+
+* boot time until every worker serves with both datasets loaded,
+* RSS, PSS and USS per worker and summed over master and workers, read
+  from /proc/<pid>/smaps_rollup, right after boot and again after
+  --requests /transaction-insights and /trading-wrapped/cache requests.
+
+RSS counts shared pages in every process that maps them, so the saving
+of preloading shows in PSS (shared pages split between processes) and
+USS (pages private to one process). Linux only.
+
+Dependencies: gunicorn, uvicorn
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Dict, List
+
+from benchmarks.generators import dataset_csv, format_size, parse_size
+from benchmarks.run import DEFAULT_DATA_DIR
+from results_store import BACKEND_DIR
+
+READY_TIMEOUT = 300.0
+# Log lines written once per load of each dataset
+LOAD_MARKERS = ("Transaktionen geladen", "Loaded ")
+STARTED_MARKER = "Application startup complete"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _memory(pid: int) -> Dict[str, float]:
+    """RSS, PSS and USS of *pid* in MB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    uss = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(values.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(values.get("Pss", 0) / 1024, 1),
+        "uss_mb": round(uss / 1024, 1),
+    }
+
+
+def _children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def _snapshot(master: int) -> dict:
+    workers = [_memory(pid) for pid in _children(master)]
+    everything = [_memory(master), *workers]
+    return {
+        "workers": workers,
+        "worker_rss_mb": round(sum(w["rss_mb"] for w in workers) / len(workers), 1),
+        "worker_pss_mb": round(sum(w["pss_mb"] for w in workers) / len(workers), 1),
+        "worker_uss_mb": round(sum(w["uss_mb"] for w in workers) / len(workers), 1),
+        "total_pss_mb": round(sum(m["pss_mb"] for m in everything), 1),
+    }
+
+
+class _LogWatcher:
+    """Collects the server's stderr and counts the lines the readiness check looks for."""
+
+    def __init__(self, stream):
+        self.lines: List[str] = []
+        self._thread = threading.Thread(target=self._read, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def _read(self, stream):
+        for line in stream:
+            self.lines.append(line.rstrip())
+
+    def count(self, marker: str) -> int:
+        return sum(marker in line for line in list(self.lines))
+
+
+def _user_ids(csv_path: str, count: int, seed: int) -> List[str]:
+    import pandas as pd
+
+    users = pd.read_csv(csv_path, usecols=["userId"])["userId"].unique()
+    return list(random.Random(seed).sample(list(users), min(count, len(users))))
+
+
+def measure(preload: bool, workers: int, banking_csv: str, trading_csv: str, requests: int,
+            seed: int = 0) -> dict:
+    """Boot gunicorn once and return its boot time and memory before and after traffic."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PRELOAD_DATASETS": "1" if preload else "0",
+        "WARMUP": "background",
+        "WEB_CONCURRENCY": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+        "BANKING_CSV": banking_csv,
+        "TRADING_CSV": trading_csv,
+        "LOG_LEVEL": "INFO",
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv("PYTHONPATH")])),
+    }
+    loads_expected = 1 if preload else workers
+    with tempfile.TemporaryDirectory(prefix="preload-") as workdir:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "main:app", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py")],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        log = _LogWatcher(process.stderr)
+        try:
+            while not (
+                log.count(STARTED_MARKER) >= workers
+                and all(log.count(marker) >= loads_expected for marker in LOAD_MARKERS)
+            ):
+                if process.poll() is not None:
+                    sys.exit("gunicorn exited during boot:\n" + "\n".join(log.lines[-20:]))
+                if time.perf_counter() - started > READY_TIMEOUT:
+                    sys.exit(f"gunicorn not ready within {READY_TIMEOUT:.0f}s")
+                time.sleep(0.05)
+            boot_s = time.perf_counter() - started
+            after_boot = _snapshot(process.pid)
+
+            base_url = f"http://127.0.0.1:{port}"
+            for i, user_id in enumerate(_user_ids(banking_csv, requests, seed)):
+                path = f"/transaction-insights?user_id={user_id}&points=100" if i % 2 == 0 else "/trading-wrapped/cache"
+                with urllib.request.urlopen(base_url + path, timeout=60) as response:
+                    response.read()
+            after_requests = _snapshot(process.pid)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+
+    return {"boot_s": round(boot_s, 2), "after_boot": after_boot, "after_requests": after_requests}
+
+
+def print_report(results: Dict[str, dict]):
+    print(f"{'mode':<12} {'boot s':>7} {'phase':<15} {'RSS/worker':>11} {'PSS/worker':>11} "
+          f"{'USS/worker':>11} {'PSS total':>10}")
+    for mode, result in results.items():
+        for phase in ("after_boot", "after_requests"):
+            m = result[phase]
+            print(f"{mode:<12} {result['boot_s']:>7.2f} {phase:<15} {m['worker_rss_mb']:>9.1f}MB "
+                  f"{m['worker_pss_mb']:>9.1f}MB {m['worker_uss_mb']:>9.1f}MB {m['total_pss_mb']:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare gunicorn workers with and without dataset preloading.")
+    parser.add_argument("--rows", default="500k", help="rows per dataset, e.g. 100k or 2M")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="requests between the two snapshots")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where generated CSVs are kept")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    rows = parse_size(args.rows)
+    banking_csv = dataset_csv("banking", rows, args.data_dir, seed=args.seed)
+    trading_csv = dataset_csv("trading", rows, args.data_dir, seed=args.seed)
+    print(f"{format_size(rows)} rows per dataset, {args.workers} workers")
+
+    results = {
+        mode: measure(preload, args.workers, banking_csv, trading_csv, args.requests, args.seed)
+        for mode, preload in (("per-worker", False), ("preload", True))
+    }
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": rows, "workers": args.workers, "requests": args.requests, "results": results},
+                      f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,253 @@
+"""Timing and memory benchmarks for the analytics modules on synthetic data.
+
+Usage
+-----
+python -m benchmarks.run [--sizes 10k,100k,1M] [--only banking|trading]
+                         [--users N] [--skew S] [--seed K] [--repeat 3]
+                         [--output results.json] [--compare baseline.json]
+
+For every dataset size the generators in `benchmarks.generators` write a
+banking and a trading CSV (cached in --data-dir, so reruns skip the
+generation) and these functions are measured:
+
+* banking: `_load`, `_calculate_statistics` and `get_balance_over_time`
+  for a fixed sample of users on the loaded dataset,
+* trading: a cold `_aggregate` (load, aggregates, distributions, P&L)
+  and `get_trading_wrapped_points` for a sample of users.
+
+Company name lookups are stubbed, nothing leaves the machine. Each
+benchmark is timed --repeat times (best and median are kept) and run once
+more under tracemalloc for its peak allocation. Results are written as
+JSON keyed by "<dataset>/<function>/<size>"; with --compare the run is
+checked against an earlier file and exits with 1 if any benchmark got
+slower or bigger by more than --threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generators import DEFAULT_SKEW, dataset_csv, format_size, parse_size
+
+RESULTS_VERSION = 1
+DEFAULT_SIZES = "10k,100k,1M"
+DEFAULT_REPEAT = 3
+DEFAULT_SAMPLE_USERS = 100
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "backend-benchmark-data")
+
+
+class Benchmark:
+    """One measured function: *setup* runs untimed before every call of *run*."""
+
+    def __init__(self, name: str, run: Callable[[], Any], setup: Optional[Callable[[], Any]] = None,
+                 calls: int = 1):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+        self.calls = calls
+
+
+def _sample_users(user_ids, count: int, seed: int) -> List[str]:
+    """A fixed random sample of users, always including the heaviest one."""
+    user_ids = list(user_ids)
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(user_ids), min(count, len(user_ids)), replace=False)
+    return list(dict.fromkeys([user_ids[0], *(user_ids[i] for i in picked)]))[:count]
+
+
+def banking_benchmarks(csv_path: str, sample: int, seed: int) -> List[Benchmark]:
+    from transactions.banking_balance import _calculate_statistics, _dataset, _load, get_balance_over_time
+
+    dataset = _dataset(csv_path)
+    by_size = dataset.df["userId"].value_counts()
+    users = _sample_users(by_size.index, sample, seed)
+    frames = [dataset.user_frame(user_id, csv_path) for user_id in users]
+
+    return [
+        Benchmark("_load", lambda: _load(csv_path)),
+        Benchmark("_calculate_statistics", lambda: [_calculate_statistics(f) for f in frames], calls=len(frames)),
+        Benchmark(
+            "get_balance_over_time",
+            lambda: [get_balance_over_time(u, csv_path) for u in users],
+            calls=len(users),
+        ),
+    ]
+
+
+def trading_benchmarks(csv_path: str, sample: int, seed: int) -> List[Benchmark]:
+    from tr_wrapped import trading_wrapped
+
+    # Stub only the remote lookup so the batching and caching around it is still measured
+    trading_wrapped.get_company_name_from_isin = lambda isin: f"Company {isin}"
+
+    def reset_cache():
+        trading_wrapped._aggregate_cache = trading_wrapped._AggregateCache()
+
+    def warm():
+        with contextlib.redirect_stdout(io.StringIO()):
+            trading_wrapped.warm_cache(csv_path)
+
+    warm()
+    agg_df, _ = trading_wrapped._aggregate(csv_path)
+    users = _sample_users(agg_df["total_trades"].sort_values(ascending=False).index, sample, seed)
+
+    return [
+        Benchmark("_aggregate", lambda: trading_wrapped._aggregate(csv_path), setup=reset_cache),
+        Benchmark(
+            "get_trading_wrapped_points",
+            lambda: [trading_wrapped.get_trading_wrapped_points(u, csv_path) for u in users],
+            setup=warm,
+            calls=len(users),
+        ),
+    ]
+
+
+SUITES = {"banking": banking_benchmarks, "trading": trading_benchmarks}
+
+
+def measure(benchmark: Benchmark, repeat: int) -> Dict[str, Any]:
+    """Best and median wall time over *repeat* runs plus the peak traced allocation of one run."""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            benchmark.setup()
+            started = time.perf_counter()
+            benchmark.run()
+            timings.append(time.perf_counter() - started)
+
+        # Separate run for memory, tracemalloc slows down Python-level allocations
+        benchmark.setup()
+        tracemalloc.start()
+        try:
+            benchmark.run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "calls": benchmark.calls,
+        "best_s": round(min(timings), 6),
+        "median_s": round(statistics.median(timings), 6),
+        "per_call_ms": round(min(timings) / benchmark.calls * 1000, 4),
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: List[int], suites: List[str], users: Optional[int] = None, skew: float = DEFAULT_SKEW,
+        seed: int = 0, repeat: int = DEFAULT_REPEAT, sample: int = DEFAULT_SAMPLE_USERS,
+        data_dir: str = DEFAULT_DATA_DIR) -> Dict[str, Any]:
+    """Run all benchmarks and return them in the results file format."""
+    results: Dict[str, Any] = {}
+    for rows in sizes:
+        for suite in suites:
+            started = time.perf_counter()
+            csv_path = dataset_csv(suite, rows, data_dir, users=users, skew=skew, seed=seed)
+            print(f"{suite} {format_size(rows)}: {csv_path} ({time.perf_counter() - started:.1f}s)")
+            for benchmark in SUITES[suite](csv_path, sample, seed):
+                key = f"{suite}/{benchmark.name}/{format_size(rows)}"
+                results[key] = {"rows": rows, **measure(benchmark, repeat)}
+                r = results[key]
+                print(f"  {benchmark.name:<28} {r['best_s'] * 1000:10.1f} ms  "
+                      f"{r['per_call_ms']:9.2f} ms/call  {r['peak_mb']:9.1f} MB peak")
+
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "users": users,
+            "skew": skew,
+            "seed": seed,
+            "repeat": repeat,
+            "sample_users": sample,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the change per benchmark and return the ones beyond *threshold*."""
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('git') or 'baseline'} "
+          f"from {baseline['meta'].get('created_at')}:")
+    for key, new in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        time_ratio = new["best_s"] / old["best_s"] if old["best_s"] else 1.0
+        mem_ratio = new["peak_mb"] / old["peak_mb"] if old["peak_mb"] else 1.0
+        flags = []
+        if time_ratio > 1 + threshold:
+            flags.append("SLOWER")
+        if mem_ratio > 1 + threshold:
+            flags.append("MORE MEMORY")
+        print(f"  {key:<48} time {time_ratio:6.2f}x  memory {mem_ratio:6.2f}x  {' '.join(flags)}")
+        if flags:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analytics modules on synthetic data.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated row counts, e.g. 10k,1M,10M")
+    parser.add_argument("--only", choices=sorted(SUITES), help="run only one dataset")
+    parser.add_argument("--users", type=int, default=None, help="users per dataset (default: rows / 25)")
+    parser.add_argument("--skew", type=float, default=DEFAULT_SKEW, help="Zipf exponent of rows per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--sample-users", type=int, default=DEFAULT_SAMPLE_USERS,
+                        help="users per per-user benchmark")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where generated CSVs are kept")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--compare", default=None, help="results JSON of an earlier run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative slowdown / memory growth before failing")
+    args = parser.parse_args()
+
+    current = run(
+        [parse_size(size) for size in args.sizes.split(",")],
+        [args.only] if args.only else sorted(SUITES),
+        users=args.users,
+        skew=args.skew,
+        seed=args.seed,
+        repeat=args.repeat,
+        sample=args.sample_users,
+        data_dir=args.data_dir,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(current, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
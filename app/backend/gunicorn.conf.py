@@ -0,0 +1,25 @@
+"""gunicorn settings for running the API with several worker processes.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Run from the backend directory. With PRELOAD_DATASETS=1 (default) the
+app is imported and the banking and trading datasets are loaded once in
+the master, then the workers are forked and share them copy-on-write
+instead of each loading its own copy. PRELOAD_DATASETS=0 restores the
+per-worker loading. uvicorn's own ``--workers`` spawns fresh
+interpreters and cannot share memory this way.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_DATASETS", "1").lower() in ("1", "true", "yes")
+
+
+def when_ready(server):
+    # Runs in the master after the app was imported and before the first fork
+    if preload_app:
+        from main import preload_datasets
+
+        preload_datasets()
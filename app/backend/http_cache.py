@@ -0,0 +1,82 @@
+"""Conditional requests: ETag, Last-Modified and Cache-Control.
+
+An endpoint derives its validator from the version of the data behind
+the response (the news_cache date, the story row versions, a dataset
+fingerprint) before computing anything. `not_modified()` checks it
+against If-None-Match, or If-Modified-Since when no If-None-Match is
+sent, and returns a ready 304 response; otherwise `set_cache_headers()`
+puts the same headers on the full response.
+
+ETags are weak: two responses for the same data version are equivalent
+but not necessarily byte-identical, e.g. a stored result and a freshly
+computed one.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+# Derived from the data version and revalidated on every use
+REVALIDATE = "no-cache"
+
+
+def etag(*parts) -> str:
+    """Weak ETag over the parts that identify one version of a response."""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:24]}"'
+
+
+def file_last_modified(path: str) -> datetime:
+    return datetime.fromtimestamp(os.stat(path).st_mtime, timezone.utc)
+
+
+def _http_date(value: datetime) -> str:
+    # Naive datetimes in the stores are local time
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _headers(tag: str, last_modified: Optional[datetime], cache_control: str) -> Dict[str, str]:
+    headers = {"ETag": tag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def _etag_matches(header: str, tag: str) -> bool:
+    """Weak comparison of *tag* with the list in an If-None-Match header."""
+    if header.strip() == "*":
+        return True
+    opaque = tag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def _unmodified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+
+
+def not_modified(request: Request, tag: str, last_modified: Optional[datetime] = None,
+                 cache_control: str = REVALIDATE) -> Optional[Response]:
+    """A 304 response if the client's copy is current, otherwise None."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, tag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = bool(if_modified_since and last_modified and _unmodified_since(if_modified_since, last_modified))
+    if not fresh:
+        return None
+    return Response(status_code=304, headers=_headers(tag, last_modified, cache_control))
+
+
+def set_cache_headers(response: Response, tag: str, last_modified: Optional[datetime] = None,
+                      cache_control: str = REVALIDATE):
+    response.headers.update(_headers(tag, last_modified, cache_control))
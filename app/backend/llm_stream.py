@@ -0,0 +1,133 @@
+"""Incremental parsing of streamed LLM completions.
+
+The Perplexity models answer with a JSON document, reasoning models
+prefix it with a ``<think>...</think>`` block. When the completion is
+streamed, `ThinkFilter` drops the reasoning as it arrives, even when a
+tag is split across chunks, and `JsonItemScanner` hands out each element
+of one array inside the document as soon as its closing brace arrives.
+Every character is scanned once, however the text is chunked.
+"""
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """Length of the longest suffix of *text* that could be the start of *tag*."""
+    for n in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+
+class ThinkFilter:
+    """Removes ``<think>...</think>`` blocks from text that arrives in chunks."""
+
+    def __init__(self):
+        self._held = ""
+        self._thinking = False
+
+    def feed(self, chunk: str) -> str:
+        """The visible part of *chunk*; a possible partial tag at its end is held back."""
+        text = self._held + chunk
+        self._held = ""
+        visible = []
+        while text:
+            tag = THINK_CLOSE if self._thinking else THINK_OPEN
+            found = text.find(tag)
+            if found < 0:
+                keep = _partial_tag(text, tag)
+                if not self._thinking:
+                    visible.append(text[:len(text) - keep])
+                self._held = text[len(text) - keep:] if keep else ""
+                break
+            if not self._thinking:
+                visible.append(text[:found])
+            text = text[found + len(tag):]
+            self._thinking = not self._thinking
+        return "".join(visible)
+
+    def close(self) -> str:
+        """Text held back at the end; nothing if the completion stopped while thinking."""
+        held, self._held = self._held, ""
+        return "" if self._thinking else held
+
+
+class JsonItemScanner:
+    """Yields the objects of the array at *path* of a JSON document fed in pieces.
+
+    ``JsonItemScanner(("stock", "movements"))`` returns every object of
+    ``{"stock": {"movements": [{...}, ...]}}`` from the `feed()` call in
+    which it is completed. Text before the document's opening brace,
+    such as a Markdown code fence, is skipped.
+    """
+
+    def __init__(self, path: Sequence[str]):
+        self.path = tuple(path)
+        self._text = ""
+        self._pos = 0
+        # Open containers: bracket and the key path leading to them
+        self._stack: List[Tuple[str, Tuple[str, ...]]] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._item_depth = 0
+        self._root: Optional[Tuple[int, int]] = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        self._text += chunk
+        text = self._text
+        items = []
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._expect_key:
+                        self._key = json.loads(text[self._string_start:i + 1])
+            elif not self._stack:
+                if c == "{" and self._root is None:
+                    self._root = (i, -1)
+                    self._stack.append(("{", ()))
+                    self._expect_key = True
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                bracket, path = self._stack[-1]
+                if bracket == "{":
+                    path = path + (self._key,)
+                elif path == self.path and c == "{" and self._item_start is None:
+                    self._item_start = i
+                    self._item_depth = len(self._stack)
+                self._stack.append((c, path))
+                self._expect_key = c == "{"
+            elif c in "}]":
+                self._stack.pop()
+                self._expect_key = False
+                if self._item_start is not None and len(self._stack) == self._item_depth:
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+                if not self._stack:
+                    self._root = (self._root[0], i + 1)
+            elif c == ":":
+                self._expect_key = False
+            elif c == ",":
+                self._expect_key = self._stack[-1][0] == "{"
+        self._pos = len(text)
+        return items
+
+    def document(self) -> Any:
+        """The complete document; ValueError if it has not been closed yet."""
+        if self._root is None or self._root[1] < 0:
+            raise ValueError("Incomplete JSON document in completion")
+        return json.loads(self._text[self._root[0]:self._root[1]])
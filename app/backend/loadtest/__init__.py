@@ -0,0 +1,5 @@
+"""
+End-to-end load tests for the API against local fake upstream providers.
+
+Run from app/backend: ``python -m loadtest.run --concurrency 32 --duration 30``.
+"""
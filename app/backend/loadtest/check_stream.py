@@ -0,0 +1,139 @@
+"""Check the streamed stock-movement analysis end to end.
+
+    python -m loadtest.check_stream [--latency-ms 2000]
+
+Three checks, each failing with an AssertionError:
+
+* `ThinkFilter` and `JsonItemScanner` return the same items and document
+  however a completion with a ``<think>`` block, a code fence and
+  braces, brackets and escaped quotes inside strings is split: at every
+  single position and in chunks of every size,
+* a streamed sonar-deep-research completion from the fake Perplexity,
+  which starts with its reasoning, parses to the same movers as the
+  plain JSON after it,
+* POST /stock-movement/stream of the app started against the fakes (as
+  in `loadtest.run`) sends one NDJSON line per movement while the
+  completion is still being written, then the full result.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Iterable, List, Sequence, Tuple
+
+import httpx
+
+from llm_stream import JsonItemScanner, ThinkFilter
+from loadtest.run import start_app
+from loadtest.upstreams import Profile, base_url_env, load_profiles
+
+SAMPLE_DOCUMENT = {
+    "created_at": "2024-06-03T10:00:00",
+    "timeframe": "last {month}",
+    "stock": {
+        "symbol": "NVDA",
+        "note": "a \"quoted\" } and ] inside a string, and a \\ backslash",
+        "movements": [
+            {"date": "2024-05-29", "percentChange": 3.2, "story": "Beat {estimates} [again]", "sources": ["a", "b"]},
+            {"date": "2024-05-22", "percentChange": -1.5, "story": "", "sources": []},
+            {"date": "2024-05-15", "percentChange": 0.0, "story": "Nested {\"x\": [1, 2]}", "sources": ["c"]},
+        ],
+        "summary": {"movements": [{"not": "this array"}]},
+    },
+}
+
+
+def _parse(chunks: Iterable[str], path: Sequence[str]) -> Tuple[List[Any], Any]:
+    """Items and document of a completion fed through ThinkFilter and JsonItemScanner chunk by chunk."""
+    think = ThinkFilter()
+    scanner = JsonItemScanner(path)
+    items = []
+    for chunk in chunks:
+        items.extend(scanner.feed(think.feed(chunk)))
+    items.extend(scanner.feed(think.close()))
+    return items, scanner.document()
+
+
+def check_parsers():
+    text = (
+        "<think>Reasoning mentions {braces}, [brackets] and \"quotes\"; also < and </ and <thin.</think>\n"
+        "```json\n" + json.dumps(SAMPLE_DOCUMENT, indent=1) + "\n```"
+    )
+    expected = SAMPLE_DOCUMENT["stock"]["movements"]
+    path = ("stock", "movements")
+    splits = [[text[:i], text[i:]] for i in range(len(text) + 1)]
+    splits += [[text[i:i + size] for i in range(0, len(text), size)] for size in range(1, len(text) + 1)]
+    for chunks in splits:
+        items, document = _parse(chunks, path)
+        assert items == expected, f"wrong items for chunks {[len(c) for c in chunks][:5]}...: {items}"
+        assert document == SAMPLE_DOCUMENT, "wrong document"
+    print(f"parsers: {len(splits)} ways of splitting a {len(text)}-character completion agree")
+
+
+def check_fake_reasoning_stream():
+    from query_perplexity import _client
+
+    stream = _client().chat.completions.create(
+        model="sonar-deep-research", messages=[{"role": "user", "content": "Top movers"}], stream=True
+    )
+    raw = "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+    assert raw.startswith("<think>"), "the fake reasoning model should start with its reasoning"
+    chunks = [raw[i:i + 24] for i in range(0, len(raw), 24)]
+    items, document = _parse(chunks, ("movers",))
+    expected = json.loads(raw.split("</think>", 1)[1])
+    assert document == expected and items == expected["movers"], "reasoning stream parsed differently"
+    print(f"fake reasoning stream: {len(items)} movers parsed from {len(chunks)} chunks")
+
+
+def check_endpoint(base_url: str, latency: float):
+    body = {"ticker": "NVDA", "timeframe": "last month"}
+    arrivals: List[Tuple[float, dict]] = []
+    started = time.perf_counter()
+    with httpx.stream("POST", f"{base_url}/stock-movement/stream", json=body, timeout=60.0) as response:
+        assert response.status_code == 200, f"status {response.status_code}"
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        for line in response.iter_lines():
+            if line:
+                arrivals.append((time.perf_counter() - started, json.loads(line)))
+
+    movements = [(at, event["movement"]) for at, event in arrivals if "movement" in event]
+    assert "result" in arrivals[-1][1], f"last line is not the result: {arrivals[-1][1]}"
+    result_at, result = arrivals[-1][0], arrivals[-1][1]["result"]
+    assert movements, "no movement lines"
+    assert [m for _, m in movements] == result["stock"]["movements"], "streamed movements differ from the result"
+    # The fake spreads the completion over the latency, so the first movement
+    # must arrive well before the last chunk of the document
+    first_at = movements[0][0]
+    assert result_at - first_at > latency * 0.2, (
+        f"movements were not streamed: first after {first_at:.2f}s, result after {result_at:.2f}s"
+    )
+    print(
+        f"endpoint: {len(movements)} movements at "
+        + ", ".join(f"{at:.2f}s" for at, _ in movements)
+        + f", result at {result_at:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the streamed stock-movement analysis.")
+    parser.add_argument("--latency-ms", type=float, default=2000.0, help="median latency of the fake Perplexity")
+    args = parser.parse_args()
+
+    check_parsers()
+
+    profiles = load_profiles()
+    profiles["perplexity"] = Profile(args.latency_ms, 0.01, 0.0)
+    with tempfile.TemporaryDirectory(prefix="check-stream-") as workdir:
+        base_url, process, upstreams = start_app(profiles, workdir)
+        try:
+            # The in-process client talks to the same fake server as the app
+            upstream_port = upstreams.server_address[1]
+            os.environ.update(base_url_env(upstream_port))
+            check_fake_reasoning_stream()
+            check_endpoint(base_url, args.latency_ms / 1000)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            upstreams.shutdown()
+    print("ok")
@@ -0,0 +1,252 @@
+"""Drive the API with a weighted endpoint mix and report latency percentiles.
+
+Usage
+-----
+python -m loadtest.run [--concurrency 32] [--duration 30] [--warmup 5]
+                       [--mix trading-wrapped=3,transaction-insights=3,...]
+                       [--profile perplexity=800,0.5,0.01 ...]
+                       [--url http://host:port] [--output report.json]
+
+Without --url the harness starts everything itself: the fake providers
+of `loadtest.upstreams` and the app from `loadtest.server` in a
+subprocess, working in a temporary directory so the local SQLite caches
+are not touched. With --url it only drives an already running server.
+
+A profile is ``median_ms,sigma,error_rate[,rate_limit]`` for one of
+perplexity, mistral, finnhub, logo and yfinance. The app's upstream
+limits (see upstream.py) are set to the fake quotas, so by default it
+does not throttle at all. Requests finished during the
+warm-up are not counted. The report lists requests, errors, throughput
+and p50/p95/p99 latency per endpoint.
+
+Dependencies: httpx
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from loadtest.upstreams import PROFILES_ENV, SYMBOLS, Profile, base_url_env, dump_profiles, load_profiles, serve
+from results_store import BACKEND_DIR, BANKING_CSV, TRADING_CSV
+
+DEFAULT_MIX = {
+    "getTopMovers": 1,
+    "getSubscriptionStories": 2,
+    "stock-data": 2,
+    "trading-wrapped": 3,
+    "transaction-insights": 3,
+    "stock-movement-stream": 1,
+}
+STOCK_PERIODS = ["1d", "1wk", "1mo", "1y"]
+READY_TIMEOUT = 60.0
+
+
+def _user_ids(csv_path: str) -> List[str]:
+    with open(csv_path, newline="") as f:
+        return list(dict.fromkeys(row["userId"] for row in csv.DictReader(f)))
+
+
+def request_factories(rng: random.Random) -> Dict[str, Callable[[], Tuple[str, str, Optional[dict]]]]:
+    """One factory per endpoint returning (method, path, json body) for a random request."""
+    banking_users = _user_ids(BANKING_CSV)
+    trading_users = _user_ids(TRADING_CSV)
+
+    def insights():
+        params = f"user_id={rng.choice(banking_users)}"
+        # Mostly the precomputed default view, sometimes a page or a downsampled curve
+        if rng.random() < 0.3:
+            params += rng.choice(["&limit=100", "&points=200", "&rolling=true"])
+        return "GET", f"/transaction-insights?{params}", None
+
+    return {
+        "getTopMovers": lambda: ("GET", "/getTopMovers", None),
+        "getSubscriptionStories": lambda: (
+            "POST", "/getSubscriptionStories", {"tickers": rng.sample(SYMBOLS, rng.randint(1, 3))}
+        ),
+        "stock-data": lambda: (
+            "GET", f"/stock-data?ticker={rng.choice(SYMBOLS)}&period={rng.choice(STOCK_PERIODS)}", None
+        ),
+        "trading-wrapped": lambda: ("GET", f"/trading-wrapped?user_id={rng.choice(trading_users)}", None),
+        "transaction-insights": insights,
+        # The latency covers the whole stream, up to the final result line
+        "stock-movement-stream": lambda: (
+            "POST", "/stock-movement/stream", {"ticker": rng.choice(SYMBOLS), "timeframe": "last month"}
+        ),
+    }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def drive(base_url: str, mix: Dict[str, float], concurrency: int, duration: float,
+                warmup: float, seed: int = 0) -> Dict[str, dict]:
+    """Keep *concurrency* requests in flight for warmup + duration seconds."""
+    rng = random.Random(seed)
+    factories = request_factories(rng)
+    endpoints = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in endpoints]
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, path, body = factories[endpoint]()
+            sent = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            finished = time.perf_counter()
+            if sent >= measure_from:
+                latencies[endpoint].append(finished - sent)
+                if failed:
+                    errors[endpoint] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+
+    report = {}
+    all_latencies = []
+    for endpoint in endpoints:
+        values = sorted(latencies[endpoint])
+        all_latencies.extend(values)
+        report[endpoint] = _summary(values, errors[endpoint], elapsed)
+    report["total"] = _summary(sorted(all_latencies), sum(errors.values()), elapsed)
+    return report
+
+
+def _summary(values: List[float], errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(values, 50) * 1000, 1),
+        "p95_ms": round(_percentile(values, 95) * 1000, 1),
+        "p99_ms": round(_percentile(values, 99) * 1000, 1),
+    }
+
+
+def print_report(report: Dict[str, dict]):
+    print(f"{'endpoint':<24} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in report.items():
+        print(f"{endpoint:<24} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>8.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen):
+    deadline = time.perf_counter() + READY_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"App exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(f"{base_url}/openapi.json", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"App did not become ready within {READY_TIMEOUT:.0f}s")
+
+
+def start_app(profiles: Dict[str, Profile], workdir: str, quiet: bool = True) -> Tuple[str, subprocess.Popen, object]:
+    """Start the fake providers and the app; returns (base_url, app process, upstream server)."""
+    upstream_port = _free_port()
+    upstreams = serve(upstream_port, profiles)
+    app_port = _free_port()
+    env = {
+        **os.environ,
+        **base_url_env(upstream_port),
+        PROFILES_ENV: dump_profiles(profiles),
+        # Limit the app to the fake quotas: none unless a profile sets one
+        "UPSTREAM_LIMITS": json.dumps({name: [p.rate_limit, max(1, int(p.rate_limit))] for name, p in profiles.items()}),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv("PYTHONPATH")])),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "loadtest.server", "--port", str(app_port)], cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL if quiet else None,
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    _wait_ready(base_url, process)
+    return base_url, process, upstreams
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    return dict(item.split("=", 1) for item in value.split(",") if item)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API against fake upstreams.")
+    parser.add_argument("--url", default=None, help="drive an already running server instead")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before")
+    parser.add_argument("--mix", default=None, help="endpoint=weight pairs, e.g. trading-wrapped=3,stock-data=1")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="provider=median_ms,sigma,error_rate[,rate_limit] (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the app's output")
+    args = parser.parse_args()
+
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {name: float(weight) for name, weight in _parse_pairs(args.mix).items()}
+        unknown = set(mix) - set(DEFAULT_MIX)
+        if unknown:
+            sys.exit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    profiles = load_profiles()
+    for item in args.profile:
+        name, values = item.split("=", 1)
+        profiles[name] = Profile(*(float(v) for v in values.split(",")))
+
+    process = upstreams = None
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        try:
+            base_url = args.url
+            if base_url is None:
+                base_url, process, upstreams = start_app(profiles, workdir, quiet=not args.verbose)
+            print(f"Driving {base_url} with {args.concurrency} concurrent clients "
+                  f"for {args.warmup:.0f}s warm-up + {args.duration:.0f}s")
+            report = asyncio.run(drive(base_url, mix, args.concurrency, args.duration, args.warmup, args.seed))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+            if upstreams is not None:
+                upstreams.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"mix": mix, "concurrency": args.concurrency, "duration": args.duration,
+                       "profiles": json.loads(dump_profiles(profiles)), "report": report}, f, indent=2)
+        print(f"Report written to {args.output}")
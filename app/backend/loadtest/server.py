@@ -0,0 +1,24 @@
+"""Run the API with yfinance replaced by `FakeTicker`.
+
+    python -m loadtest.server [--port 8000]
+
+Meant to be started by `loadtest.run` with the base URL variables from
+`loadtest.upstreams.base_url_env` set, so every provider call of the
+app goes to the local fakes.
+"""
+import argparse
+
+from loadtest.upstreams import install_fake_yfinance
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API against fake upstreams.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    install_fake_yfinance()
+
+    import uvicorn
+    from main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,389 @@
+"""Local stand-ins for the external providers the backend calls.
+
+    python -m loadtest.upstreams [--port 8765]
+
+One threaded HTTP server answers for all HTTP providers, each under its
+own path prefix:
+
+* ``/perplexity/chat/completions`` and ``/mistral/chat/completions``
+  speak the OpenAI chat completions format, with ``"stream": true``
+  as server-sent chunks spread over the sampled latency,
+* ``/finnhub/company-news`` returns company news articles,
+* ``/logo/search`` returns logo.dev search results.
+
+yfinance is not an HTTP API we can point elsewhere, so `FakeTicker`
+replaces ``yfinance.Ticker`` inside the app process instead
+(see `install_fake_yfinance`).
+
+Every provider has a `Profile`: a log-normal latency around a median, an
+error rate and optionally a quota in requests per second, above which
+the fake answers 429 with a Retry-After header like the real APIs.
+Profiles are read from the LOADTEST_PROFILES environment variable
+(JSON, ``{"perplexity": [median_ms, sigma, error_rate, rate_limit], ...}``)
+so the app process and the fake server agree on them.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+PROFILES_ENV = "LOADTEST_PROFILES"
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "TSLA", "AMZN", "META", "SAP", "ASML", "SIE", "ALV", "NFLX", "AMD"]
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Latency distribution, error rate and quota (requests per second, 0 for none) of one provider."""
+    median_ms: float
+    sigma: float = 0.5
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+
+    def latency(self) -> float:
+        """One latency sample in seconds, log-normal around the median."""
+        return self.median_ms / 1000 * math.exp(self.sigma * random.gauss(0.0, 1.0))
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+DEFAULT_PROFILES = {
+    "perplexity": Profile(800, 0.5, 0.01),
+    "mistral": Profile(300, 0.4, 0.01),
+    "finnhub": Profile(150, 0.3, 0.005),
+    "logo": Profile(80, 0.3, 0.005),
+    "yfinance": Profile(200, 0.4, 0.01),
+}
+
+
+def load_profiles(raw: Optional[str] = None) -> Dict[str, Profile]:
+    """Default profiles overridden by LOADTEST_PROFILES (or *raw*)."""
+    profiles = dict(DEFAULT_PROFILES)
+    raw = raw if raw is not None else os.getenv(PROFILES_ENV)
+    for name, values in json.loads(raw or "{}").items():
+        profiles[name] = Profile(*values)
+    return profiles
+
+
+def dump_profiles(profiles: Dict[str, Profile]) -> str:
+    return json.dumps({
+        name: [p.median_ms, p.sigma, p.error_rate, p.rate_limit] for name, p in profiles.items()
+    })
+
+
+def _chat_completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-fake-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 200, "completion_tokens": len(content) // 4,
+                  "total_tokens": 200 + len(content) // 4},
+    }
+
+
+def _movers() -> dict:
+    """Answer of the `get_news` prompt: three gains and three losses."""
+    symbols = random.sample(SYMBOLS, 6)
+    return {
+        "created_at": datetime.now().isoformat(),
+        "timeframe": "last 7 days",
+        "movers": [
+            {
+                "rank": rank,
+                "isin": f"US{random.randrange(10**10):010d}",
+                "symbol": symbol,
+                "name": f"{symbol} Corp.",
+                "percentChange": round(random.uniform(3, 25), 2) * (1 if rank <= 3 else -1),
+                "direction": "up" if rank <= 3 else "down",
+                "story": f"{symbol} moved after its quarterly earnings and updated guidance.",
+                "sources": [f"https://www.reuters.com/markets/{symbol.lower()}-{rank}"],
+            }
+            for rank, symbol in enumerate(symbols, start=1)
+        ],
+    }
+
+
+def _stock_movement(prompt: str) -> dict:
+    """Answer of the `get_stock_movement` prompt for the ticker named in it."""
+    match = re.search(r"for (\S+) during (.+?)\.", prompt)
+    symbol, timeframe = match.groups() if match else ("AAPL", "the last month")
+    today = datetime.now().date()
+    return {
+        "created_at": datetime.now().isoformat(),
+        "timeframe": timeframe,
+        "stock": {
+            "symbol": symbol,
+            "movements": [
+                {
+                    "date": (today - timedelta(days=3 * i)).isoformat(),
+                    "percentChange": round(random.uniform(-8, 8), 2),
+                    "direction": random.choice(["up", "down"]),
+                    "story": f"{symbol} reacted to analyst revisions.",
+                    "sources": [f"https://www.bloomberg.com/news/{symbol.lower()}-{i}"],
+                }
+                for i in range(4)
+            ],
+        },
+    }
+
+
+def _completion_chunk(completion_id: str, model: str, delta: dict, finish_reason: Optional[str] = None) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _chat_content(provider: str, body: dict) -> str:
+    if provider == "mistral":
+        return "Fake Holdings Inc."
+    prompt = body["messages"][-1]["content"]
+    if body.get("model") == "sonar-deep-research":
+        # The real model prefixes its answer with its reasoning
+        return "<think>Looking at this week's movers.</think>\n" + json.dumps(_movers())
+    return json.dumps(_stock_movement(prompt))
+
+
+def _company_news(symbol: str) -> list:
+    now = datetime.now()
+    return [
+        {
+            "category": "company",
+            "datetime": int((now - timedelta(hours=5 * i)).timestamp()),
+            "headline": f"{symbol} {verb} as analysts raise forecast",
+            "id": random.getrandbits(31),
+            "image": "",
+            "related": symbol,
+            "source": source,
+            "summary": f"Shares of {symbol} {verb} after the latest earnings report.",
+            "url": f"https://finnhub.io/api/news?id={random.getrandbits(40):x}",
+        }
+        for i, (verb, source) in enumerate(
+            [("surge", "Reuters"), ("drop", "Bloomberg"), ("beats", "CNBC"), ("plunge", "Yahoo"),
+             ("record", "MarketWatch")]
+        )
+    ]
+
+
+class _Quota:
+    """Token bucket of one provider's fake quota, one second of burst."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = max(1.0, rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    profiles: Dict[str, Profile] = DEFAULT_PROFILES
+    quotas: Dict[str, _Quota] = {}
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, model: str, content: str, latency: float, chunk_chars: int = 24):
+        """Send *content* as chat completion chunks; the first after a fifth of *latency*, the rest evenly."""
+        completion_id = f"chatcmpl-fake-{random.getrandbits(32):08x}"
+        pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(latency * 0.2)
+        chunks = [_completion_chunk(completion_id, model, {"role": "assistant", "content": ""})]
+        chunks += [_completion_chunk(completion_id, model, {"content": piece}) for piece in pieces]
+        chunks.append(_completion_chunk(completion_id, model, {}, "stop"))
+        for i, chunk in enumerate(chunks):
+            if i > 1:
+                time.sleep(latency * 0.8 / len(chunks))
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _simulate(self, provider: str, sleep: bool = True) -> bool:
+        """Sleep for the provider's latency (unless *sleep* is off); answer with a 429 over quota or a 500 if it fails."""
+        profile = self.profiles.get(provider)
+        if profile is None:
+            self._send(404, {"error": f"unknown provider {provider}"})
+            return False
+        quota = self.quotas.get(provider)
+        if quota is not None and not quota.take():
+            self._send(429, {"error": {"message": f"{provider} rate limit exceeded", "type": "rate_limit_error"}},
+                       {"Retry-After": "1"})
+            return False
+        if sleep:
+            time.sleep(profile.latency())
+        if profile.fails():
+            self._send(500, {"error": {"message": f"simulated {provider} failure", "type": "server_error"}})
+            return False
+        return True
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        provider, _, route = url.path.strip("/").partition("/")
+        if route != "chat/completions" or provider not in ("perplexity", "mistral"):
+            return self._send(404, {"error": f"no route {url.path}"})
+        model = body.get("model", provider)
+        if body.get("stream"):
+            # The latency is spread over the chunks instead of spent up front
+            if self._simulate(provider, sleep=False):
+                self._stream(model, _chat_content(provider, body), self.profiles[provider].latency())
+        elif self._simulate(provider):
+            self._send(200, _chat_completion(model, _chat_content(provider, body)))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/finnhub/company-news":
+            if self._simulate("finnhub"):
+                self._send(200, _company_news(query.get("symbol", "AAPL")))
+        elif url.path == "/logo/search":
+            if self._simulate("logo"):
+                name = query.get("q", "example")
+                self._send(200, [{"name": name, "domain": f"{name.lower()}.example"}])
+        elif url.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": f"no route {url.path}"})
+
+
+def serve(port: int, profiles: Optional[Dict[str, Profile]] = None, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Start the fake providers in a background thread and return the server."""
+    profiles = profiles or load_profiles()
+    quotas = {name: _Quota(p.rate_limit) for name, p in profiles.items() if p.rate_limit > 0}
+    handler = type("Handler", (_Handler,), {"profiles": profiles, "quotas": quotas})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url_env(port: int, host: str = "127.0.0.1") -> Dict[str, str]:
+    """Environment variables that point the backend at a fake server on *port*."""
+    root = f"http://{host}:{port}"
+    return {
+        "PERPLEXITY_BASE_URL": f"{root}/perplexity",
+        "MISTRAL_BASE_URL": f"{root}/mistral",
+        "FINNHUB_BASE_URL": f"{root}/finnhub",
+        "LOGO_BASE_URL": f"{root}/logo",
+        "PERPLEXITY_API_KEY": "fake",
+        "MISTRAL_API_KEY": "fake",
+        "FINNHUB_API_KEY": "fake",
+        "LOGO_API_KEY": "fake",
+    }
+
+
+class FakeTicker:
+    """Drop-in for the parts of ``yfinance.Ticker`` the backend uses."""
+
+    PERIOD_ROWS = {"1d": 78, "2d": 2, "1wk": 390, "1mo": 154, "1y": 252, "max": 480}
+    INTERVALS = {"5m": "5min", "1h": "1h", "1d": "1D", "1mo": "MS"}
+
+    def __init__(self, ticker: str, profile: Optional[Profile] = None):
+        self.ticker = ticker
+        self._profile = profile or load_profiles()["yfinance"]
+
+    def _call(self):
+        time.sleep(self._profile.latency())
+        if self._profile.fails():
+            raise RuntimeError(f"simulated yfinance failure for {self.ticker}")
+
+    def history(self, period: str = "1mo", interval: str = "1d"):
+        import numpy as np
+        import pandas as pd
+
+        self._call()
+        rows = self.PERIOD_ROWS.get(period, 30)
+        index = pd.date_range(end=pd.Timestamp.now().floor("min"), periods=rows,
+                              freq=self.INTERVALS.get(interval, "1D"))
+        rng = np.random.default_rng(abs(hash(self.ticker)) % 2**32)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+        return pd.DataFrame({
+            "Open": close * (1 + rng.normal(0, 0.002, rows)),
+            "High": close * (1 + np.abs(rng.normal(0, 0.004, rows))),
+            "Low": close * (1 - np.abs(rng.normal(0, 0.004, rows))),
+            "Close": close,
+            "Volume": rng.integers(10_000, 1_000_000, rows),
+        }, index=index)
+
+    @property
+    def info(self) -> dict:
+        self._call()
+        return {
+            "longName": f"{self.ticker} Holdings Inc.",
+            "symbol": self.ticker,
+            "currency": "USD",
+            "exchange": "NMS",
+            "marketCap": 10**11,
+            "currentPrice": 101.5,
+            "previousClose": 100.0,
+            "fiftyTwoWeekHigh": 130.0,
+            "fiftyTwoWeekLow": 80.0,
+        }
+
+
+def install_fake_yfinance(profiles: Optional[Dict[str, Profile]] = None):
+    """Replace ``yfinance.Ticker`` in this process; the backend imports yfinance lazily."""
+    import yfinance
+
+    profile = (profiles or load_profiles())["yfinance"]
+    yfinance.Ticker = lambda ticker, *args, **kwargs: FakeTicker(ticker, profile)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake upstream providers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = serve(args.port, host=args.host)
+    print(f"Fake upstreams on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,20 +1,110 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from query_perplexity import get_news, get_stock_movement, get_company_logo, get_stock_news
+from query_perplexity import get_news, get_stock_movement, get_stock_news, stream_stock_movement
 from news_cache import NewsCache
-import yfinance as yf
+from results_store import (
+    ResultsStore, dataset_fingerprint, BANKING_CSV, TRADING_CSV, TRADING_WRAPPED, TRANSACTION_INSIGHTS
+)
+from metrics import CONTENT_TYPE, MetricsMiddleware, render as render_metrics, upstream_call
+import profiling
+from http_cache import etag, file_last_modified, not_modified, set_cache_headers, REVALIDATE
+from story_stream import StoryHub, format_event
+from contextlib import aclosing, asynccontextmanager
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import date
+import asyncio
+import gc
 import json
+import logging
 import os
+import threading
+import time
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+logger = logging.getLogger(__name__)
 
+# pandas, yfinance and the openai SDK are imported on first use, not here.
+# WARMUP controls what happens at startup: "background" (default) loads the
+# datasets in a daemon thread, "eager" loads all heavy modules, clients,
+# databases and datasets before serving, "off" does nothing. With several
+# workers under gunicorn (see gunicorn.conf.py) the datasets are instead
+# loaded once in the master by `preload_datasets` and shared after fork.
+WARMUP = os.getenv("WARMUP", "background").lower()
 
-app = FastAPI()
+# Cache-Control per endpoint. Top movers are one shared snapshot per day, the
+# per-user views only change with their dataset and are always revalidated.
+# Subscription stories carry live prices, so their ETag also changes every
+# STOCK_QUOTE_TTL seconds.
+TOP_MOVERS_CACHE_CONTROL = "public, max-age=300"
+PER_USER_CACHE_CONTROL = f"private, {REVALIDATE}"
+STOCK_QUOTE_TTL = 60
+STORIES_CACHE_CONTROL = f"private, max-age={STOCK_QUOTE_TTL}"
 
-# Initialize news cache
+# Initialize news cache (the SQLite file is opened on first access)
 news_cache = NewsCache()
 
+# One polling loop per process pushes story, price and top-mover updates to all stream clients
+story_hub = StoryHub(news_cache)
+STREAM_RETRY_MS = 5000
+
+# Initialize store for precomputed per-user insights
+results_store = ResultsStore()
+
+
+def warm_datasets():
+    """Load the banking and trading datasets and build their indexes and aggregates."""
+    from transactions.banking_balance import warm_cache as warm_banking
+    from tr_wrapped.trading_wrapped import warm_cache as warm_trading
+
+    warm_banking(BANKING_CSV)
+    warm_trading(TRADING_CSV)
+
+
+def preload_datasets():
+    """Load the datasets in the master process right before the workers are forked.
+
+    Workers inherit the loaded tables copy-on-write. `gc.freeze()` moves
+    everything allocated so far out of the collector's reach, otherwise
+    the first collection in every worker would write to (and copy) the
+    pages of all inherited objects.
+    """
+    started = time.perf_counter()
+    warm_datasets()
+    gc.freeze()
+    logger.info(
+        "Datasets preloaded in %.2fs, %d objects frozen", time.perf_counter() - started, gc.get_freeze_count()
+    )
+
+
+def warm_up():
+    """Pay every first-request cost up front: imports, API clients, databases, datasets."""
+    import yfinance  # noqa: F401
+    from query_perplexity import _client, _mistral_client
+
+    _client()
+    _mistral_client()
+    news_cache._connect().close()
+    results_store._connect().close()
+    warm_datasets()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP == "eager":
+        warm_up()
+    elif WARMUP == "background":
+        # pandas is imported inside the thread, so startup itself stays fast
+        threading.Thread(target=warm_datasets, daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
 # Disable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +113,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Request profiling is opt-in (PROFILING=1); when off nothing is installed
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
 
 
 class StockMovementRequest(BaseModel):
@@ -40,17 +136,22 @@ class SubscriptionStoryRequest(BaseModel):
 
 
 @app.get("/getTopMovers")
-async def root():
-    print("test")
-
+async def root(request: Request, response: Response):
     try:
-        cached_news = news_cache.get_cached_news()
-        if cached_news:
-            return cached_news
+        version = news_cache.get_news_version()
+        if version is not None:
+            cached = not_modified(request, etag("getTopMovers", *version), version[1], TOP_MOVERS_CACHE_CONTROL)
+            if cached is not None:
+                return cached
 
-        news_data = await get_news()
-        news_cache.store_news(news_data)
-        
+        news_data = news_cache.get_cached_news()
+        if not news_data:
+            news_data = await get_news()
+            news_cache.store_news(news_data)
+            version = news_cache.get_news_version()
+
+        if version is not None:
+            set_cache_headers(response, etag("getTopMovers", *version), version[1], TOP_MOVERS_CACHE_CONTROL)
         return news_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -67,11 +168,32 @@ async def query_stock_movement(request: StockMovementRequest):
         return json_response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+
+@app.post("/stock-movement/stream")
+async def stream_stock_movement_analysis(request: StockMovementRequest):
+    """NDJSON: a {"movement"} line per movement as soon as it is parsed, then {"result"} or {"error"}."""
+    try:
+        events = await asyncio.to_thread(stream_stock_movement, request.ticker, request.timeframe)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def lines():
+        # Runs in the threadpool; the status is already sent, so failures become a last line
+        try:
+            for event in events:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.warning("Stock movement stream for %s failed: %s", request.ticker, e)
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
 
 
 @app.get("/stock-data")
 async def get_stock_data(ticker: str, period: str = "d"):
+    import yfinance as yf
+
     try:
         # Map period to appropriate interval
         interval_map = {
@@ -93,8 +215,8 @@ async def get_stock_data(ticker: str, period: str = "d"):
         
         # Get stock data
         stock = yf.Ticker(ticker)
-        print(stock)
-        hist = stock.history(period=period, interval=interval)
+        with upstream_call("yfinance"):
+            hist = stock.history(period=period, interval=interval)
         
         # Convert the data to a more API-friendly format
         data = []
@@ -109,7 +231,8 @@ async def get_stock_data(ticker: str, period: str = "d"):
             })
         
         # Get additional stock info
-        info = stock.info
+        with upstream_call("yfinance"):
+            info = stock.info
         stock_info = {
             "name": info.get("longName", ""),
             "symbol": info.get("symbol", ""),
@@ -130,68 +253,218 @@ async def get_stock_data(ticker: str, period: str = "d"):
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/trading-wrapped/cache")
+async def get_trading_wrapped_cache():
+    from tr_wrapped.trading_wrapped import cache_info
+
+    return cache_info()
+
+
 @app.get("/trading-wrapped")
-async def get_trading_wrapped(user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c"):
+async def get_trading_wrapped(
+    request: Request, response: Response, user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c"
+):
     try:
-        from tr_wrapped.trading_wrapped import get_trading_wrapped_points
-        
-        # Get the absolute path to the CSV file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(current_dir, "tr_wrapped", "trading_sample_data.csv")
+        csv_path = TRADING_CSV
         
-        wrapped_points = get_trading_wrapped_points(user_id, csv_path)
-        return {"points": wrapped_points}
+        fingerprint = dataset_fingerprint(csv_path)
+        tag, modified = etag(TRADING_WRAPPED, fingerprint, user_id), file_last_modified(csv_path)
+        cached = not_modified(request, tag, modified, PER_USER_CACHE_CONTROL)
+        if cached is not None:
+            return cached
+
+        from tr_wrapped.trading_wrapped import wrapped_points
+
+        points = results_store.get(TRADING_WRAPPED, user_id, fingerprint)
+        if points is None:
+            # Name lookups may wait in the Mistral scheduler; keep them off the event loop
+            result = await asyncio.to_thread(wrapped_points, user_id, csv_path)
+            points = result.points
+            if result.version != fingerprint or result.unresolved:
+                # Computed from the previous dataset while the new one is built, or showing
+                # raw ISINs for names not resolved in time: neither store nor tag it, so the
+                # next request computes it again
+                response.headers["Cache-Control"] = "no-store"
+                return {"points": points}
+            results_store.put(TRADING_WRAPPED, user_id, fingerprint, points)
+        set_cache_headers(response, tag, modified, PER_USER_CACHE_CONTROL)
+        return {"points": points}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.get("/portfolio-value")
+async def get_portfolio_value(user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c"):
+    try:
+        from tr_wrapped.portfolio import get_portfolio_value as portfolio_value
+
+        csv_path = TRADING_CSV
+
+        return portfolio_value(user_id, csv_path)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _stories_etag(tickers: list[str]) -> Optional[str]:
+    """ETag over the story versions of *tickers* and the current quote window, None if stories are missing."""
+    versions = news_cache.get_subscription_story_versions(tickers)
+    if len(versions) < len(set(tickers)):
+        return None
+    return etag("getSubscriptionStories", sorted(versions.items()), int(time.time() // STOCK_QUOTE_TTL))
+
+
+def _fetch_stories(ticker: str):
+    """Holt die Stories eines Tickers bei Finnhub und speichert sie; None, wenn keine gefunden wurden."""
+    ticker_stories = get_stock_news(ticker)
+    if not ticker_stories:
+        return None
+    news_cache.store_subscription_stories(ticker_stories)
+    return news_cache.get_subscription_stories_by_ticker(ticker)
+
+
 @app.post("/getSubscriptionStories")
-async def get_subscription_stories(request: SubscriptionStoryRequest):
+async def get_subscription_stories(request: SubscriptionStoryRequest, http_request: Request, response: Response):
+    """Read-only despite POST, so If-None-Match is answered with 304 as for a GET."""
     try:
+        # Stories aller Ticker schon vorhanden: Version prüfen, bevor Kurse geholt werden
+        tag = _stories_etag(request.tickers)
+        if tag is not None:
+            cached = not_modified(http_request, tag, cache_control=STORIES_CACHE_CONTROL)
+            if cached is not None:
+                return cached
+
         # Hole existierende Stories
         stories = news_cache.get_subscription_stories_by_tickers(request.tickers)
         
         # Finde Ticker, für die keine Stories vorhanden sind
         missing_tickers = [ticker for ticker in request.tickers if ticker not in stories]
         
-        # Hole und speichere neue Stories für fehlende Ticker
-        for ticker in missing_tickers:
-            try:
-                ticker_stories = get_stock_news(ticker)
-                if ticker_stories:  # Nur wenn Stories gefunden wurden
-                    for story in ticker_stories:
-                        news_cache.store_subscription_story(story)
-                    stories[ticker] = news_cache.get_subscription_stories_by_ticker(ticker)
-            except Exception as e:
-                print(f"Fehler beim Abrufen der News für {ticker}: {str(e)}")
-                continue
+        # Hole und speichere neue Stories für fehlende Ticker, in Threads: die Finnhub-Anfragen
+        # können im Upstream-Scheduler auf ihr Rate Limit warten
+        fetched = await asyncio.gather(
+            *(asyncio.to_thread(_fetch_stories, ticker) for ticker in missing_tickers), return_exceptions=True
+        )
+        for ticker, ticker_stories in zip(missing_tickers, fetched):
+            if isinstance(ticker_stories, Exception):
+                logger.warning("Fehler beim Abrufen der News für %s: %s", ticker, ticker_stories)
+            elif ticker_stories is not None:
+                stories[ticker] = ticker_stories
         
-        print("stories", stories)
+        logger.debug("stories=%s", stories)
         # Transformiere die Stories in das gewünschte Format
         transformed_stories = news_cache.transform_stories_with_stock_data(stories)
-        print("transformed_stories", transformed_stories)
+        logger.debug("transformed_stories=%s", transformed_stories)
         
+        tag = tag or _stories_etag(request.tickers)
+        if tag is not None:
+            set_cache_headers(response, tag, cache_control=STORIES_CACHE_CONTROL)
         return {"stock_news": transformed_stories}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.get("/stories/search")
+async def search_stories(
+    q: str = Query(..., min_length=1),
+    tickers: list[str] = Query([]),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Full-text search over the stored subscription stories, best match first across all tickers."""
+    try:
+        results = news_cache.search_subscription_stories(q, tickers or None, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"query": q, "results": results}
+
+
+@app.get("/stream/stories")
+async def stream_stories(tickers: list[str] = Query([]), movers: bool = False):
+    """Server-sent events for *tickers* and optionally the top movers, see story_stream."""
+    if not tickers and not movers:
+        raise HTTPException(status_code=400, detail="Subscribe to at least one ticker or to movers")
+
+    async def events():
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        async with aclosing(story_hub.subscribe(tickers, movers)) as updates:
+            async for event in updates:
+                yield format_event(event)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/transaction-insights")
-async def get_transaction_insights(user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c"):
+async def get_transaction_insights(
+    request: Request,
+    response: Response,
+    user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c",
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    points: Optional[int] = Query(None, ge=2, le=5000),
+    rolling: bool = False,
+):
+    if points is not None and points % 2:
+        # First and last point plus a min and a max per bucket: only even counts are reachable
+        raise HTTPException(status_code=422, detail="points must be an even number")
     try:
-        from transactions.banking_balance import get_balance_over_time
+        csv_path = BANKING_CSV
         
-        # Get the absolute path to the CSV file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(current_dir, "transactions", "banking_sample_data.csv")
-        
-        insights = get_balance_over_time(user_id, csv_path)
+        fingerprint = dataset_fingerprint(csv_path)
+        tag = etag(TRANSACTION_INSIGHTS, fingerprint, user_id, start, end, cursor, limit, points, rolling)
+        modified = file_last_modified(csv_path)
+        cached = not_modified(request, tag, modified, PER_USER_CACHE_CONTROL)
+        if cached is not None:
+            return cached
+        set_cache_headers(response, tag, modified, PER_USER_CACHE_CONTROL)
+
+        from transactions.banking_balance import get_balance_over_time
+
+        # Only the full default view is precomputed; windows and pages are cheap to derive live
+        if start is None and end is None and cursor is None and limit is None and points is None and not rolling:
+            insights = results_store.get(TRANSACTION_INSIGHTS, user_id, fingerprint)
+            if insights is None:
+                insights = get_balance_over_time(user_id, csv_path)
+                results_store.put(TRANSACTION_INSIGHTS, user_id, fingerprint, insights)
+            return insights
+
+        insights = get_balance_over_time(
+            user_id, csv_path, start=start, end=end, cursor=cursor, limit=limit, points=points,
+            rolling=rolling
+        )
         return insights
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    
+
+@app.get("/transaction-insights/stream")
+async def stream_transaction_insights(
+    user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c",
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+):
+    try:
+        from transactions.banking_balance import stream_balance_over_time
+
+        csv_path = BANKING_CSV
+
+        chunks = stream_balance_over_time(user_id, csv_path, start=start, end=end)
+        return StreamingResponse(chunks, media_type="application/x-ndjson")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
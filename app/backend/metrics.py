@@ -0,0 +1,211 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms live in one module-level registry and are
+rendered by `render()` for the /metrics endpoint. There is deliberately
+no client library: the few metric types needed here are a dict of
+floats behind a lock each.
+
+Instrumentation helpers:
+
+* `MetricsMiddleware` times every HTTP request per route template,
+* `upstream_call(provider)` counts and times calls to external providers,
+* `sqlite_timed(store)` times the methods of the SQLite-backed caches,
+* `cache_lookup(cache, result)` counts cache hits and misses.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SQLITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_format(value)}" for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> [count per bucket..., sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0.0] * (len(self.buckets) + 1)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, list(series)) for labels, series in self._values.items())
+        lines = self._header()
+        for labels, series in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {_format(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_format(cumulative)}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format."""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time spent serving HTTP requests.", ("method", "route", "status")
+)
+upstream_requests = Counter(
+    "upstream_requests_total", "Calls to external providers.", ("provider", "outcome")
+)
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to external providers.", ("provider",)
+)
+sqlite_query_duration = Histogram(
+    "sqlite_query_duration_seconds", "Time spent in SQLite per store operation.", ("store", "operation"),
+    buckets=SQLITE_BUCKETS,
+)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups by result (hit, miss, stale).", ("cache", "result")
+)
+
+
+@contextmanager
+def upstream_call(provider: str) -> Iterator[None]:
+    """Count and time one call to *provider*; an exception counts as an error."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        upstream_request_duration.observe(time.perf_counter() - started, provider)
+        upstream_requests.inc(provider, outcome)
+
+
+def sqlite_timed(store: str):
+    """Decorator timing a method of a SQLite-backed store under its own name."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with sqlite_query_duration.time(store, method.__name__):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_lookup(cache: str, result: str):
+    cache_requests.inc(cache, result)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the duration of every HTTP request.
+
+    Requests are labelled with the route template (``/trading-wrapped``,
+    not the full URL) so the number of series stays bounded; the duration
+    runs until the last body chunk, which includes streamed responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            )
@@ -1,9 +1,13 @@
+import re
 import sqlite3
 from datetime import date, datetime
 import json
+import logging
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-import yfinance as yf
+from typing import Optional, List, Dict, Any, Tuple
+from metrics import cache_lookup, sqlite_timed, upstream_call
+
+logger = logging.getLogger(__name__)
 
 class NewsStory(BaseModel):
     id: Optional[int] = None
@@ -15,10 +19,86 @@ class NewsStory(BaseModel):
     logo: Optional[str] = None
     created_at: Optional[datetime] = None
 
+def _story(row) -> NewsStory:
+    """Baut eine NewsStory aus einer Zeile (id, ticker, company_name, headline, content, source, logo, created_at)."""
+    return NewsStory(
+        id=row[0],
+        ticker=row[1],
+        companyName=row[2],
+        headline=row[3],
+        content=row[4],
+        source=row[5],
+        logo=row[6],
+        created_at=datetime.fromisoformat(row[7]) if row[7] else None
+    )
+
+
+# Eine Story pro (Ticker, Quell-URL): bekannte Stories werden nur aktualisiert, wenn sich etwas
+# geändert hat, und erhöhen dann ihre Revision
+UPSERT_STORY = """
+    INSERT INTO subscription_stories (ticker, company_name, headline, content, source, logo, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (ticker, source) DO UPDATE SET
+        company_name = excluded.company_name,
+        headline = excluded.headline,
+        content = excluded.content,
+        logo = excluded.logo,
+        created_at = excluded.created_at,
+        revision = revision + 1
+    WHERE company_name IS NOT excluded.company_name
+       OR headline IS NOT excluded.headline
+       OR content IS NOT excluded.content
+       OR logo IS NOT excluded.logo
+       OR created_at IS NOT excluded.created_at
+"""
+
+
+def _story_params(story: NewsStory) -> tuple:
+    # Konvertiere datetime zu ISO-Format für die Speicherung
+    created_at_iso = story.created_at.isoformat() if story.created_at else None
+    return (story.ticker, story.companyName, story.headline, story.content, story.source, story.logo, created_at_iso)
+
+
+def _match_query(query: str) -> str:
+    """FTS5-Abfrage aus freiem Text: jedes Wort als Präfix, alle Wörter müssen vorkommen."""
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def story_payload(story: NewsStory) -> Dict[str, Any]:
+    """Eine Story im Format der Antworten an den Client."""
+    return {
+        "headline": story.headline,
+        "content": story.content,
+        "source": story.source,
+        "created_at": story.created_at.isoformat() if story.created_at else None
+    }
+
+
+def stock_quote(ticker: str) -> Tuple[float, float]:
+    """Aktueller Kurs und Änderung zum Vortag in Prozent aus yfinance."""
+    import yfinance as yf
+
+    # Hole Aktiendaten für 2 Tage
+    with upstream_call("yfinance"):
+        hist = yf.Ticker(ticker).history(period="2d", interval="1d")  # Hole 2 Tage mit täglicher Auflösung
+
+    if hist.empty or len(hist) < 2:
+        logger.info("Nicht genügend Aktiendaten gefunden für %s", ticker)
+        # Verwende nur den aktuellen Preis wenn keine Änderung berechnet werden kann
+        return (float(hist['Close'].iloc[-1]) if not hist.empty else 0.0), 0.0
+
+    # Berechne die Änderung
+    current_price = hist['Close'].iloc[-1]
+    previous_price = hist['Close'].iloc[-2]
+    return float(current_price), float((current_price - previous_price) / previous_price * 100)
+
+
 class NewsCache:
     def __init__(self, db_path="news_cache.db"):
         self.db_path = db_path
-        self._init_db()
+        self._initialized = False
+        self._fts = False
 
     def _init_db(self):
         """Initialisiert die SQLite-Datenbank mit den benötigten Tabellen."""
@@ -42,28 +122,103 @@ class NewsCache:
                     content TEXT NOT NULL,
                     source TEXT NOT NULL,
                     logo TEXT,
-                    created_at TIMESTAMP
+                    created_at TIMESTAMP,
+                    revision INTEGER NOT NULL DEFAULT 0
                 )
             """)
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(subscription_stories)")}
+            if "revision" not in columns:
+                cursor.execute("ALTER TABLE subscription_stories ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+            # Eine Story pro (Ticker, Quell-URL); ältere Datenbanken enthalten Duplikate,
+            # von denen die zuerst gespeicherte Zeile bleibt
+            indexes = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            if "idx_subscription_stories_ticker_source" not in indexes:
+                cursor.execute("""
+                    DELETE FROM subscription_stories
+                    WHERE id NOT IN (SELECT MIN(id) FROM subscription_stories GROUP BY ticker, source)
+                """)
+                cursor.execute("""
+                    CREATE UNIQUE INDEX idx_subscription_stories_ticker_source
+                    ON subscription_stories (ticker, source)
+                """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_subscription_stories_ticker_created
+                ON subscription_stories (ticker, created_at)
+            """)
+            self._init_fts(cursor)
             conn.commit()
 
-    def store_subscription_story(self, story: NewsStory) -> int:
-        """Speichert eine News-Story in der subscription_stories Tabelle."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            # Konvertiere datetime zu ISO-Format für die Speicherung
-            created_at_iso = story.created_at.isoformat() if story.created_at else None
+    def _init_fts(self, cursor: sqlite3.Cursor):
+        """Legt den FTS5-Index über Überschrift und Inhalt an, per Trigger synchron zur Tabelle."""
+        try:
+            exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'subscription_stories_fts'"
+            ).fetchone()
             cursor.execute("""
-                INSERT INTO subscription_stories (ticker, company_name, headline, content, source, logo, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (story.ticker, story.companyName, story.headline, story.content, story.source, story.logo, created_at_iso))
+                CREATE VIRTUAL TABLE IF NOT EXISTS subscription_stories_fts USING fts5(
+                    headline, content,
+                    content='subscription_stories', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning("FTS5 nicht verfügbar, Suche fällt auf LIKE zurück: %s", e)
+            self._fts = False
+            return
+        self._fts = True
+        cursor.executescript("""
+            CREATE TRIGGER IF NOT EXISTS subscription_stories_ai AFTER INSERT ON subscription_stories BEGIN
+                INSERT INTO subscription_stories_fts (rowid, headline, content)
+                VALUES (new.id, new.headline, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS subscription_stories_ad AFTER DELETE ON subscription_stories BEGIN
+                INSERT INTO subscription_stories_fts (subscription_stories_fts, rowid, headline, content)
+                VALUES ('delete', old.id, old.headline, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS subscription_stories_au
+            AFTER UPDATE OF headline, content ON subscription_stories BEGIN
+                INSERT INTO subscription_stories_fts (subscription_stories_fts, rowid, headline, content)
+                VALUES ('delete', old.id, old.headline, old.content);
+                INSERT INTO subscription_stories_fts (rowid, headline, content)
+                VALUES (new.id, new.headline, new.content);
+            END;
+        """)
+        if not exists:
+            # Bestehende Stories einmalig indexieren
+            cursor.execute("INSERT INTO subscription_stories_fts (subscription_stories_fts) VALUES ('rebuild')")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Öffnet eine Verbindung; die Tabellen werden erst beim ersten Zugriff angelegt."""
+        if not self._initialized:
+            self._init_db()
+            self._initialized = True
+        return sqlite3.connect(self.db_path)
+
+    @sqlite_timed("news_cache")
+    def store_subscription_story(self, story: NewsStory) -> Optional[int]:
+        """Speichert eine News-Story; liefert ihre id oder None, wenn sie unverändert schon vorlag."""
+        with self._connect() as conn:
+            row = conn.execute(UPSERT_STORY + " RETURNING id", _story_params(story)).fetchone()
             conn.commit()
-            return cursor.lastrowid
+            return row[0] if row else None
 
+    @sqlite_timed("news_cache")
+    def store_subscription_stories(self, stories: List[NewsStory]) -> int:
+        """Speichert mehrere Stories in einer Transaktion; liefert die Zahl neuer oder geänderter Zeilen."""
+        if not stories:
+            return 0
+        with self._connect() as conn:
+            # rowcount summiert die Änderungen aller Ausführungen, ohne die der FTS-Trigger
+            changed = conn.executemany(UPSERT_STORY, [_story_params(story) for story in stories]).rowcount
+            conn.commit()
+        return changed
+
+    @sqlite_timed("news_cache")
     def get_subscription_stories_by_tickers(self, tickers: List[str], limit_per_ticker: int = 4) -> dict[str, List[NewsStory]]:
         """Holt die neuesten News-Stories für mehrere Ticker."""
         result = {}
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Lösche Einträge älter als 5 Tage
@@ -85,27 +240,17 @@ class NewsCache:
                 rows = cursor.fetchall()
                 
                 # Nur hinzufügen wenn Stories vorhanden sind
+                cache_lookup("subscription_stories", "hit" if rows else "miss")
                 if rows:
-                    result[ticker] = [
-                        NewsStory(
-                            id=row[0],
-                            ticker=row[1],
-                            companyName=row[2],
-                            headline=row[3],
-                            content=row[4],
-                            source=row[5],
-                            logo=row[6],
-                            created_at=datetime.fromisoformat(row[7]) if row[7] else None
-                        )
-                        for row in rows
-                    ]
+                    result[ticker] = [_story(row) for row in rows]
                     result[ticker].sort(key=lambda x: x.created_at, reverse=True)
         
         return result
 
+    @sqlite_timed("news_cache")
     def get_subscription_stories_by_ticker(self, ticker: str, limit: int = 4) -> List[NewsStory]:
         """Holt die neuesten News-Stories für einen einzelnen Ticker."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Lösche Einträge älter als 5 Tage
@@ -128,28 +273,114 @@ class NewsCache:
             if not rows:
                 return []
                 
-            stories = [
-                NewsStory(
-                    id=row[0],
-                    ticker=row[1],
-                    companyName=row[2],
-                    headline=row[3],
-                    content=row[4],
-                    source=row[5],
-                    logo=row[6],
-                    created_at=datetime.fromisoformat(row[7]) if row[7] else None
-                )
-                for row in rows
-            ]
+            stories = [_story(row) for row in rows]
             stories.sort(key=lambda x: x.created_at, reverse=True)
             
             return stories
 
+    @sqlite_timed("news_cache")
+    def get_subscription_story_versions(self, tickers: List[str]) -> Dict[str, Tuple[int, int, int]]:
+        """Versionsstand (Anzahl, höchste id, Summe der Revisionen) der noch gültigen Stories je Ticker.
+
+        Ticker ohne Stories fehlen im Ergebnis.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        placeholders = ",".join("?" * len(tickers))
+        with self._connect() as conn:
+            # Dieselbe 5-Tage-Grenze wie beim Lesen, sonst wechselt die Version erst nach dem Löschen
+            rows = conn.execute(f"""
+                SELECT ticker, COUNT(*), MAX(id), SUM(revision)
+                FROM subscription_stories
+                WHERE ticker IN ({placeholders})
+                  AND (created_at IS NULL OR created_at >= datetime('now', '-5 days'))
+                GROUP BY ticker
+            """, tickers).fetchall()
+        return {ticker: (count, max_id, revisions) for ticker, count, max_id, revisions in rows}
+
+    @sqlite_timed("news_cache")
+    def get_subscription_stories_since(self, ticker: str, after_id: int) -> List[NewsStory]:
+        """Stories eines Tickers mit einer id größer als *after_id*, älteste zuerst."""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT id, ticker, company_name, headline, content, source, logo, created_at
+                FROM subscription_stories
+                WHERE ticker = ? AND id > ?
+                ORDER BY id
+            """, (ticker, after_id)).fetchall()
+        return [_story(row) for row in rows]
+
+    @sqlite_timed("news_cache")
+    def search_subscription_stories(self, query: str, tickers: Optional[List[str]] = None,
+                                    limit: int = 20) -> List[Dict[str, Any]]:
+        """Volltextsuche über Überschrift und Inhalt der noch gültigen Stories, beste Treffer zuerst.
+
+        Mit *tickers* nur in diesen Tickern, sonst über alle. Jeder Treffer ist eine Story im
+        Client-Format mit ticker, companyName, score (größer ist besser) und snippet.
+        """
+        match = _match_query(query)
+        if not match:
+            return []
+        filters, params = "", []
+        if tickers:
+            tickers = list(dict.fromkeys(tickers))
+            filters = f"AND s.ticker IN ({','.join('?' * len(tickers))})"
+            params = tickers
+        with self._connect() as conn:
+            if self._fts:
+                # Treffer in der Überschrift zählen zehnmal so viel wie im Inhalt
+                rows = conn.execute(f"""
+                    SELECT s.id, s.ticker, s.company_name, s.headline, s.content, s.source, s.logo, s.created_at,
+                           -bm25(subscription_stories_fts, 10.0, 1.0),
+                           snippet(subscription_stories_fts, -1, '[', ']', '…', 16)
+                    FROM subscription_stories_fts
+                    JOIN subscription_stories s ON s.id = subscription_stories_fts.rowid
+                    WHERE subscription_stories_fts MATCH ?
+                      AND (s.created_at IS NULL OR s.created_at >= datetime('now', '-5 days'))
+                      {filters}
+                    ORDER BY bm25(subscription_stories_fts, 10.0, 1.0)
+                    LIMIT ?
+                """, [match, *params, limit]).fetchall()
+            else:
+                # Ohne FTS5: alle Wörter als Teilstring, neueste zuerst
+                terms = re.findall(r"\w+", query)
+                likes = " AND ".join("(s.headline || ' ' || s.content) LIKE ?" for _ in terms)
+                rows = conn.execute(f"""
+                    SELECT s.id, s.ticker, s.company_name, s.headline, s.content, s.source, s.logo, s.created_at,
+                           0.0, substr(s.content, 1, 160)
+                    FROM subscription_stories s
+                    WHERE {likes}
+                      AND (s.created_at IS NULL OR s.created_at >= datetime('now', '-5 days'))
+                      {filters}
+                    ORDER BY s.created_at DESC
+                    LIMIT ?
+                """, [*(f"%{term}%" for term in terms), *params, limit]).fetchall()
+        return [
+            {
+                "ticker": row[1],
+                "companyName": row[2],
+                **story_payload(_story(row)),
+                "score": round(row[8], 6),
+                "snippet": row[9],
+            }
+            for row in rows
+        ]
+
+    @sqlite_timed("news_cache")
+    def get_news_version(self) -> Optional[Tuple[str, Optional[datetime]]]:
+        """Datum und Speicherzeitpunkt der gecachten News für heute, ohne die Daten zu laden."""
+        today = date.today().isoformat()
+        with self._connect() as conn:
+            row = conn.execute("SELECT date, created_at FROM news_cache WHERE date = ?", (today,)).fetchone()
+        if row is None:
+            return None
+        return row[0], datetime.fromisoformat(row[1]) if row[1] else None
+
+    @sqlite_timed("news_cache")
     def get_cached_news(self):
         """Holt die gecachten News für den aktuellen Tag."""
         today = date.today().isoformat()
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Lösche alte Einträge
             cursor.execute("DELETE FROM news_cache WHERE date != ?", (today,))
@@ -159,63 +390,48 @@ class NewsCache:
             cursor.execute("SELECT data FROM news_cache WHERE date = ?", (today,))
             result = cursor.fetchone()
             
+            cache_lookup("news_cache", "hit" if result else "miss")
             if result:
                 return json.loads(result[0])
             return None
 
+    @sqlite_timed("news_cache")
     def store_news(self, news_data):
         """Speichert die News für den aktuellen Tag."""
         today = date.today().isoformat()
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Lösche alle alten Einträge
             cursor.execute("DELETE FROM news_cache")
             # Füge neuen Eintrag hinzu
             cursor.execute("""
-                INSERT INTO news_cache (date, data)
-                VALUES (?, ?)
-            """, (today, json.dumps(news_data)))
+                INSERT INTO news_cache (date, data, created_at)
+                VALUES (?, ?, ?)
+            """, (today, json.dumps(news_data), datetime.now().isoformat()))
             conn.commit()
 
     def transform_stories_with_stock_data(self, stories: Dict[str, List[NewsStory]]) -> Dict[str, Dict[str, Any]]:
         """Transformiert die Stories in das gewünschte Format mit zusätzlichen Aktiendaten."""
+        import yfinance as yf
+
         result = {}
         
         for ticker, ticker_stories in stories.items():
             try:
-                # Hole Aktiendaten für 2 Tage
                 stock = yf.Ticker(ticker)
-                hist = stock.history(period="2d", interval="1d")  # Hole 2 Tage mit täglicher Auflösung
-                
-                if hist.empty or len(hist) < 2:
-                    print(f"Nicht genügend Aktiendaten gefunden für {ticker}")
-                    # Verwende nur den aktuellen Preis wenn keine Änderung berechnet werden kann
-                    current_price = hist['Close'].iloc[-1] if not hist.empty else 0
-                    change = 0
-                else:
-                    # Berechne die Änderung
-                    current_price = hist['Close'].iloc[-1]
-                    previous_price = hist['Close'].iloc[-2]
-                    change = ((current_price - previous_price) / previous_price) * 100
+                current_price, change = stock_quote(ticker)
                 
                 # Hole Firmeninfo
-                info = stock.info
+                with upstream_call("yfinance"):
+                    info = stock.info
                 company_name = info.get('longName', ticker)
                 
                 # Sortiere Stories nach Datum (älteste zuerst)
                 sorted_stories = sorted(ticker_stories, key=lambda x: x.created_at if x.created_at else datetime.min)
                 
                 # Transformiere die Stories
-                transformed_stories = [
-                    {
-                        "headline": story.headline,
-                        "content": story.content,
-                        "source": story.source,
-                        "created_at": story.created_at.isoformat() if story.created_at else None
-                    }
-                    for story in sorted_stories
-                ]
+                transformed_stories = [story_payload(story) for story in sorted_stories]
                 
                 # Erstelle das finale Format
                 result[ticker] = {
@@ -227,7 +443,7 @@ class NewsCache:
                 }
                 
             except Exception as e:
-                print(f"Fehler beim Transformieren der Daten für {ticker}: {str(e)}")
+                logger.warning("Fehler beim Transformieren der Daten für %s: %s", ticker, e)
                 continue
         
         return result
\ No newline at end of file
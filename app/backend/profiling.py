@@ -0,0 +1,209 @@
+"""Opt-in statistical profiling of individual requests.
+
+Enable with PROFILING=1. Nothing is installed otherwise, so a disabled
+profiler costs nothing per request. When enabled, a request is profiled
+if it carries the ADMIN_TOKEN in the ``X-Debug-Profile`` header or is
+picked by PROFILE_SAMPLE_RATE (0..1, default 0); the header is ignored
+while ADMIN_TOKEN is not set.
+
+While a request is profiled a sampler thread records the stack of the
+thread serving it every PROFILE_INTERVAL_MS (default 5 ms) via
+``sys._current_frames()``. The endpoints are ``async def`` and run most
+of their pandas and SQLite work on the event loop thread, so that is
+the thread sampled; other requests interleaving on the loop during the
+same time show up in the profile too. Work handed to a thread with
+``asyncio.to_thread`` (upstream calls, /trading-wrapped points) shows
+up only as the wait for it.
+
+Profiles are stored as folded stacks (``frame;frame;frame count`` per
+line), which flamegraph.pl, speedscope and inferno read directly. The
+slowest PROFILE_KEEP (default 20) are kept in memory behind
+``GET /admin/profiles`` and ``GET /admin/profiles/{id}``; with
+PROFILE_DIR set every profile is also written to
+``PROFILE_DIR/<route>/<timestamp>-<ms>ms.folded``. The admin endpoints
+require ADMIN_TOKEN in the ``X-Admin-Token`` header and answer 403 while
+ADMIN_TOKEN is not set.
+"""
+import asyncio
+import heapq
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+PROFILE_HEADER = b"x-debug-profile"
+DEFAULT_INTERVAL_MS = 5.0
+DEFAULT_KEEP = 20
+
+
+def enabled() -> bool:
+    return os.getenv("PROFILING", "0").lower() in ("1", "true", "yes")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    """Samples the stack of one thread at a fixed interval into folded-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+
+class _Profiles:
+    """The slowest *keep* profiles, evicting the fastest one when full."""
+
+    def __init__(self, keep: int):
+        self.keep = keep
+        self._heap: list = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile: dict) -> int:
+        with self._lock:
+            profile["id"] = next(self._ids)
+            entry = (profile["duration_ms"], profile["id"], profile)
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+            return profile["id"]
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+        return [{key: value for key, value in p.items() if key != "folded"} for _, _, p in entries]
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        with self._lock:
+            return next((p for _, pid, p in self._heap if pid == profile_id), None)
+
+
+profiles = _Profiles(int(os.getenv("PROFILE_KEEP", DEFAULT_KEEP)))
+
+
+def _folded(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def _save(profile: dict, directory: str):
+    route = profile["route"].strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    path = os.path.join(directory, route)
+    os.makedirs(path, exist_ok=True)
+    name = f"{profile['started_at'].replace(':', '')}-{profile['duration_ms']:.0f}ms.folded"
+    with open(os.path.join(path, name), "w") as f:
+        f.write(profile["folded"])
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling sampled requests and requests with the debug header."""
+
+    def __init__(self, app):
+        self.app = app
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.interval = float(os.getenv("PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS)) / 1000
+        self.directory = os.getenv("PROFILE_DIR")
+
+    def _wanted(self, scope) -> bool:
+        # Sampling costs every profiled request; clients may only ask for it with the admin token
+        if any(name == PROFILE_HEADER and _valid_token(value) for name, value in scope.get("headers", [])):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = _Sampler(threading.get_ident(), self.interval)
+        started_at = datetime.now().isoformat(timespec="milliseconds")
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            # Joining the sampler and writing the file block; keep both off the event loop
+            await asyncio.to_thread(sampler.stop)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            profile = {
+                "route": route,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "started_at": started_at,
+                "duration_ms": duration_ms,
+                "samples": sum(sampler.counts.values()),
+                "folded": _folded(sampler.counts),
+            }
+            profiles.add(profile)
+            if self.directory:
+                await asyncio.to_thread(_save, profile, self.directory)
+
+
+def _valid_token(token) -> bool:
+    """Whether *token* (str or raw header bytes) is the ADMIN_TOKEN; never true while it is unset."""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected or token is None:
+        return False
+    if isinstance(token, str):
+        token = token.encode()
+    return hmac.compare_digest(token, expected.encode())
+
+
+def _check_token(token: Optional[str]):
+    if not os.getenv("ADMIN_TOKEN"):
+        # Profiles expose code paths and timings; without a token nobody gets them
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled, ADMIN_TOKEN is not set")
+    if not _valid_token(token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin/profiles")
+
+
+@router.get("")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)) -> Dict[str, list]:
+    _check_token(x_admin_token)
+    return {"profiles": profiles.list()}
+
+
+@router.get("/{profile_id}")
+async def get_profile(profile_id: int, x_admin_token: Optional[str] = Header(None)):
+    _check_token(x_admin_token)
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return PlainTextResponse(profile["folded"])
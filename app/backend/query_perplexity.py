@@ -1,47 +1,100 @@
-import requests
-from openai import OpenAI
 from fastapi import HTTPException
+import asyncio
 import os
-from dotenv import load_dotenv
 import json
+import logging
 from datetime import datetime, timedelta
-import pandas as pd
-from typing import Dict, List
+from functools import lru_cache
+from typing import Iterator, List
+from llm_stream import JsonItemScanner, ThinkFilter
 from news_cache import NewsStory
-# Load environment variables
-load_dotenv()
+from upstream import upstream
 
-# Initialize OpenAI client
-YOUR_API_KEY = os.getenv('PERPLEXITY_API_KEY')
-LOGO_API_KEY = os.getenv('LOGO_API_KEY')
-MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
-FINNHUB_API_KEY = os.getenv('FINNHUB_API_KEY')
-client = OpenAI(api_key=YOUR_API_KEY, base_url="https://api.perplexity.ai")
-mistral_client = OpenAI(api_key=MISTRAL_API_KEY, base_url="https://api.mistral.ai/v1")
+logger = logging.getLogger(__name__)
+
+# requests, openai und dotenv werden erst bei der ersten Anfrage importiert,
+# damit der Import von main.py (und damit der Serverstart) schnell bleibt.
+# Alle Anfragen laufen über den Scheduler des jeweiligen Anbieters (siehe upstream.py),
+# der auch 429-Antworten wiederholt; die eigenen Retries des openai-Clients sind deshalb aus.
+
+
+@lru_cache(maxsize=None)
+def _load_env():
+    """Lädt die .env-Datei einmalig beim ersten Zugriff auf einen API-Schlüssel."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _api_key(name: str):
+    _load_env()
+    return os.getenv(name)
+
+
+def _base_url(name: str, default: str) -> str:
+    """Basis-URL eines Anbieters, per Umgebungsvariable überschreibbar (z. B. für Lasttests)."""
+    _load_env()
+    return os.getenv(name, default).rstrip("/")
+
+
+@lru_cache(maxsize=None)
+def _client():
+    """Erzeugt den Perplexity-Client beim ersten Gebrauch."""
+    from openai import OpenAI
+    return OpenAI(
+        api_key=_api_key('PERPLEXITY_API_KEY'),
+        base_url=_base_url('PERPLEXITY_BASE_URL', "https://api.perplexity.ai"),
+        max_retries=0,
+    )
+
+
+@lru_cache(maxsize=None)
+def _mistral_client():
+    """Erzeugt den Mistral-Client beim ersten Gebrauch."""
+    from openai import OpenAI
+    return OpenAI(
+        api_key=_api_key('MISTRAL_API_KEY'),
+        base_url=_base_url('MISTRAL_BASE_URL', "https://api.mistral.ai/v1"),
+        max_retries=0,
+    )
+
+
+def _http_get(url: str, **kwargs):
+    """GET, das bei HTTP-Fehlern (auch 429) eine Exception wirft."""
+    import requests
+
+    response = requests.get(url, **kwargs)
+    response.raise_for_status()
+    return response
 
 
 def get_company_logo(company_name: str) -> str:
     company_name = company_name.split(" ")[0]
     """Fragt die Logo.dev API nach dem Logo anhand des Firmennamens."""
-    search_url = "https://api.logo.dev/search"
-    headers = {"Authorization": f"Bearer {LOGO_API_KEY}"}
+    search_url = f"{_base_url('LOGO_BASE_URL', 'https://api.logo.dev')}/search"
+    headers = {"Authorization": f"Bearer {_api_key('LOGO_API_KEY')}"}
     params = {"q": company_name}
 
     try:
-        response = requests.get(search_url, headers=headers, params=params)
-        response.raise_for_status()
+        response = upstream("logo").call(
+            ("search", company_name), _http_get, search_url, headers=headers, params=params
+        )
         results = response.json()
 
         if results and isinstance(results, list):
             domain = results[0].get("domain")
             if domain:
                 return f"https://img.logo.dev/{domain}?token=pk_Z7L8cnXPQ9-ezxAAjHAejA&size=128&format=png"
-        print(response.text)
+        logger.debug("Kein Logo gefunden für %s: %s", company_name, response.text)
     except Exception as e:
-        print(f"Fehler bei Logo.dev Anfrage: {e}")
+        logger.warning("Fehler bei Logo.dev Anfrage: %s", e)
 
     return ""
 
+
+def _company_logo_for_ticker(ticker: str) -> str:
+    return get_company_logo(get_company_name(ticker))
+
+
 async def get_news():
     messages = [
         {
@@ -71,80 +124,85 @@ async def get_news():
     ]
 
     try:
-        response = client.chat.completions.create(
-            model="sonar-deep-research",
-            messages=messages,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "created_at": {
-                                "type": "string", 
-                                "format": "date-time",
-                                "description": "The current date and time in ISO-8601 format"
-                            },
-                            "timeframe": {
-                                "type": "string",
-                                "description": "The time period for which the data is valid, e.g. 'last 7 days'"
-                            },
-                            "movers": {
-                                "type": "array",
-                                "description": "List of the most significant stock movements (3 gains and 3 losses)",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "rank": {
-                                            "type": "integer",
-                                            "description": "Position in the list, starting from 1 for the largest movement"
-                                        },
-                                        "isin": {
-                                            "type": "string",
-                                            "description": "The International Securities Identification Number of the stock"
-                                        },
-                                        "symbol": {
-                                            "type": "string",
-                                            "description": "The stock's ticker symbol"
-                                        },
-                                        "name": {
-                                            "type": "string",
-                                            "description": "The full company name"
-                                        },
-                                        "percentChange": {
-                                            "type": "number",
-                                            "description": "The percentage change in stock price (positive for up, negative for down)"
-                                        },
-                                        "direction": {
-                                            "type": "string",
-                                            "enum": ["up", "down"],
-                                            "description": "The direction of the price movement"
-                                        },
-                                        "story": {
-                                            "type": "string",
-                                            "maxLength": 300,
-                                            "description": "A brief explanation of the main catalyst for the price movement"
-                                        },
-                                        "sources": {
-                                            "type": "array",
-                                            "description": "List of actual URLs to news articles or financial reports that explain the price movement. Example: ['https://www.reuters.com/article/...', 'https://www.bloomberg.com/...']",
-                                            "items": {
+        # Blockierender Client: im Thread, damit die Event-Loop frei bleibt, solange die Anfrage wartet
+        response = await asyncio.to_thread(
+            upstream("perplexity").call,
+            ("top-movers", datetime.today().date().isoformat()),
+            lambda: _client().chat.completions.create(
+                model="sonar-deep-research",
+                messages=messages,
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "created_at": {
+                                    "type": "string", 
+                                    "format": "date-time",
+                                    "description": "The current date and time in ISO-8601 format"
+                                },
+                                "timeframe": {
+                                    "type": "string",
+                                    "description": "The time period for which the data is valid, e.g. 'last 7 days'"
+                                },
+                                "movers": {
+                                    "type": "array",
+                                    "description": "List of the most significant stock movements (3 gains and 3 losses)",
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "rank": {
+                                                "type": "integer",
+                                                "description": "Position in the list, starting from 1 for the largest movement"
+                                            },
+                                            "isin": {
+                                                "type": "string",
+                                                "description": "The International Securities Identification Number of the stock"
+                                            },
+                                            "symbol": {
                                                 "type": "string",
-                                                "description": "Complete URL to a news article or financial report"
+                                                "description": "The stock's ticker symbol"
+                                            },
+                                            "name": {
+                                                "type": "string",
+                                                "description": "The full company name"
+                                            },
+                                            "percentChange": {
+                                                "type": "number",
+                                                "description": "The percentage change in stock price (positive for up, negative for down)"
                                             },
-                                            "maxItems": 3
-                                        }
+                                            "direction": {
+                                                "type": "string",
+                                                "enum": ["up", "down"],
+                                                "description": "The direction of the price movement"
+                                            },
+                                            "story": {
+                                                "type": "string",
+                                                "maxLength": 300,
+                                                "description": "A brief explanation of the main catalyst for the price movement"
+                                            },
+                                            "sources": {
+                                                "type": "array",
+                                                "description": "List of actual URLs to news articles or financial reports that explain the price movement. Example: ['https://www.reuters.com/article/...', 'https://www.bloomberg.com/...']",
+                                                "items": {
+                                                    "type": "string",
+                                                    "description": "Complete URL to a news article or financial report"
+                                                },
+                                                "maxItems": 3
+                                            }
+                                        },
+                                        "required": ["rank", "isin", "symbol", "name", "percentChange", "direction", "story", "sources"]
                                     },
-                                    "required": ["rank", "isin", "symbol", "name", "percentChange", "direction", "story", "sources"]
-                                },
-                                "minItems": 6,
-                                "maxItems": 6
-                            }
-                        },
-                        "required": ["asOf", "timeframe", "movers"]
+                                    "minItems": 6,
+                                    "maxItems": 6
+                                }
+                            },
+                            "required": ["asOf", "timeframe", "movers"]
+                        }
                     }
                 }
-            }
+            ),
         )
 
         content = response.choices[0].message.content
@@ -152,16 +210,21 @@ async def get_news():
             content = content.split("</think>")[-1].strip()
         json_response = json.loads(content)
         
-        # Füge Logos für jeden Stock hinzu
-        for mover in json_response["movers"]:
-            logo_url = get_company_logo(get_company_name(mover["symbol"]))
+        # Füge Logos für jeden Stock hinzu; Namens- und Logo-Anfragen können im Scheduler
+        # warten und laufen deshalb in Threads statt auf der Event-Loop
+        logos = await asyncio.gather(
+            *(asyncio.to_thread(_company_logo_for_ticker, mover["symbol"]) for mover in json_response["movers"])
+        )
+        for mover, logo_url in zip(json_response["movers"], logos):
             mover["logo"] = logo_url
             
         return json_response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def get_stock_movement(ticker: str, timeframe: str):
+
+def _stock_movement_request(ticker: str, timeframe: str) -> dict:
+    """Modell, Prompt und Antwortschema für die Analyse der Kursbewegungen eines Tickers."""
     messages = [
         {
             "role": "system",
@@ -181,82 +244,125 @@ async def get_stock_movement(ticker: str, timeframe: str):
         }
     ]
 
-    try:
-        response = client.chat.completions.create(
-            model="sonar-pro",
-            messages=messages,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "created_at": {
-                                "type": "string",
-                                "format": "date-time",
-                                "description": "The current date and time in ISO-8601 format"
-                            },
-                            "timeframe": {
-                                "type": "string",
-                                "description": "The time period for which the data is valid"
-                            },
-                            "stock": {
-                                "type": "object",
-                                "properties": {
-                                    "symbol": {
-                                        "type": "string",
-                                        "description": "The stock's ticker symbol"
-                                    },
-                                    "movements": {
-                                        "type": "array",
-                                        "description": "List of significant price movements for the stock",
-                                        "items": {
-                                            "type": "object",
-                                            "properties": {
-                                                "date": {
-                                                    "type": "string",
-                                                    "format": "date",
-                                                    "description": "The date of the price movement in ISO-8601 format"
-                                                },
-                                                "percentChange": {
-                                                    "type": "number",
-                                                    "description": "The percentage change in stock price (positive for up, negative for down)"
-                                                },
-                                                "direction": {
-                                                    "type": "string",
-                                                    "enum": ["up", "down"],
-                                                    "description": "The direction of the price movement"
-                                                },
-                                                "story": {
+    return dict(
+        model="sonar-pro",
+        messages=messages,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "created_at": {
+                            "type": "string",
+                            "format": "date-time",
+                            "description": "The current date and time in ISO-8601 format"
+                        },
+                        "timeframe": {
+                            "type": "string",
+                            "description": "The time period for which the data is valid"
+                        },
+                        "stock": {
+                            "type": "object",
+                            "properties": {
+                                "symbol": {
+                                    "type": "string",
+                                    "description": "The stock's ticker symbol"
+                                },
+                                "movements": {
+                                    "type": "array",
+                                    "description": "List of significant price movements for the stock",
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "date": {
+                                                "type": "string",
+                                                "format": "date",
+                                                "description": "The date of the price movement in ISO-8601 format"
+                                            },
+                                            "percentChange": {
+                                                "type": "number",
+                                                "description": "The percentage change in stock price (positive for up, negative for down)"
+                                            },
+                                            "direction": {
+                                                "type": "string",
+                                                "enum": ["up", "down"],
+                                                "description": "The direction of the price movement"
+                                            },
+                                            "story": {
+                                                "type": "string",
+                                                "maxLength": 300,
+                                                "description": "A brief explanation of the main catalyst for the price movement"
+                                            },
+                                            "sources": {
+                                                "type": "array",
+                                                "description": "List of actual URLs to news articles or financial reports that explain the price movement. Example: ['https://www.reuters.com/article/...', 'https://www.bloomberg.com/...']",
+                                                "items": {
                                                     "type": "string",
-                                                    "maxLength": 300,
-                                                    "description": "A brief explanation of the main catalyst for the price movement"
+                                                    "description": "Complete URL to a news article or financial report"
                                                 },
-                                                "sources": {
-                                                    "type": "array",
-                                                    "description": "List of actual URLs to news articles or financial reports that explain the price movement. Example: ['https://www.reuters.com/article/...', 'https://www.bloomberg.com/...']",
-                                                    "items": {
-                                                        "type": "string",
-                                                        "description": "Complete URL to a news article or financial report"
-                                                    },
-                                                    "maxItems": 3
-                                                }
-                                            },
-                                            "required": ["date", "percentChange", "direction", "story", "sources"]
-                                        }
+                                                "maxItems": 3
+                                            }
+                                        },
+                                        "required": ["date", "percentChange", "direction", "story", "sources"]
                                     }
-                                },
-                                "required": ["symbol", "movements"]
-                            }
-                        },
-                        "required": ["asOf", "timeframe", "stock"]
-                    }
+                                }
+                            },
+                            "required": ["symbol", "movements"]
+                        }
+                    },
+                    "required": ["asOf", "timeframe", "stock"]
                 }
             }
+        }
+    )
+
+
+async def get_stock_movement(ticker: str, timeframe: str):
+    request = _stock_movement_request(ticker, timeframe)
+    try:
+        response = await asyncio.to_thread(
+            upstream("perplexity").call,
+            ("stock-movement", ticker, timeframe),
+            lambda: _client().chat.completions.create(**request),
         )
         return response
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def stream_stock_movement(ticker: str, timeframe: str) -> Iterator[dict]:
+    """Analyse der Kursbewegungen als Stream: ein Ereignis pro Bewegung, sobald das Modell sie geschrieben hat.
+
+    Die Anfrage wird sofort gestellt, sodass Fehler (auch ein erschöpftes
+    Rate Limit) noch vor der Antwort als Exception ankommen. Der zurückgegebene
+    Iterator liefert ``{"movement": {...}}`` für jede fertig geparste Bewegung
+    und zum Schluss ``{"result": {...}}`` mit der vollständigen Antwort im
+    Format von POST /stock-movement.
+    """
+    stream = upstream("perplexity").call(
+        None, lambda: _client().chat.completions.create(**_stock_movement_request(ticker, timeframe), stream=True)
+    )
+    return _movement_events(stream)
+
+
+def _movement_events(stream) -> Iterator[dict]:
+    think = ThinkFilter()
+    scanner = JsonItemScanner(("stock", "movements"))
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                # <think>-Abschnitte werden verworfen, bevor der JSON-Scanner sie sieht
+                for movement in scanner.feed(think.feed(delta)):
+                    yield {"movement": movement}
+        for movement in scanner.feed(think.close()):
+            yield {"movement": movement}
+        yield {"result": scanner.document()}
+    finally:
+        stream.close() 
 
 RELEVANT_KEYWORDS = ["record", "earnings", "beats", "acquisition", "upgrade", "forecast", "profit", "guidance", "merger", "lawsuit", "CEO", "drop", "plunge", "surge", "buy", "sell"]
 TRUSTED_SOURCES = ["Reuters", "Bloomberg", "CNBC", "Yahoo", "WSJ", "MarketWatch"]
@@ -265,19 +371,18 @@ def get_stock_news(ticker: str, days_back: int = 3) -> List[NewsStory]:
     """Holt News für einen bestimmten Ticker und gibt maximal 4 Stories zurück."""
     to_date = datetime.today().date()
     from_date = to_date - timedelta(days=days_back)
-    print(f"News for {ticker} from {from_date} to {to_date}")
+    logger.debug("News für %s von %s bis %s", ticker, from_date, to_date)
     
-    url = "https://finnhub.io/api/v1/company-news"
+    url = f"{_base_url('FINNHUB_BASE_URL', 'https://finnhub.io/api/v1')}/company-news"
     params = {
         "symbol": ticker,
         "from": str(from_date),
         "to": str(to_date),
-        "token": FINNHUB_API_KEY
+        "token": _api_key('FINNHUB_API_KEY')
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
+        response = upstream("finnhub").call(("company-news", ticker, params["from"]), _http_get, url, params=params)
         articles = response.json()
 
         # Filtere nach relevanten Schlagworten und Quellen
@@ -289,7 +394,7 @@ def get_stock_news(ticker: str, days_back: int = 3) -> List[NewsStory]:
         ]
 
         if not relevant_articles:
-            print("Keine besonders relevanten Artikel gefunden.")
+            logger.info("Keine besonders relevanten Artikel für %s gefunden", ticker)
             return []
 
         # Sortiere nach Datum (neueste zuerst) und nehme maximal 4 Artikel
@@ -315,33 +420,36 @@ def get_stock_news(ticker: str, days_back: int = 3) -> List[NewsStory]:
                 )
                 formatted_articles.append(formatted_article)
             except (ValueError, TypeError) as e:
-                print(f"Fehler bei der Verarbeitung des Artikels: {str(e)}")
+                logger.warning("Fehler bei der Verarbeitung des Artikels: %s", e)
                 continue
 
         return formatted_articles
 
     except Exception as e:
-        print(f"Fehler beim Abrufen der News für {ticker}: {str(e)}")
+        logger.warning("Fehler beim Abrufen der News für %s: %s", ticker, e)
         return []
 
 
 def get_company_name(ticker: str) -> str:
     """Ermittelt den Firmennamen anhand des Tickers mit Hilfe von Mistral AI."""
     try:
-        response = mistral_client.chat.completions.create(
-            model="mistral-small",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Du bist ein Finanzassistent. Deine Aufgabe ist es, den vollständigen Firmennamen anhand eines Aktientickers zu ermitteln. Antworte NUR mit dem Firmennamen, ohne weitere Erklärungen, Formatierung oder Disclaimer. Beispiel: Für 'AAPL' antworte nur 'Apple Inc.'"
-                },
-                {
-                    "role": "user",
-                    "content": f"Was ist der vollständige Firmenname für den Aktienticker {ticker}? Antworte nur mit dem Namen."
-                }
-            ],
-            temperature=0.1,  # Niedrige Temperatur für konsistente Antworten
-            max_tokens=50
+        response = upstream("mistral").call(
+            ("company-name", ticker),
+            lambda: _mistral_client().chat.completions.create(
+                model="mistral-small",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Du bist ein Finanzassistent. Deine Aufgabe ist es, den vollständigen Firmennamen anhand eines Aktientickers zu ermitteln. Antworte NUR mit dem Firmennamen, ohne weitere Erklärungen, Formatierung oder Disclaimer. Beispiel: Für 'AAPL' antworte nur 'Apple Inc.'"
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Was ist der vollständige Firmenname für den Aktienticker {ticker}? Antworte nur mit dem Namen."
+                    }
+                ],
+                temperature=0.1,  # Niedrige Temperatur für konsistente Antworten
+                max_tokens=50
+            ),
         )
         
         company_name = response.choices[0].message.content.strip()
@@ -362,5 +470,5 @@ def get_company_name(ticker: str) -> str:
             
         return company_name
     except Exception as e:
-        print(f"Fehler beim Abrufen des Firmennamens für {ticker}: {str(e)}")
+        logger.warning("Fehler beim Abrufen des Firmennamens für %s: %s", ticker, e)
         return ticker
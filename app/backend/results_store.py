@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional
+
+from metrics import cache_lookup, sqlite_timed
+from upstream import PREFETCH, priority
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_INSIGHTS = "transaction-insights"
+TRADING_WRAPPED = "trading-wrapped"
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Die Endpoints lesen diese Datensätze; per Umgebungsvariable z. B. für Messungen austauschbar
+BANKING_CSV = os.getenv("BANKING_CSV", os.path.join(BACKEND_DIR, "transactions", "banking_sample_data.csv"))
+TRADING_CSV = os.getenv("TRADING_CSV", os.path.join(BACKEND_DIR, "tr_wrapped", "trading_sample_data.csv"))
+
+
+def dataset_fingerprint(path: str, content: bool = False) -> str:
+    """Berechnet einen Fingerabdruck für eine Datendatei.
+
+    Standardmäßig aus Änderungszeit und Größe (ein stat-Aufruf), mit
+    `content=True` aus dem SHA-256 des Dateiinhalts.
+    """
+    if content:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _compress(data: Any) -> bytes:
+    """Serialisiert ein Ergebnis kompakt als zlib-komprimiertes JSON."""
+    return zlib.compress(
+        json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    )
+
+
+class ResultsStore:
+    """Speichert vorberechnete Ergebnisse pro (Endpoint, Benutzer, Datensatz-Fingerabdruck)."""
+
+    def __init__(self, db_path="results_store.db"):
+        self.db_path = db_path
+        self._fingerprints: dict[str, str] = {}
+        self._initialized = False
+
+    def _init_db(self):
+        """Initialisiert die SQLite-Datenbank mit der results Tabelle."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    endpoint TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    created_at TIMESTAMP,
+                    PRIMARY KEY (endpoint, user_id, fingerprint)
+                )
+            """)
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Öffnet eine Verbindung; die Tabellen werden erst beim ersten Zugriff angelegt."""
+        if not self._initialized:
+            self._init_db()
+            self._initialized = True
+        return sqlite3.connect(self.db_path)
+
+    def _check_fingerprint(self, conn: sqlite3.Connection, endpoint: str, fingerprint: str):
+        """Löscht Ergebnisse älterer Datensatz-Versionen, sobald sich der Fingerabdruck ändert."""
+        if self._fingerprints.get(endpoint) == fingerprint:
+            return
+        conn.execute(
+            "DELETE FROM results WHERE endpoint = ? AND fingerprint != ?",
+            (endpoint, fingerprint),
+        )
+        conn.commit()
+        self._fingerprints[endpoint] = fingerprint
+
+    @sqlite_timed("results_store")
+    def get(self, endpoint: str, user_id: str, fingerprint: str) -> Optional[Any]:
+        """Holt ein gespeichertes Ergebnis, sofern es zur aktuellen Datensatz-Version passt."""
+        with self._connect() as conn:
+            self._check_fingerprint(conn, endpoint, fingerprint)
+            row = conn.execute(
+                "SELECT data FROM results WHERE endpoint = ? AND user_id = ? AND fingerprint = ?",
+                (endpoint, user_id, fingerprint),
+            ).fetchone()
+        cache_lookup(f"results_store:{endpoint}", "hit" if row else "miss")
+        if row:
+            data = row[0]
+            # Ältere Einträge liegen noch als unkomprimierter JSON-Text vor
+            if isinstance(data, bytes):
+                data = zlib.decompress(data)
+            return json.loads(data)
+        return None
+
+    def put(self, endpoint: str, user_id: str, fingerprint: str, data: Any):
+        """Speichert das serialisierte Ergebnis eines Benutzers."""
+        self.put_many(endpoint, fingerprint, [(user_id, data)])
+
+    @sqlite_timed("results_store")
+    def put_many(self, endpoint: str, fingerprint: str, items: Iterable[tuple[str, Any]]):
+        """Speichert mehrere Ergebnisse zlib-komprimiert in einer Transaktion."""
+        created_at = datetime.now().isoformat()
+        with self._connect() as conn:
+            self._check_fingerprint(conn, endpoint, fingerprint)
+            conn.executemany("""
+                INSERT OR REPLACE INTO results (endpoint, user_id, fingerprint, data, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (
+                (endpoint, user_id, fingerprint, _compress(data), created_at)
+                for user_id, data in items
+            ))
+            conn.commit()
+
+    def warm(
+        self,
+        endpoint: str,
+        fingerprint: str,
+        user_ids: Iterable[str],
+        compute: Callable[[str], Any],
+        batch_size: int = 100,
+    ) -> int:
+        """Berechnet und speichert die Ergebnisse für alle Benutzer vor.
+
+        Liefert *compute* None, wird für diesen Benutzer nichts gespeichert.
+        """
+        batch: list[tuple[str, Any]] = []
+        count = 0
+        for user_id in user_ids:
+            try:
+                data = compute(user_id)
+            except Exception:
+                logger.exception("Fehler beim Vorberechnen von %s für %s", endpoint, user_id)
+                continue
+            if data is None:
+                continue
+            batch.append((user_id, data))
+            if len(batch) >= batch_size:
+                self.put_many(endpoint, fingerprint, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.put_many(endpoint, fingerprint, batch)
+            count += len(batch)
+        return count
+
+
+def warm_transaction_insights(store: ResultsStore, csv_path: str = BANKING_CSV) -> int:
+    """Wärmt den Store für /transaction-insights für alle Benutzer im Datensatz."""
+    from transactions.banking_balance import _dataset, get_balance_over_time
+
+    return store.warm(
+        TRANSACTION_INSIGHTS,
+        dataset_fingerprint(csv_path),
+        list(_dataset(csv_path).offsets),
+        lambda user_id: get_balance_over_time(user_id, csv_path),
+    )
+
+
+def warm_trading_wrapped(store: ResultsStore, csv_path: str = TRADING_CSV) -> int:
+    """Wärmt den Store für /trading-wrapped für alle Benutzer im Datensatz."""
+    from tr_wrapped.trading_wrapped import _aggregate, resolve_company_names, wrapped_isins, wrapped_points
+
+    agg_df, _ = _aggregate(csv_path)
+    # Alle benötigten Firmennamen vorab gesammelt auflösen statt pro Benutzer,
+    # hinter den Anfragen von Clients
+    with priority(PREFETCH):
+        resolve_company_names(wrapped_isins(csv_path), timeout=None)
+    fingerprint = dataset_fingerprint(csv_path)
+
+    def compute(user_id: str):
+        result = wrapped_points(user_id, csv_path)
+        # Während eines Neuaufbaus stammen die Punkte noch aus der alten Version;
+        # Punkte mit nicht aufgelösten Firmennamen werden beim nächsten Lauf neu berechnet
+        if result.version != fingerprint or result.unresolved:
+            return None
+        return result.points
+
+    return store.warm(TRADING_WRAPPED, fingerprint, agg_df.index, compute)
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "all"
+    if target not in ("all", TRANSACTION_INSIGHTS, TRADING_WRAPPED):
+        sys.exit(f"Verwendung: python results_store.py [all|{TRANSACTION_INSIGHTS}|{TRADING_WRAPPED}]")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = ResultsStore()
+    if target in ("all", TRANSACTION_INSIGHTS):
+        logger.info("%s: %d Benutzer vorberechnet", TRANSACTION_INSIGHTS, warm_transaction_insights(store))
+    if target in ("all", TRADING_WRAPPED):
+        logger.info("%s: %d Benutzer vorberechnet", TRADING_WRAPPED, warm_trading_wrapped(store))
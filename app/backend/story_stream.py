@@ -0,0 +1,270 @@
+"""Server-sent events for subscription stories, prices and top movers.
+
+    GET /stream/stories?tickers=AAPL&tickers=MSFT[&movers=true]
+
+Instead of every client polling /getSubscriptionStories and /getTopMovers,
+one `StoryHub` per process polls on behalf of all subscribers. Each round
+does the work once per ticker, however many clients follow it:
+
+* one SQLite query for the story versions of all subscribed tickers,
+  and new or updated rows only for tickers whose version changed,
+* every QUOTE_INTERVAL one yfinance quote per ticker,
+* stories for tickers that have none yet are fetched from Finnhub once
+  (retried after FETCH_RETRY), like the POST endpoint does on a miss,
+* the news_cache version for top movers.
+
+Events (``event:`` name, JSON ``data:``):
+
+``ticker``
+    the full state of one ticker in the /getSubscriptionStories format,
+    sent on subscribe, once a ticker is first loaded and when one of its
+    stored stories was updated in place,
+``stories``
+    ``{"ticker", "news": [...]}`` with the stories added since,
+``price``
+    ``{"ticker", "price", "change"}`` when the quote moved,
+``topMovers``
+    the /getTopMovers snapshot whenever a new one is stored.
+
+Slow consumers never make the hub wait and never grow a queue: each
+subscriber has a mailbox holding at most one pending event per (event,
+ticker). A newer price or ticker state replaces the pending one, new
+stories are appended to the pending list (capped at MAX_PENDING_STORIES).
+Idle connections get a comment line every HEARTBEAT seconds.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from metrics import Counter
+from news_cache import NewsCache, stock_quote, story_payload
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "5"))
+QUOTE_INTERVAL = float(os.getenv("STREAM_QUOTE_INTERVAL", "60"))
+FETCH_RETRY = float(os.getenv("STREAM_FETCH_RETRY", "300"))
+HEARTBEAT = 15.0
+MAX_PENDING_STORIES = 20
+
+stream_events = Counter(
+    "stream_events_total", "Events published to stream subscribers.", ("event", "outcome")
+)
+
+
+class _Subscriber:
+    """Mailbox of one client: the latest pending event per key, in arrival order."""
+
+    def __init__(self, tickers: Set[str], movers: bool):
+        self.tickers = tickers
+        self.movers = movers
+        self._pending: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def put(self, event: str, ticker: str, data: dict):
+        key = (event, ticker)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = data
+            stream_events.inc(event, "queued")
+        else:
+            if event == "stories":
+                data = {**data, "news": (pending["news"] + data["news"])[-MAX_PENDING_STORIES:]}
+            self._pending[key] = data
+            stream_events.inc(event, "coalesced")
+        self._ready.set()
+
+    async def get(self, timeout: float) -> Optional[Tuple[str, dict]]:
+        """The oldest pending event, or None if nothing arrived within *timeout*."""
+        if not self._pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        (event, _), data = self._pending.popitem(last=False)
+        return event, data
+
+
+class StoryHub:
+    """Shared polling loop fanning out story, price and top-mover updates."""
+
+    def __init__(self, news_cache: NewsCache, interval: float = POLL_INTERVAL,
+                 quote_interval: float = QUOTE_INTERVAL, fetch_retry: float = FETCH_RETRY):
+        self.news_cache = news_cache
+        self.interval = interval
+        self.quote_interval = quote_interval
+        self.fetch_retry = fetch_retry
+        self._subscribers: List[_Subscriber] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Per ticker: state in the /getSubscriptionStories format, story version, last story id
+        self._state: Dict[str, dict] = {}
+        self._versions: Dict[str, Tuple[int, int, int]] = {}
+        self._last_ids: Dict[str, int] = {}
+        self._fetch_attempts: Dict[str, float] = {}
+        self._quoted_at = 0.0
+        self._movers_version = None
+        self._movers: Optional[dict] = None
+        self._movers_attempt = 0.0
+
+    async def subscribe(self, tickers: Iterable[str], movers: bool = False) -> AsyncIterator[Tuple[str, dict]]:
+        """Yield (event, data) for *tickers* until the consumer stops iterating; None on heartbeat."""
+        subscriber = _Subscriber(set(tickers), movers)
+        for ticker in sorted(subscriber.tickers & self._state.keys()):
+            subscriber.put("ticker", ticker, self._state[ticker])
+        if movers and self._movers is not None:
+            subscriber.put("topMovers", "", self._movers)
+        self._subscribers.append(subscriber)
+        self._start()
+        try:
+            while True:
+                yield await subscriber.get(HEARTBEAT)
+        finally:
+            self._subscribers.remove(subscriber)
+
+    def _start(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        # Poll right away so new tickers do not wait for the next round
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._subscribers:
+            self._wakeup.clear()
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.exception("Stream poll failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _publish(self, event: str, ticker: str, data: dict):
+        for subscriber in self._subscribers:
+            if (subscriber.movers if event == "topMovers" else ticker in subscriber.tickers):
+                subscriber.put(event, ticker, data)
+
+    async def _poll(self):
+        tickers = sorted(set().union(*(s.tickers for s in self._subscribers)))
+        versions = await asyncio.to_thread(self.news_cache.get_subscription_story_versions, tickers)
+
+        unloaded = [t for t in tickers if t not in self._state]
+        # A ticker missing from *versions* only has expired stories left; keep what was sent
+        changed = [t for t in tickers if t in self._state and t in versions and versions[t] != self._versions[t]]
+        await asyncio.gather(
+            *(self._load(t, t in versions) for t in unloaded),
+            *(self._new_stories(t, versions[t]) for t in changed),
+        )
+
+        now = time.monotonic()
+        if now - self._quoted_at >= self.quote_interval:
+            self._quoted_at = now
+            await asyncio.gather(*(self._quote(t) for t in tickers if t in self._state and t not in unloaded))
+
+        if any(s.movers for s in self._subscribers):
+            await self._poll_movers()
+
+    async def _load(self, ticker: str, has_stories: bool):
+        """Full state of a ticker not loaded yet; its stories are fetched first if there are none."""
+        if not has_stories:
+            attempted = self._fetch_attempts.get(ticker)
+            if attempted is not None and time.monotonic() - attempted < self.fetch_retry:
+                return
+            self._fetch_attempts[ticker] = time.monotonic()
+        try:
+            state, version, last_id = await asyncio.to_thread(self._load_blocking, ticker, has_stories)
+        except Exception as e:
+            logger.warning("Stories für %s nicht abrufbar: %s", ticker, e)
+            return
+        if state is None:
+            return
+        self._state[ticker] = state
+        self._versions[ticker] = version
+        self._last_ids[ticker] = last_id
+        self._publish("ticker", ticker, state)
+
+    def _load_blocking(self, ticker: str, has_stories: bool):
+        if not has_stories:
+            from query_perplexity import get_stock_news
+
+            self.news_cache.store_subscription_stories(get_stock_news(ticker))
+        stories = self.news_cache.get_subscription_stories_by_ticker(ticker)
+        if not stories:
+            return None, None, None
+        state = self.news_cache.transform_stories_with_stock_data({ticker: stories}).get(ticker)
+        version = self.news_cache.get_subscription_story_versions([ticker]).get(ticker)
+        return state, version, max(story.id for story in stories)
+
+    async def _new_stories(self, ticker: str, version: Tuple[int, int, int]):
+        stories, latest = await asyncio.to_thread(self._new_stories_blocking, ticker, self._last_ids[ticker])
+        self._versions[ticker] = version
+        # New subscribers get the same latest stories /getSubscriptionStories returns
+        latest.sort(key=lambda story: story.created_at or datetime.min)
+        news = [story_payload(story) for story in latest]
+        previous = self._state[ticker]
+        self._state[ticker] = {**previous, "news": news}
+        if stories:
+            self._last_ids[ticker] = max(story.id for story in stories)
+            self._publish("stories", ticker, {"ticker": ticker, "news": [story_payload(story) for story in stories]})
+        elif news != previous["news"]:
+            # A stored story was updated in place: resend the ticker state
+            self._publish("ticker", ticker, self._state[ticker])
+
+    def _new_stories_blocking(self, ticker: str, after_id: int):
+        return (
+            self.news_cache.get_subscription_stories_since(ticker, after_id),
+            self.news_cache.get_subscription_stories_by_ticker(ticker),
+        )
+
+    async def _quote(self, ticker: str):
+        try:
+            price, change = await asyncio.to_thread(stock_quote, ticker)
+        except Exception as e:
+            logger.warning("Kurs für %s nicht abrufbar: %s", ticker, e)
+            return
+        price, change = round(price, 2), round(change, 2)
+        state = self._state[ticker]
+        if (state["price"], state["change"]) == (price, change):
+            return
+        self._state[ticker] = {**state, "price": price, "change": change}
+        self._publish("price", ticker, {"ticker": ticker, "price": price, "change": change})
+
+    async def _poll_movers(self):
+        version = await asyncio.to_thread(self.news_cache.get_news_version)
+        if version is None:
+            if time.monotonic() - self._movers_attempt < self.fetch_retry:
+                return
+            # Nothing stored for today: fetch once for all subscribers
+            self._movers_attempt = time.monotonic()
+            from query_perplexity import get_news
+
+            try:
+                news_data = await get_news()
+            except Exception as e:
+                logger.warning("Top Movers nicht abrufbar: %s", e)
+                return
+            await asyncio.to_thread(self.news_cache.store_news, news_data)
+            version = await asyncio.to_thread(self.news_cache.get_news_version)
+        if version == self._movers_version:
+            return
+        self._movers = await asyncio.to_thread(self.news_cache.get_cached_news)
+        self._movers_version = version
+        if self._movers is not None:
+            self._publish("topMovers", "", self._movers)
+
+
+def format_event(event: Optional[Tuple[str, dict]]) -> str:
+    """One server-sent event, or a comment line for a heartbeat."""
+    if event is None:
+        return ": keep-alive\n\n"
+    name, data = event
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
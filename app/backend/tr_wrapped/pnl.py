@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""pnl.py
+FIFO cost basis and realized P&L for the trade table of *trading_wrapped*.
+
+Usage
+-----
+python -m tr_wrapped.pnl [CSV_PATH]
+
+Run from the backend directory. The P&L summary per user feeds a point
+of `trading_wrapped.get_trading_wrapped_points()`.
+
+SELL fills are matched against earlier BUY lots first-in-first-out per
+(userId, ISIN). Instead of keeping lot objects per position the whole
+table is processed with sorted arrays:
+
+* rows are sorted by (userId, ISIN, executedAt),
+* all BUY lots are laid end to end on one global cumulative quantity
+  axis, so cost, fees and quantity-weighted buy time become piecewise
+  linear functions of that axis,
+* every SELL consumes the interval between the cumulative quantity sold
+  before it and after it, clipped to what was bought before it, and
+  its cost basis is the difference of the interpolated cost curve at
+  both ends.
+
+Quantity that cannot be matched (sells without earlier buys in the
+data) is reported as unmatched and excluded from the P&L.
+
+Dependencies: pandas >=1.5, numpy
+"""
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trading_sample_data.csv")
+NS_PER_DAY = 86_400 * 10**9
+
+
+def realized_fills(df: pd.DataFrame) -> pd.DataFrame:
+    """Match every SELL fill FIFO against earlier BUY lots of the same position.
+
+    Returns one row per SELL with columns userId, ISIN, executedAt,
+    quantity, matched_quantity, unmatched_quantity, proceeds, cost_basis,
+    fees, realized_pnl and holding_days. Buy fees enter the cost basis pro
+    rata to the matched quantity; sell fees are charged in full.
+    """
+    user_codes, _ = pd.factorize(df["userId"])
+    isin_codes, _ = pd.factorize(df["ISIN"])
+    executed = df["executedAt"].to_numpy().astype("datetime64[ns]").view("int64")
+    order = np.lexsort((executed, isin_codes, user_codes))
+
+    # Upper-case the few distinct directions instead of every row
+    direction_codes, directions = pd.factorize(df["direction"])
+    is_buy = np.array([str(d).upper() == "BUY" for d in directions])[direction_codes][order]
+    qty = df["executionSize"].to_numpy(dtype=float)[order]
+    price = df["executionPrice"].to_numpy(dtype=float)[order]
+    fee = df["executionFee"].to_numpy(dtype=float)[order]
+    t_days = (executed[order] - executed.min()) / NS_PER_DAY
+
+    group = user_codes[order].astype(np.int64) * (isin_codes.max() + 1) + isin_codes[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    group_ids = np.cumsum(np.r_[True, group[1:] != group[:-1]]) - 1
+
+    # Global cumulative buy axis and the offset at which each position starts
+    buy_qty = np.where(is_buy, qty, 0.0)
+    cum_buy = np.cumsum(buy_qty)
+    buy_before = cum_buy - buy_qty
+    group_offset = buy_before[starts][group_ids]
+
+    sell_qty = np.where(is_buy, 0.0, qty)
+    cum_sell = np.cumsum(sell_qty)
+    sold = cum_sell - (cum_sell - sell_qty)[starts][group_ids]
+    bought_before = buy_before - group_offset
+
+    # Consumed quantity E_j = min(E_{j-1} + s_j, B_j) unrolls to
+    # S_j + min(0, cummin_k<=j (B_k - S_k)) over the sells of a position
+    slack = pd.Series(np.where(is_buy, np.inf, bought_before - sold))
+    consumed = sold + np.minimum(0.0, slack.groupby(group_ids).cummin().to_numpy())
+
+    sells = np.flatnonzero(~is_buy)
+    consumed_after = consumed[sells]
+    sell_groups = group_ids[sells]
+    first_sell = np.r_[True, sell_groups[1:] != sell_groups[:-1]]
+    consumed_before = np.where(first_sell, 0.0, np.r_[0.0, consumed_after[:-1]])
+    matched = np.maximum(consumed_after - consumed_before, 0.0)
+
+    # Piecewise linear curves over the global buy axis (zero-size buys carry no lot)
+    lots = np.flatnonzero(is_buy & (qty > 0))
+    axis = np.r_[0.0, cum_buy[lots]]
+    cost_curve = np.r_[0.0, np.cumsum(qty[lots] * price[lots])]
+    fee_curve = np.r_[0.0, np.cumsum(fee[lots])]
+    time_curve = np.r_[0.0, np.cumsum(qty[lots] * t_days[lots])]
+
+    lo = group_offset[sells] + consumed_before
+    hi = group_offset[sells] + consumed_after
+    cost_basis = np.interp(hi, axis, cost_curve) - np.interp(lo, axis, cost_curve)
+    buy_fees = np.interp(hi, axis, fee_curve) - np.interp(lo, axis, fee_curve)
+    buy_time = np.interp(hi, axis, time_curve) - np.interp(lo, axis, time_curve)
+
+    has_match = matched > 0
+    proceeds = matched * price[sells]
+    fees = buy_fees + fee[sells]
+    holding_days = np.full(len(sells), np.nan)
+    holding_days[has_match] = t_days[sells][has_match] - buy_time[has_match] / matched[has_match]
+
+    rows = order[sells]
+    return pd.DataFrame({
+        "userId": df["userId"].to_numpy()[rows],
+        "ISIN": df["ISIN"].to_numpy()[rows],
+        "executedAt": df["executedAt"].to_numpy()[rows],
+        "quantity": qty[sells],
+        "matched_quantity": matched,
+        "unmatched_quantity": qty[sells] - matched,
+        "proceeds": proceeds,
+        "cost_basis": cost_basis,
+        "fees": fees,
+        "realized_pnl": proceeds - cost_basis - fees,
+        "holding_days": holding_days,
+    })
+
+
+def realized_summary(df: pd.DataFrame, fills: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Per-user realized P&L, fees, win rate and average holding period.
+
+    Only sells that matched at least part of a lot count as closed trades;
+    the holding period is weighted by matched quantity.
+    """
+    if fills is None:
+        fills = realized_fills(df)
+    closed = fills[fills["matched_quantity"] > 0]
+    weighted_days = closed["holding_days"] * closed["matched_quantity"]
+    grouped = closed.assign(
+        weighted_days=weighted_days, win=closed["realized_pnl"] > 0
+    ).groupby("userId")
+    summary = grouped.agg(
+        realized_pnl=("realized_pnl", "sum"),
+        fees=("fees", "sum"),
+        closed_trades=("realized_pnl", "size"),
+        win_rate=("win", "mean"),
+        matched_quantity=("matched_quantity", "sum"),
+        weighted_days=("weighted_days", "sum"),
+    )
+    summary["avg_holding_days"] = summary["weighted_days"] / summary["matched_quantity"]
+    return summary.drop(columns=["matched_quantity", "weighted_days"])
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV
+    trades = pd.read_csv(csv_path, parse_dates=["executedAt"])
+    print(realized_summary(trades).sort_values("realized_pnl").to_string())
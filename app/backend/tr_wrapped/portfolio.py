@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""portfolio.py
+Daily portfolio value of a single user from trades and cached close prices.
+
+Usage
+-----
+python -m tr_wrapped.portfolio <USER_ID> [CSV_PATH]
+
+Positions per ISIN are rebuilt from the cumulative signed `executionSize`
+on a daily grid. Prices come from the local `PriceCache` only; days
+without a cached close fall back to the user's own last execution price.
+The valuation is a single vectorised product of the (days × ISINs)
+position and price matrices.
+
+All values are in EUR: the trade table's execution prices are, and the
+cache converts closes from the exchange's currency when it is filled.
+Holdings in a currency without a known rate have no cached closes and
+are valued at the user's execution prices only.
+
+Dependencies: pandas >=1.5, numpy
+"""
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from tr_wrapped.price_cache import CURRENCY, PriceCache
+from tr_wrapped.trading_wrapped import DEFAULT_CSV, _dataset
+
+_price_cache: Optional[PriceCache] = None
+_price_cache_lock = threading.Lock()
+
+
+def _shared_price_cache() -> PriceCache:
+    """The process-wide PriceCache on the backend's price_cache.db, opened on first use."""
+    global _price_cache
+    if _price_cache is None:
+        with _price_cache_lock:
+            if _price_cache is None:
+                _price_cache = PriceCache()
+    return _price_cache
+
+
+def _forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value of every column down the rows."""
+    rows = np.where(np.isnan(matrix), 0, np.arange(len(matrix))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def get_portfolio_value(
+    user_id: str = "00909ba7-ad01-42f1-9074-2773c7d3cf2c",
+    csv_path: str = DEFAULT_CSV,
+    cache: Optional[PriceCache] = None,
+) -> Dict[str, Any]:
+    """Return the daily value of *user_id*'s holdings from the first trade to the last day of data."""
+    dataset = _dataset(csv_path)
+    if user_id not in dataset.offsets:
+        raise ValueError(f"User '{user_id}' not found in {csv_path}")
+    cache = cache or _shared_price_cache()
+
+    trades = dataset.user_rows(user_id)
+    days = pd.date_range(
+        trades["executedAt"].iloc[0].normalize(), dataset.df["executedAt"].max().normalize(), freq="D"
+    )
+    isin_idx, isins = pd.factorize(trades["ISIN"])
+    day_idx = days.get_indexer(trades["executedAt"].dt.normalize())
+
+    # Daily position changes, then running positions that never go short:
+    # sells of lots bought before the data starts are ignored
+    signed = np.where(trades["is_buy"], 1.0, -1.0) * trades["executionSize"].to_numpy()
+    deltas = np.zeros((len(days), len(isins)))
+    np.add.at(deltas, (day_idx, isin_idx), signed)
+    cumulative = np.cumsum(deltas, axis=0)
+    positions = cumulative - np.minimum(0.0, np.minimum.accumulate(cumulative, axis=0))
+
+    # Cached closes first, the user's own execution prices where nothing is cached
+    closes = cache.closes(list(isins), days)
+    executions = np.full_like(closes, np.nan)
+    executions[day_idx, isin_idx] = trades["executionPrice"].to_numpy()
+    prices = _forward_fill(np.where(np.isnan(closes), executions, closes))
+    from_cache = int((~np.isnan(closes) & (positions > 0)).sum())
+
+    held = positions > 0
+    values = np.einsum("di,di->d", np.where(held, positions, 0.0), np.nan_to_num(prices))
+
+    return {
+        "user_id": user_id,
+        "currency": CURRENCY,
+        "series": [
+            {"date": day.date().isoformat(), "value": round(float(value), 2)}
+            for day, value in zip(days, values)
+        ],
+        "price_coverage": round(from_cache / max(int(held.sum()), 1), 3),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python -m tr_wrapped.portfolio <USER_ID> [CSV_PATH]")
+    user_id = sys.argv[1]
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CSV
+    import json
+    print(json.dumps(get_portfolio_value(user_id, csv_path), indent=2))
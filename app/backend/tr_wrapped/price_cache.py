@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""price_cache.py
+Local on-disk cache of daily close prices per ISIN.
+
+Usage
+-----
+python -m tr_wrapped.price_cache [CSV_PATH]
+
+Fills the cache for every ISIN in the trade table over the table's date
+range. Prices are downloaded from yfinance in batches of tickers and
+never on behalf of a single request; readers only see what is cached.
+
+yfinance quotes each ticker in the currency of its exchange, the trade
+table is in EUR. Closes are converted to EUR with the daily
+``EUR<CCY>=X`` rate before they are stored; tickers whose currency or
+rate is unknown are not cached at all, so readers fall back to their
+own EUR execution prices for them.
+
+Dependencies: pandas >=1.5, numpy, yfinance
+"""
+import logging
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "price_cache.db")
+DOWNLOAD_BATCH_SIZE = 50
+CURRENCY = "EUR"
+# Exchanges quoting in the minor unit: currency of the FX rate and units per major unit
+MINOR_UNITS = {"GBp": ("GBP", 100.0), "GBX": ("GBP", 100.0), "ILA": ("ILS", 100.0), "ZAc": ("ZAR", 100.0)}
+
+
+class PriceCache:
+    """Daily EUR closes per ISIN in SQLite plus the ISIN → ticker mapping used to fetch them."""
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        self.db_path = db_path
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if "prices" in tables and "currencies" not in tables:
+                # Caches from before the EUR conversion hold closes in the exchange's currency
+                conn.execute("DELETE FROM prices")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prices (
+                    isin TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    close REAL NOT NULL,
+                    PRIMARY KEY (isin, date)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS symbols (
+                    isin TEXT PRIMARY KEY,
+                    symbol TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS currencies (
+                    symbol TEXT PRIMARY KEY,
+                    currency TEXT
+                )
+            """)
+            conn.commit()
+
+    def closes(self, isins: List[str], days: pd.DatetimeIndex) -> np.ndarray:
+        """Return a (days × isins) matrix of cached EUR closes, NaN where nothing is cached."""
+        matrix = np.full((len(days), len(isins)), np.nan)
+        if not isins or len(days) == 0:
+            return matrix
+        placeholders = ",".join("?" * len(isins))
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                f"SELECT isin, date, close FROM prices WHERE isin IN ({placeholders}) AND date BETWEEN ? AND ?",
+                (*isins, days[0].date().isoformat(), days[-1].date().isoformat()),
+            ).fetchall()
+        if not rows:
+            return matrix
+        cached = pd.DataFrame(rows, columns=["isin", "date", "close"])
+        day_idx = days.get_indexer(pd.to_datetime(cached["date"]))
+        isin_idx = pd.Index(isins).get_indexer(cached["isin"])
+        valid = (day_idx >= 0) & (isin_idx >= 0)
+        matrix[day_idx[valid], isin_idx[valid]] = cached["close"].to_numpy()[valid]
+        return matrix
+
+    def _symbols(self, isins: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Resolve ISINs to yfinance tickers once and remember the answer."""
+        isins = list(isins)
+        with sqlite3.connect(self.db_path) as conn:
+            known = dict(conn.execute("SELECT isin, symbol FROM symbols").fetchall())
+        missing = [isin for isin in isins if isin not in known]
+        if missing:
+            from yfinance.utils import get_ticker_by_isin
+
+            logger.info("Resolving tickers for %d ISINs", len(missing))
+            for isin in missing:
+                try:
+                    known[isin] = get_ticker_by_isin(isin) or None
+                except Exception as e:
+                    logger.warning("No ticker found for ISIN %s: %s", isin, e)
+                    known[isin] = None
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO symbols (isin, symbol) VALUES (?, ?)",
+                    [(isin, known[isin]) for isin in missing],
+                )
+                conn.commit()
+        return known
+
+    def _currencies(self, symbols: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Look up the quote currency of yfinance tickers once and remember the answer."""
+        symbols = list(symbols)
+        with sqlite3.connect(self.db_path) as conn:
+            known = dict(conn.execute("SELECT symbol, currency FROM currencies").fetchall())
+        missing = [symbol for symbol in symbols if symbol not in known]
+        if missing:
+            import yfinance as yf
+
+            logger.info("Looking up currencies for %d tickers", len(missing))
+            for symbol in missing:
+                try:
+                    known[symbol] = yf.Ticker(symbol).fast_info["currency"] or None
+                except Exception as e:
+                    logger.warning("No currency found for ticker %s: %s", symbol, e)
+                    known[symbol] = None
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO currencies (symbol, currency) VALUES (?, ?)",
+                    [(symbol, known[symbol]) for symbol in missing],
+                )
+                conn.commit()
+        return known
+
+    @staticmethod
+    def _eur_rates(currencies: Iterable[str], start: str, end: str) -> Dict[str, pd.Series]:
+        """Daily units of each currency per EUR, from the ``EUR<CCY>=X`` closes."""
+        import yfinance as yf
+
+        pairs = {f"{CURRENCY}{currency}=X": currency for currency in currencies}
+        if not pairs:
+            return {}
+        data = yf.download(
+            list(pairs), start=start, end=end, interval="1d", group_by="ticker", progress=False, threads=True
+        )
+        rates = {}
+        for pair, currency in pairs.items():
+            try:
+                rate = data[pair]["Close"].dropna()
+            except (KeyError, TypeError):
+                rate = pd.Series(dtype=float)
+            if rate.empty:
+                logger.warning("No exchange rate for %s, its closes are not cached", currency)
+                continue
+            rates[currency] = rate
+        return rates
+
+    def fill(self, isins: Iterable[str], start: pd.Timestamp, end: pd.Timestamp,
+             batch_size: int = DOWNLOAD_BATCH_SIZE) -> int:
+        """Download daily closes for *isins* in batches and store them in EUR; returns rows written."""
+        import yfinance as yf
+
+        symbols = {isin: symbol for isin, symbol in self._symbols(isins).items() if symbol}
+        by_symbol = {symbol: isin for isin, symbol in symbols.items()}
+        currencies = {symbol: currency for symbol, currency in self._currencies(by_symbol).items() if currency}
+        # Tickers quoted in an unknown currency are left to the execution price fallback
+        tickers = [symbol for symbol in by_symbol if symbol in currencies]
+        first_day = start.date().isoformat()
+        after_last_day = (end + pd.Timedelta(days=1)).date().isoformat()
+        rates = self._eur_rates(
+            {MINOR_UNITS.get(currencies[symbol], (currencies[symbol], 1.0))[0] for symbol in tickers} - {CURRENCY},
+            # A few days earlier so the first closes have a rate to carry forward
+            (start - pd.Timedelta(days=7)).date().isoformat(),
+            after_last_day,
+        )
+        written = 0
+        for batch_start in range(0, len(tickers), batch_size):
+            batch = tickers[batch_start:batch_start + batch_size]
+            data = yf.download(
+                batch,
+                start=first_day,
+                end=after_last_day,
+                interval="1d",
+                group_by="ticker",
+                progress=False,
+                threads=True,
+            )
+            if data is None or data.empty:
+                continue
+            rows = []
+            for symbol in batch:
+                try:
+                    close = data[symbol]["Close"].dropna()
+                except KeyError:
+                    continue
+                currency, units = MINOR_UNITS.get(currencies[symbol], (currencies[symbol], 1.0))
+                if currency != CURRENCY:
+                    if currency not in rates:
+                        continue
+                    # Rate of the close's day, or of the last trading day before it
+                    rate = rates[currency].reindex(rates[currency].index.union(close.index)).ffill()
+                    close = (close / units / rate.reindex(close.index)).dropna()
+                rows.extend(
+                    (by_symbol[symbol], day.date().isoformat(), float(value))
+                    for day, value in close.items()
+                )
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO prices (isin, date, close) VALUES (?, ?, ?)", rows
+                )
+                conn.commit()
+            written += len(rows)
+            logger.info("Cached %d closes for %d tickers", len(rows), len(batch))
+        return written
+
+
+if __name__ == "__main__":
+    from tr_wrapped.trading_wrapped import DEFAULT_CSV, _dataset
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV
+    df = _dataset(csv_path).df
+    cache = PriceCache()
+    written = cache.fill(
+        df["ISIN"].unique(),
+        df["executedAt"].min().normalize(),
+        df["executedAt"].max().normalize(),
+    )
+    print(f"Cached {written} closes in {os.path.abspath(cache.db_path)}")
@@ -1,111 +1,362 @@
 #!/usr/bin/env python3
 """trading_wrapped.py
-Generate a list of 13 "Spotify Wrapped‑style" insights for a single user.
+Generate a list of 14 "Spotify Wrapped‑style" insights for a single user.
 
 Usage
 -----
-python trading_wrapped.py <USER_ID> [CSV_PATH]
+python -m tr_wrapped.trading_wrapped <USER_ID> [CSV_PATH]
 
-If *CSV_PATH* is omitted the script looks for *trading_sample_data.csv*
-in the current working directory.
+Run from the backend directory. If *CSV_PATH* is omitted the script uses
+the *trading_sample_data.csv* next to this module.
 
 The function `get_trading_wrapped_points()` can also be imported and
 called directly from your own code.
 
 Dependencies: pandas >=1.5, numpy
 """
+import contextvars
+import logging
 import os
 import sys
+import threading
+import time
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from functools import lru_cache
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
 import pandas as pd
-from dotenv import load_dotenv
-from openai import OpenAI
-import yfinance as yf
-load_dotenv()
-MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
+from metrics import cache_lookup, upstream_call
+from tr_wrapped.pnl import realized_summary
+from upstream import upstream
 
-DEFAULT_CSV = "trading_sample_data.csv"
-mistral_client = OpenAI(api_key=MISTRAL_API_KEY, base_url="https://api.mistral.ai/v1")
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trading_sample_data.csv")
+NAME_LOOKUP_TIMEOUT = float(os.getenv("NAME_LOOKUP_TIMEOUT", "8"))
+# Loaded as categoricals: integer codes instead of one Python string per row,
+# which keeps the table copy-on-write shared between forked workers
+CATEGORY_COLUMNS = ["userId", "ISIN", "direction", "currency", "type"]
+
+# Resolved company names per ISIN, shared by all requests of this process
+_company_names: Dict[str, str] = {}
+_name_executor: Optional[ThreadPoolExecutor] = None
+_name_executor_pid: Optional[int] = None
 
 
 def _load(csv_path: str) -> pd.DataFrame:
     """Read raw trade data and add helper columns."""
-    print(f"Loading CSV from: {csv_path}")  # Debug print
-    df = pd.read_csv(csv_path, parse_dates=["executedAt"])
+    logger.info("Loading CSV from %s", csv_path)
+    df = pd.read_csv(
+        csv_path, parse_dates=["executedAt"], dtype={col: "category" for col in CATEGORY_COLUMNS}
+    )
     if df.empty:
         raise ValueError(f"No rows found in {csv_path}")
     df["trade_value"] = df["executionSize"] * df["executionPrice"]
+    # On categoricals the string methods run once per category, not per row
     df["is_buy"] = df["direction"].str.upper() == "BUY"
-    print(f"Loaded {len(df)} rows")  # Debug print
+    df["country"] = df["ISIN"].str.slice(0, 2).astype("category")
+    logger.info("Loaded %d rows from %s", len(df), csv_path)
     return df
 
 
-@lru_cache(maxsize=1)
-def _aggregate(csv_path: str) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Return (aggregated_per_user, full_dataframe) with caching."""
-    df = _load(csv_path)
-
-    def user_aggs(g: pd.DataFrame) -> pd.Series:
-        out: dict[str, object] = {}
-        out["first_trade"] = g["executedAt"].min()
-        out["total_trades"] = len(g)
-        out["volume"] = g["trade_value"].sum()
-        out["largest_trade"] = g["trade_value"].max()
-        out["distinct_countries"] = g["ISIN"].str.slice(0, 2).nunique()
-
-        # longest streak of consecutive trading days
-        days = (
-            pd.to_datetime(g["executedAt"]).dt.normalize().drop_duplicates().sort_values()
+def _longest_streaks(df: pd.DataFrame) -> pd.Series:
+    """Longest run of consecutive trading days per user via run-length encoding."""
+    days = (
+        pd.DataFrame({"userId": df["userId"], "day": df["executedAt"].dt.normalize()})
+        .drop_duplicates()
+        .sort_values(["userId", "day"])
+    )
+    user_codes = days["userId"].factorize()[0]
+    day_values = days["day"].to_numpy()
+
+    # A new run starts at every user change or whenever the gap is not exactly one day
+    new_run = np.ones(len(days), dtype=bool)
+    new_run[1:] = (user_codes[1:] != user_codes[:-1]) | (
+        np.diff(day_values) != np.timedelta64(1, "D")
+    )
+    run_ids = np.cumsum(new_run) - 1
+    run_lengths = np.bincount(run_ids)
+    return pd.Series(run_lengths[run_ids], index=days["userId"].to_numpy()).groupby(level=0).max()
+
+
+def _aggregate_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-user metrics computed with grouped vectorised operations."""
+    grouped = df.groupby("userId", observed=True)
+    agg_df = grouped.agg(
+        first_trade=("executedAt", "min"),
+        total_trades=("executedAt", "size"),
+        volume=("trade_value", "sum"),
+        largest_trade=("trade_value", "max"),
+    )
+    agg_df["distinct_countries"] = grouped["country"].nunique()
+    agg_df["longest_streak"] = _longest_streaks(df)
+    return agg_df
+
+
+# Metrics the points rank users on, and the persona quantiles they compare against
+PERCENTILE_METRICS = ("first_trade", "total_trades", "largest_trade", "distinct_countries", "volume")
+PERSONA_QUANTILES = (
+    ("distinct_countries", 0.9),
+    ("volume", 0.9),
+    ("total_trades", 0.9),
+    ("total_trades", 0.25),
+    ("largest_trade", 0.75),
+)
+
+
+@dataclass(frozen=True)
+class _Distributions:
+    """Sorted population values and quantile thresholds per metric."""
+
+    sorted_values: Dict[str, np.ndarray]
+    thresholds: Dict[tuple[str, float], float]
+
+    @classmethod
+    def from_aggregates(cls, agg_df: pd.DataFrame) -> "_Distributions":
+        return cls(
+            sorted_values={m: np.sort(agg_df[m].to_numpy()) for m in PERCENTILE_METRICS},
+            thresholds={(m, q): agg_df[m].quantile(q) for m, q in PERSONA_QUANTILES},
         )
-        longest = cur = 1
-        if days.empty:
-            longest = 0
-        else:
-            for prev, curr in zip(days[:-1], days[1:]):
-                if (curr - prev).days == 1:
-                    cur += 1
-                else:
-                    longest = max(longest, cur)
-                    cur = 1
-            longest = max(longest, cur)
-        out["longest_streak"] = longest
-        return pd.Series(out)
 
-    agg_df = df.groupby("userId").apply(user_aggs)
-    return agg_df, df
+    def percentile(self, metric: str, value) -> float:
+        """Share of users strictly below *value* (0‑100), in O(log n)."""
+        values = self.sorted_values[metric]
+        if isinstance(value, pd.Timestamp):
+            value = value.to_datetime64()
+        return float(np.searchsorted(values, value, side="left") / len(values) * 100)
+
+    def quantile(self, metric: str, q: float) -> float:
+        return self.thresholds[(metric, q)]
+
+
+@dataclass(frozen=True)
+class _GlobalFacts:
+    """Platform-wide facts plus per-user trading days for O(1) membership checks."""
+
+    busiest_day: dt.date
+    trading_days: Dict[str, frozenset]
+
+    @classmethod
+    def from_trades(cls, df: pd.DataFrame) -> "_GlobalFacts":
+        days = pd.DataFrame({"userId": df["userId"], "day": df["executedAt"].dt.date})
+        daily_counts = days.groupby("day").size()
+        user_days = days.drop_duplicates().groupby("userId", observed=True)["day"].agg(frozenset)
+        return cls(busiest_day=daily_counts.idxmax(), trading_days=user_days.to_dict())
+
+    def traded_on(self, user_id: str, day: dt.date) -> bool:
+        return day in self.trading_days.get(user_id, ())
+
+
+def _user_offsets(df: pd.DataFrame) -> Dict[str, tuple[int, int]]:
+    """Map userId to its [start, end) row range in a table sorted by userId."""
+    user_ids = df["userId"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    ends = np.r_[starts[1:], len(user_ids)]
+    return {user_ids[start]: (int(start), int(end)) for start, end in zip(starts, ends)}
+
+
+@dataclass(frozen=True)
+class _WrappedDataset:
+    """Everything derived from one version of the trade CSV.
+
+    *df* is sorted by (userId, executedAt) so that a user's trades are one
+    contiguous block located through *offsets*.
+    """
+
+    agg_df: pd.DataFrame
+    df: pd.DataFrame
+    offsets: Dict[str, tuple[int, int]]
+    distributions: _Distributions
+    facts: _GlobalFacts
+    pnl: pd.DataFrame
+
+    def user_rows(self, user_id: str) -> pd.DataFrame:
+        """Trades of *user_id* in execution order as a slice of the sorted table."""
+        start, end = self.offsets[user_id]
+        return self.df.iloc[start:end]
+
+
+def _build_dataset(df: pd.DataFrame) -> _WrappedDataset:
+    df = df.sort_values(["userId", "executedAt"], kind="mergesort").reset_index(drop=True)
+    agg_df = _aggregate_frame(df)
+    return _WrappedDataset(
+        agg_df,
+        df,
+        _user_offsets(df),
+        _Distributions.from_aggregates(agg_df),
+        _GlobalFacts.from_trades(df),
+        realized_summary(df),
+    )
+
+
+def _dataset_version(csv_path: str) -> str:
+    """Cheap fingerprint of *csv_path* from its modification time and size."""
+    stat = os.stat(csv_path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+class _AggregateCache:
+    """Dataset-versioned cache for `_aggregate`.
+
+    Every lookup compares the file fingerprint with the cached version.
+    Only the very first build of a path blocks; when the file changes the
+    old version keeps being served while a background thread rebuilds it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._rebuilding: set[str] = set()
+
+    def get(self, csv_path: str) -> _WrappedDataset:
+        return self.get_versioned(csv_path)[0]
+
+    def get_versioned(self, csv_path: str) -> tuple[_WrappedDataset, str]:
+        """The cached dataset and the file version it was built from.
+
+        While a rebuild runs that version is older than the file on disk.
+        """
+        version = _dataset_version(csv_path)
+        with self._lock:
+            entry = self._entries.get(csv_path)
+            if entry is not None:
+                stale = entry["version"] != version
+                if stale and csv_path not in self._rebuilding:
+                    self._rebuilding.add(csv_path)
+                    threading.Thread(
+                        target=self._rebuild, args=(csv_path, version), daemon=True
+                    ).start()
+                cache_lookup("trading_aggregates", "stale" if stale else "hit")
+                return entry["value"], entry["version"]
+
+        cache_lookup("trading_aggregates", "miss")
+
+        with self._build_lock:
+            # Another request may have finished the first build meanwhile
+            entry = self._entries.get(csv_path) or self._build(csv_path, version)
+            return entry["value"], entry["version"]
+
+    def _build(self, csv_path: str, version: str) -> dict:
+        started = time.perf_counter()
+        df = _load(csv_path)
+        entry = {
+            "version": version,
+            "value": _build_dataset(df),
+            "build_duration": time.perf_counter() - started,
+            "built_at": dt.datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._entries[csv_path] = entry
+        return entry
+
+    def _rebuild(self, csv_path: str, version: str):
+        try:
+            self._build(csv_path, version)
+        except Exception as e:
+            logger.exception("Rebuilding aggregates for %s failed: %s", csv_path, e)
+        finally:
+            with self._lock:
+                self._rebuilding.discard(csv_path)
+
+    def info(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                csv_path: {
+                    "version": entry["version"],
+                    "build_duration_s": round(entry["build_duration"], 3),
+                    "built_at": entry["built_at"],
+                    "rebuilding": csv_path in self._rebuilding,
+                }
+                for csv_path, entry in self._entries.items()
+            }
+
+
+_aggregate_cache = _AggregateCache()
+
+
+def _dataset(csv_path: str) -> _WrappedDataset:
+    """Return the derived data for the current version of *csv_path*."""
+    return _aggregate_cache.get(csv_path)
+
+
+def _aggregate(csv_path: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return (aggregated_per_user, full_dataframe) for the current dataset version."""
+    dataset = _dataset(csv_path)
+    return dataset.agg_df, dataset.df
+
+
+def warm_cache(csv_path: str = DEFAULT_CSV) -> None:
+    """Build the aggregates for *csv_path* ahead of the first request."""
+    _dataset(csv_path)
+
+
+def cache_info() -> Dict[str, dict]:
+    """Cached dataset version, build duration and rebuild state per CSV path."""
+    return _aggregate_cache.info()
+
+
+def _row(df: pd.DataFrame, position: int) -> Dict[str, object]:
+    """One row as a dict; a row Series would first unify the categorical dtypes."""
+    return {column: df[column].iloc[position] for column in ("executedAt", "ISIN", "direction", "trade_value")}
 
 
-def _percentile(series: pd.Series, value: float) -> float:
-    """Return percentile rank of *value* within *series* (0‑100)."""
-    return float((series < value).mean() * 100)
+def _count(n: int, noun: str) -> str:
+    """``"1 closing sell"``, ``"3 closing sells"``."""
+    return f"{n} {noun if n == 1 else noun + 's'}"
+
+
+@dataclass(frozen=True)
+class WrappedPoints:
+    """The insight strings of one user and the dataset version they were computed from.
+
+    *unresolved* lists the ISINs the points show raw because their name
+    lookup failed or timed out; such points should not be stored.
+    """
+
+    points: List[str]
+    version: str
+    unresolved: tuple[str, ...] = ()
 
 
 def get_trading_wrapped_points(
     user_id: str="00909ba7-ad01-42f1-9074-2773c7d3cf2c", csv_path: str = DEFAULT_CSV
 ) -> List[str]:
-    """Return 13 insight strings for *user_id* from *csv_path*."""
-    agg_df, df = _aggregate(csv_path)
+    """Return 14 insight strings for *user_id* from *csv_path*."""
+    return wrapped_points(user_id, csv_path).points
+
+
+def wrapped_points(user_id: str, csv_path: str = DEFAULT_CSV) -> WrappedPoints:
+    """Like `get_trading_wrapped_points`, with the version of the dataset actually used.
+
+    During a background rebuild the points come from the previous
+    version; callers that store or tag results by the file's current
+    fingerprint compare it with `WrappedPoints.version` first.
+    """
+    dataset, version = _aggregate_cache.get_versioned(csv_path)
+    agg_df, dist = dataset.agg_df, dataset.distributions
 
-    if user_id not in agg_df.index:
+    if user_id not in dataset.offsets:
         raise ValueError(f"User '{user_id}' not found in {csv_path}")
 
-    df_user = (
-        df[df["userId"] == user_id].copy().sort_values("executedAt").reset_index(drop=True)
-    )
+    df_user = dataset.user_rows(user_id)
     metrics = agg_df.loc[user_id]
 
-    def pct(s, v):
-        return _percentile(s, v)
+    # Collect every ISIN the points mention and resolve them in one round
+    first = _row(df_user, 0)
+    top_isins = (
+        df_user.groupby("ISIN", observed=True)["trade_value"].sum().sort_values(ascending=False).head(5)
+    )
+    largest_row = _row(df_user, int(df_user["trade_value"].to_numpy().argmax()))
+    names = resolve_company_names([first["ISIN"], *top_isins.index, largest_row["ISIN"]])
 
     points: list[str] = []
 
     # 1 — Opening trade
-    first = df_user.iloc[0]
-    earlier_pct = pct(agg_df["first_trade"], first["executedAt"])
-    company_name = get_company_name_from_isin(first["ISIN"])
+    earlier_pct = dist.percentile("first_trade", first["executedAt"])
+    company_name = names[first["ISIN"]]
     points.append(
         f"Opened the year on {first['executedAt']:%d %b %Y at %H:%M} "
         f"with a {first['direction'].lower()} of {company_name} worth "
@@ -118,12 +369,11 @@ def get_trading_wrapped_points(
     fees = df_user["executionFee"].sum()
     points.append(
         f"{total_trades} trades, moving €{volume:,.0f} and paying €{fees:,.2f} in fees – "
-        f"top {100 - pct(agg_df['total_trades'], total_trades):.0f}% for activity."
+        f"top {100 - dist.percentile('total_trades', total_trades):.0f}% for activity."
     )
 
     # 3 — Trading rhythm
-    df_user["month"] = df_user["executedAt"].dt.month
-    month_counts = df_user["month"].value_counts()
+    month_counts = df_user["executedAt"].dt.month.value_counts()
     best_month = int(month_counts.idxmax())
     best_count = int(month_counts.max())
     points.append(
@@ -131,26 +381,22 @@ def get_trading_wrapped_points(
     )
 
     # 4 — Top 5 securities
-    top_isins = (
-        df_user.groupby("ISIN")["trade_value"].sum().sort_values(ascending=False).head(5)
-    )
-    company_names = [get_company_name_from_isin(isin) for isin in top_isins.index]
+    company_names = [names[isin] for isin in top_isins.index]
     points.append(
         "Top 5 companies by volume: " + ", ".join(company_names) + "."
     )
 
     # 5 — World tour
     country_div = int(metrics["distinct_countries"])
-    div_pct = pct(agg_df["distinct_countries"], country_div)
+    div_pct = dist.percentile("distinct_countries", country_div)
     points.append(
         f"Traded across {country_div} countries – more global than {div_pct:.0f}% of the community."
     )
 
     # 6 — Mega trade
-    largest_row = df_user.loc[df_user["trade_value"].idxmax()]
     largest_val = largest_row["trade_value"]
-    largest_pct = pct(agg_df["largest_trade"], largest_val)
-    company_name = get_company_name_from_isin(largest_row["ISIN"])
+    largest_pct = dist.percentile("largest_trade", largest_val)
+    company_name = names[largest_row["ISIN"]]
     points.append(
         f"Largest single order: €{largest_val:,.0f} on {company_name} – "
         f"bigger than {largest_pct:.0f}% of all trades."
@@ -189,9 +435,8 @@ def get_trading_wrapped_points(
     )
 
     # 11 — Record‑day cameo
-    daily_counts = df.groupby(df["executedAt"].dt.date).size()
-    record_day = daily_counts.idxmax()
-    traded_record = (df_user["executedAt"].dt.date == record_day).any()
+    record_day = dataset.facts.busiest_day
+    traded_record = dataset.facts.traded_on(user_id, record_day)
     cameo = (
         f"You joined the action on the busiest day ({record_day})!"
         if traded_record
@@ -201,52 +446,149 @@ def get_trading_wrapped_points(
 
     # 12 — Persona
     personas = []
-    if country_div >= agg_df["distinct_countries"].quantile(0.9):
+    if country_div >= dist.quantile("distinct_countries", 0.9):
         personas.append("🌍 Globetrotter")
-    if volume >= agg_df["volume"].quantile(0.9):
+    if volume >= dist.quantile("volume", 0.9):
         personas.append("🐳 Whale")
-    if total_trades >= agg_df["total_trades"].quantile(0.9):
+    if total_trades >= dist.quantile("total_trades", 0.9):
         personas.append("⚡ Day‑tripper")
     largest_val = metrics["largest_trade"]
-    if total_trades <= agg_df["total_trades"].quantile(0.25) and largest_val >= agg_df[
-        "largest_trade"
-    ].quantile(0.75):
+    if total_trades <= dist.quantile("total_trades", 0.25) and largest_val >= dist.quantile(
+        "largest_trade", 0.75
+    ):
         personas.append("🎯 Sniper")
     persona = personas[0] if personas else "📈 Explorer"
     points.append(f"Your 2024 persona: {persona}.")
 
-    # 13 — Looking ahead
-    buys = df_user[df_user["is_buy"]]["trade_value"].sum()
-    sells = df_user[~df_user["is_buy"]]["trade_value"].sum()
+    # 13 — Realized P&L (FIFO)
+    if user_id in dataset.pnl.index:
+        pnl = dataset.pnl.loc[user_id]
+        realized = pnl["realized_pnl"]
+        # A result that rounds to €0 would read "Realised -€0"
+        outcome = (
+            "Broke even on" if round(realized) == 0
+            else f"Realised {'+' if realized > 0 else '-'}€{abs(realized):,.0f} across"
+        )
+        points.append(
+            f"{outcome} {_count(int(pnl['closed_trades']), 'closing sell')} ({pnl['win_rate']:.0%} in profit), "
+            f"holding for {_count(round(pnl['avg_holding_days']), 'day')} on average and paying "
+            f"€{pnl['fees']:,.2f} in fees on them."
+        )
+    else:
+        points.append("No positions closed this year – diamond hands all the way.")
+
+    # 14 — Looking ahead
+    buys = df_user.loc[df_user["is_buy"], "trade_value"].sum()
+    sells = df_user.loc[~df_user["is_buy"], "trade_value"].sum()
     net_flow = buys - sells
     direction = "inflow" if net_flow >= 0 else "outflow"
     points.append(
         f"Net {direction} of €{abs(net_flow):,.0f} – time to set a fresh goal for 2025!"
     )
 
-    return points
+    return WrappedPoints(points, version, tuple(unresolved_names(names)))
+
+
+def _executor() -> ThreadPoolExecutor:
+    """Thread pool for name lookups; a forked child must not reuse its parent's threads."""
+    global _name_executor, _name_executor_pid
+    if _name_executor is None or _name_executor_pid != os.getpid():
+        _name_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="isin-names")
+        _name_executor_pid = os.getpid()
+    return _name_executor
+
+
+def resolve_company_names(isins, timeout: Optional[float] = NAME_LOOKUP_TIMEOUT) -> Dict[str, str]:
+    """Resolve each distinct ISIN once, concurrently, within *timeout* seconds.
+
+    Names resolved earlier in this process are reused. Lookups that miss
+    the deadline keep running in the background but the caller gets the
+    raw ISIN for them, as for lookups that failed; such fallbacks (name ==
+    ISIN) are not remembered and are listed by `unresolved_names`.
+    """
+    names = {}
+    futures = {}
+    for isin in dict.fromkeys(isins):
+        if isin in _company_names:
+            names[isin] = _company_names[isin]
+        else:
+            # The copied context carries the caller's upstream priority into the pool
+            futures[isin] = _executor().submit(contextvars.copy_context().run, get_company_name_from_isin, isin)
+    if not futures:
+        return names
+
+    done, _ = wait(futures.values(), timeout=timeout)
+    for isin, future in futures.items():
+        try:
+            name = future.result() if future in done else isin
+        except Exception:
+            name = isin
+        if name != isin:
+            _company_names[isin] = name
+        names[isin] = name
+    return names
+
+
+def unresolved_names(names: Dict[str, str]) -> List[str]:
+    """The ISINs in a `resolve_company_names` result that fell back to the raw ISIN."""
+    return [isin for isin, name in names.items() if name == isin]
+
+
+def wrapped_isins(csv_path: str = DEFAULT_CSV, user_ids=None) -> List[str]:
+    """Every ISIN the points of *user_ids* (default: all users) mention by name."""
+    df = _dataset(csv_path).df
+    if user_ids is not None:
+        df = df[df["userId"].isin(user_ids)]
+    by_user = df.groupby("userId", observed=True)
+    first = by_user["ISIN"].first()
+    largest = df.loc[by_user["trade_value"].idxmax(), "ISIN"]
+    per_isin = df.groupby(["userId", "ISIN"], observed=True)["trade_value"].sum().sort_values(ascending=False)
+    top = per_isin.groupby(level="userId").head(5).index.get_level_values("ISIN")
+    return list(pd.unique(np.concatenate([first.to_numpy(), largest.to_numpy(), top.to_numpy()])))
+
+
+@lru_cache(maxsize=None)
+def _mistral_client():
+    """Create the Mistral client on first use; openai and dotenv stay out of the import path.
+
+    Retries are left to the upstream scheduler, which also handles 429s.
+    """
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    load_dotenv()
+    return OpenAI(
+        api_key=os.getenv('MISTRAL_API_KEY'),
+        base_url=os.getenv('MISTRAL_BASE_URL', "https://api.mistral.ai/v1"),
+        max_retries=0,
+    )
 
 
 def get_company_name_from_isin(isin: str) -> str:
     """Ermittelt den Firmennamen anhand der ISIN mit Hilfe von Mistral AI."""
+    import yfinance as yf
+
     try:
         # Extrahiere den Ticker aus der ISIN (erste zwei Zeichen sind das Land)
         country_code = isin[:2]
 
-        response = mistral_client.chat.completions.create(
-            model="mistral-small",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Du bist ein Finanzassistent. Deine Aufgabe ist es, den vollständigen Firmennamen anhand einer ISIN zu ermitteln. Antworte NUR mit dem Firmennamen, ohne weitere Erklärungen, Formatierung oder Disclaimer. Beispiel: Für 'US0378331005' (Apple) antworte nur 'Apple Inc.'"
-                },
-                {
-                    "role": "user",
-                    "content": f"Was ist der vollständige Firmenname für die ISIN {isin}? Antworte nur mit dem Namen."
-                }
-            ],
-            temperature=0.1,  # Niedrige Temperatur für konsistente Antworten
-            max_tokens=50
+        response = upstream("mistral").call(
+            ("company-name-isin", isin),
+            lambda: _mistral_client().chat.completions.create(
+                model="mistral-small",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Du bist ein Finanzassistent. Deine Aufgabe ist es, den vollständigen Firmennamen anhand einer ISIN zu ermitteln. Antworte NUR mit dem Firmennamen, ohne weitere Erklärungen, Formatierung oder Disclaimer. Beispiel: Für 'US0378331005' (Apple) antworte nur 'Apple Inc.'"
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Was ist der vollständige Firmenname für die ISIN {isin}? Antworte nur mit dem Namen."
+                    }
+                ],
+                temperature=0.1,  # Niedrige Temperatur für konsistente Antworten
+                max_tokens=50
+            ),
         )
 
         company_name = response.choices[0].message.content.strip()
@@ -266,17 +608,19 @@ def get_company_name_from_isin(isin: str) -> str:
             try:
                 # Versuche es mit yfinance als Fallback
                 stock = yf.Ticker(isin)
-                company_name = stock.info.get('longName', isin)
+                with upstream_call("yfinance"):
+                    company_name = stock.info.get('longName', isin)
             except:
                 return isin
 
         return company_name
     except Exception as e:
-        print(f"Fehler beim Abrufen des Firmennamens für ISIN {isin}: {str(e)}")
+        logger.warning("Fehler beim Abrufen des Firmennamens für ISIN %s: %s", isin, e)
         try:
             # Fallback auf yfinance
             stock = yf.Ticker(isin)
-            return stock.info.get('longName', isin)
+            with upstream_call("yfinance"):
+                return stock.info.get('longName', isin)
         except:
             return isin
 
@@ -284,16 +628,16 @@ def get_company_name_from_isin(isin: str) -> str:
 if __name__ == "__main__":
     print("Script started")  # Debug print
     if len(sys.argv) < 2:
-        sys.exit("Usage: python trading_wrapped.py <USER_ID> [CSV_PATH]")
+        sys.exit("Usage: python -m tr_wrapped.trading_wrapped <USER_ID> [CSV_PATH]")
     user_id = sys.argv[1]
     csv_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CSV
     print(f"Processing user_id: {user_id}")  # Debug print
     print(f"Using CSV path: {csv_path}")  # Debug print
     try:
-        wrapped_points = get_trading_wrapped_points(user_id, csv_path)
+        points = get_trading_wrapped_points(user_id, csv_path)
         # Output as a JSON‑style array for easy consumption by other tools
         import json
-        print(json.dumps(wrapped_points, indent=2, ensure_ascii=False))
+        print(json.dumps(points, indent=2, ensure_ascii=False))
     except Exception as e:
         print(f"Error occurred: {str(e)}")  # Debug print
         raise
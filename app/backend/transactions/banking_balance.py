@@ -7,39 +7,56 @@ Usage
 python banking_balance.py <USER_ID> [CSV_PATH]
 
 Die Funktion `get_balance_over_time()` kann auch direkt importiert und
-aufgerufen werden.
+aufgerufen werden. Sie unterstützt einen Zeitraum (`start`/`end`),
+Cursor-Pagination der Transaktionen (`cursor`/`limit`) und eine
+ausgedünnte Kontostandskurve (`points`) sowie rollierende 7/30/90-Tage-
+Cashflows (`rolling`). `stream_balance_over_time()`
+liefert denselben Verlauf als NDJSON-Stream.
+
+Der Datensatz wird pro Prozess einmal geladen und nach (userId,
+bookingDate) sortiert gehalten (`_dataset()`), bis sich die CSV-Datei
+ändert. Textspalten sind kategorisch, die Daten liegen also in
+NumPy-Arrays statt in Python-Objekten je Zeile; so bleiben sie nach
+einem fork copy-on-write geteilt (siehe `warm_cache()`).
 
 Dependencies: pandas >=1.5
 """
 
+import os
 import sys
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import pandas as pd
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 
 DEFAULT_CSV = "banking_sample_data.csv"
+STREAM_CHUNK_SIZE = 500
+ROLLING_WINDOWS = (7, 30, 90)
+# Wenige verschiedene Werte oder IDs: als Kategorien sind das Integer-Codes
+CATEGORY_COLUMNS = ["userId", "side", "currency", "type"]
 
 
 def _load(csv_path: str) -> pd.DataFrame:
     """Liest die Banking-Daten und fügt Hilfsspalten hinzu."""
-    print(f"Lade CSV von: {csv_path}")
-    df = pd.read_csv(csv_path, parse_dates=["bookingDate"])
+    logger.info("Lade CSV von %s", csv_path)
+    df = pd.read_csv(csv_path, parse_dates=["bookingDate"], dtype={col: "category" for col in CATEGORY_COLUMNS})
     if df.empty:
         raise ValueError(f"Keine Daten in {csv_path} gefunden")
     
     # Konvertiere Beträge basierend auf der Transaktionsseite
-    df["signed_amount"] = df.apply(
-        lambda row: row["amount"] if row["side"] == "CREDIT" else -row["amount"],
-        axis=1
-    )
+    df["signed_amount"] = np.where(df["side"] == "CREDIT", df["amount"], -df["amount"])
     
     # Füge zusätzliche Zeitinformationen hinzu
-    df["date"] = df["bookingDate"].dt.date
     df["month"] = df["bookingDate"].dt.to_period("M")
     
-    print(f"{len(df)} Transaktionen geladen")
+    logger.info("%d Transaktionen geladen", len(df))
     return df
 
 
@@ -50,9 +67,9 @@ def _calculate_statistics(df_user: pd.DataFrame) -> Dict[str, Any]:
             "einnahmen": float(df_user[df_user["side"] == "CREDIT"]["amount"].sum()),
             "ausgaben": float(df_user[df_user["side"] == "DEBIT"]["amount"].sum()),
             "anzahl_transaktionen": len(df_user),
-            "durchschnittlicher_kontostand": float(df_user["balance"].mean()),
-            "maximaler_kontostand": float(df_user["balance"].max()),
-            "minimaler_kontostand": float(df_user["balance"].min()),
+            "durchschnittlicher_kontostand": float(df_user["balance"].mean()) if not df_user.empty else 0.0,
+            "maximaler_kontostand": float(df_user["balance"].max()) if not df_user.empty else 0.0,
+            "minimaler_kontostand": float(df_user["balance"].min()) if not df_user.empty else 0.0,
             "aktueller_kontostand": float(df_user["balance"].iloc[-1]) if not df_user.empty else 0.0
         },
         "nach_typ": {}
@@ -88,9 +105,257 @@ def _calculate_statistics(df_user: pd.DataFrame) -> Dict[str, Any]:
     return stats
 
 
-def get_balance_over_time(user_id: str="00909ba7-ad01-42f1-9074-2773c7d3cf2c", csv_path: str = DEFAULT_CSV) -> Dict[str, Any]:
+def _rolling_sums(daily: np.ndarray, window: int) -> np.ndarray:
+    """Summe der letzten `window` Tage für jeden Tag (letzte Achse) über Präfixsummen in O(n)."""
+    prefix = np.concatenate((np.zeros(daily.shape[:-1] + (1,)), np.cumsum(daily, axis=-1)), axis=-1)
+    ends = np.arange(1, daily.shape[-1] + 1)
+    return prefix[..., ends] - prefix[..., np.maximum(ends - window, 0)]
+
+
+def _calculate_rolling(df_user: pd.DataFrame, windows=ROLLING_WINDOWS) -> Dict[str, Any]:
+    """Berechnet rollierende Ein-/Ausgaben je Fenster sowie Ausgaben je MCC.
+
+    Die Beträge werden auf ein tägliches Raster vom ersten bis zum letzten
+    Buchungstag verteilt, danach liefert jede Fenstergröße eine Präfixsummen-
+    Differenz pro Tag. Stichtag ist der letzte Buchungstag.
+    """
+    if df_user.empty:
+        return {"stichtag": None, "fenster": {}, "nach_mcc": {}}
+
+    days = df_user["bookingDate"].dt.normalize()
+    first_day = days.iloc[0]
+    offsets = ((days - first_day) // pd.Timedelta(days=1)).to_numpy()
+    n_days = int(offsets[-1]) + 1
+    signed = df_user["signed_amount"].to_numpy()
+
+    # Tägliche Zuflüsse und Abflüsse (Abflüsse als positive Beträge)
+    inflow = np.bincount(offsets, weights=np.where(signed > 0, signed, 0.0), minlength=n_days)
+    outflow = np.bincount(offsets, weights=np.where(signed < 0, -signed, 0.0), minlength=n_days)
+
+    fenster = {}
+    for window in windows:
+        rolling_in = _rolling_sums(inflow, window)
+        rolling_out = _rolling_sums(outflow, window)
+        peak = int(rolling_out.argmax())
+        fenster[str(window)] = {
+            "einnahmen": round(float(rolling_in[-1]), 2),
+            "ausgaben": round(float(rolling_out[-1]), 2),
+            "netto": round(float(rolling_in[-1] - rolling_out[-1]), 2),
+            "maximale_ausgaben": round(float(rolling_out[peak]), 2),
+            "maximale_ausgaben_bis": (first_day + pd.Timedelta(days=peak)).date().isoformat()
+        }
+
+    # Ausgaben je Händlerkategorie (mcc) als Matrix Kategorie × Tag
+    spend = df_user["mcc"].notna().to_numpy() & (signed < 0)
+    nach_mcc = {}
+    if spend.any():
+        codes, mccs = pd.factorize(df_user.loc[spend, "mcc"])
+        matrix = np.bincount(
+            codes * n_days + offsets[spend],
+            weights=-signed[spend],
+            minlength=len(mccs) * n_days
+        ).reshape(len(mccs), n_days)
+        current = {window: _rolling_sums(matrix, window)[:, -1] for window in windows}
+        for i, mcc in enumerate(mccs):
+            nach_mcc[str(int(mcc))] = {
+                str(window): round(float(current[window][i]), 2) for window in windows
+            }
+
+    return {
+        "stichtag": (first_day + pd.Timedelta(days=n_days - 1)).date().isoformat(),
+        "fenster": fenster,
+        "nach_mcc": nach_mcc
+    }
+
+
+def _user_frame(df: pd.DataFrame, user_id: str, csv_path: str) -> pd.DataFrame:
+    """Filtert die Transaktionen eines Benutzers, sortiert sie und berechnet den Kontostand."""
+    if user_id not in df["userId"].unique():
+        raise ValueError(f"Benutzer '{user_id}' nicht in {csv_path} gefunden")
+
+    # Filtere nach Benutzer und sortiere nach Datum
+    df_user = (
+        df[df["userId"] == user_id]
+        .sort_values("bookingDate")
+        .reset_index(drop=True)
+    )
+
+    # Berechne den kumulativen Kontostand über die gesamte Historie,
+    # damit auch ein Ausschnitt den korrekten Stand zeigt; gruppiert wie in
+    # `_build_dataset`, dessen kompensierte Summe in den letzten Stellen abweicht
+    df_user["balance"] = df_user.groupby("userId", observed=True)["signed_amount"].cumsum()
+    return df_user
+
+
+@dataclass(frozen=True)
+class _BankingDataset:
+    """Eine Version der Banking-CSV, sortiert nach (userId, bookingDate).
+
+    Die Buchungen eines Benutzers bilden einen zusammenhängenden Block in
+    *df*, den *offsets* adressiert; `balance` ist je Benutzer kumuliert.
+    """
+
+    version: str
+    df: pd.DataFrame
+    offsets: Dict[str, Tuple[int, int]]
+
+    def user_frame(self, user_id: str, csv_path: str) -> pd.DataFrame:
+        """Die Buchungen von *user_id* samt Kontostand als Ausschnitt von *df*."""
+        if user_id not in self.offsets:
+            raise ValueError(f"Benutzer '{user_id}' nicht in {csv_path} gefunden")
+        start, end = self.offsets[user_id]
+        return self.df.iloc[start:end]
+
+
+def _user_offsets(user_ids: pd.Series) -> Dict[str, Tuple[int, int]]:
+    """Zeilenbereich [start, end) je Benutzer in einer nach userId sortierten Tabelle.
+
+    Buchungen ohne userId (Code -1) gehören zu keinem Benutzer und fehlen in den Bereichen.
+    """
+    codes = user_ids.cat.codes.to_numpy()
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    categories = user_ids.cat.categories
+    return {
+        categories[codes[start]]: (int(start), int(end))
+        for start, end in zip(starts, ends)
+        if codes[start] >= 0
+    }
+
+
+def _build_dataset(csv_path: str, version: str) -> _BankingDataset:
+    df = _load(csv_path)
+    # Stabil nach userId sortiert liegen die Buchungen eines Benutzers in CSV-Reihenfolge vor,
+    # wie nach dem Filtern in `_user_frame`
+    df = df.sort_values("userId", kind="mergesort").reset_index(drop=True)
+    offsets = _user_offsets(df["userId"])
+
+    # Je Benutzer mit demselben (nicht stabilen) Quicksort nach bookingDate wie `_user_frame`,
+    # damit gleichzeitige Buchungen und damit die Kontostände dazwischen gleich bleiben
+    dates = df["bookingDate"].to_numpy()
+    order = np.arange(len(df))
+    for start, end in offsets.values():
+        order[start:end] = start + np.argsort(dates[start:end], kind="quicksort")
+    df = df.iloc[order].reset_index(drop=True)
+
+    # Kontostand je Benutzer über die gesamte Historie wie in `_user_frame`;
+    # Buchungen ohne userId bleiben ohne Kontostand
+    df["balance"] = df.groupby("userId", observed=True, sort=False)["signed_amount"].cumsum()
+    return _BankingDataset(version, df, offsets)
+
+
+_datasets: Dict[str, _BankingDataset] = {}
+_datasets_lock = threading.Lock()
+
+
+def _dataset(csv_path: str) -> _BankingDataset:
+    """Liefert den Datensatz zur aktuellen Version von *csv_path*, lädt ihn nur bei Änderung neu."""
+    stat = os.stat(csv_path)
+    version = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    dataset = _datasets.get(csv_path)
+    if dataset is not None and dataset.version == version:
+        return dataset
+    with _datasets_lock:
+        dataset = _datasets.get(csv_path)
+        if dataset is None or dataset.version != version:
+            dataset = _datasets[csv_path] = _build_dataset(csv_path, version)
+    return dataset
+
+
+def warm_cache(csv_path: str = DEFAULT_CSV) -> None:
+    """Lädt *csv_path* vorab, z. B. im Master-Prozess vor dem fork der Worker."""
+    _dataset(csv_path)
+
+
+def _window(df_user: pd.DataFrame, start: Optional[date] = None, end: Optional[date] = None) -> Tuple[int, int]:
+    """Bestimmt per Binärsuche den Zeilenbereich [lo, hi) für den Zeitraum start..end (inklusive)."""
+    dates = df_user["bookingDate"].to_numpy()
+    lo = 0 if start is None else int(np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), side="left"))
+    if end is None:
+        hi = len(dates)
+    else:
+        end_exclusive = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+        hi = int(np.searchsorted(dates, end_exclusive.to_datetime64(), side="left"))
+    return lo, max(lo, hi)
+
+
+def _downsample(balance: np.ndarray, points: int) -> np.ndarray:
+    """Wählt höchstens `points` Indizes aus, die die Form der Kurve erhalten.
+
+    Erster und letzter Punkt bleiben immer erhalten, dazwischen liefert jeder
+    Bucket seinen minimalen und maximalen Kontostand (Min/Max-Bucketing).
+    Bei geradem `points` und mehr Buchungen sind es genau `points` Indizes:
+    jeder der (points - 2) / 2 Buckets enthält mindestens zwei Buchungen.
+    """
+    n = len(balance)
+    if n <= points:
+        return np.arange(n)
+    buckets = (points - 2) // 2
+    if buckets < 1:
+        return np.array([0, n - 1])
+
+    inner = np.arange(1, n - 1)
+    bucket = (inner - 1) * buckets // (n - 2)
+    # Sortiere nach Bucket und innerhalb des Buckets nach Kontostand
+    order = np.lexsort((balance[inner], bucket))
+    sorted_buckets = bucket[order]
+    boundary = sorted_buckets[1:] != sorted_buckets[:-1]
+    is_min = np.r_[True, boundary]
+    is_max = np.r_[boundary, True]
+    picked = inner[order[is_min | is_max]]
+    return np.unique(np.r_[0, picked, n - 1])
+
+
+def _format_transactions(df_page: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Formatiert Transaktionen spaltenweise statt zeilenweise über iterrows."""
+    return [
+        {
+            "timestamp": timestamp.isoformat(),
+            "balance": balance,
+            "transaction": {
+                "amount": amount,
+                "type": typ,
+                "side": side,
+                "currency": currency
+            }
+        }
+        for timestamp, balance, amount, typ, side, currency in zip(
+            df_page["bookingDate"],
+            df_page["balance"].round(2).tolist(),
+            df_page["amount"].round(2).tolist(),
+            df_page["type"],
+            df_page["side"],
+            df_page["currency"],
+        )
+    ]
+
+
+def get_balance_over_time(
+    user_id: str="00909ba7-ad01-42f1-9074-2773c7d3cf2c",
+    csv_path: str = DEFAULT_CSV,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    points: Optional[int] = None,
+    rolling: bool = False,
+    df: Optional[pd.DataFrame] = None,
+) -> Dict[str, Any]:
     """Berechnet den Kontostand über Zeit für einen Benutzer.
-    
+
+    Args:
+        start, end: Optionaler Zeitraum (inklusive) über das Buchungsdatum.
+        cursor, limit: Cursor-Pagination der Transaktionen. Der Cursor ist die
+            Position in der sortierten Historie des Benutzers; `naechster_cursor`
+            der Antwort setzt die Seite fort.
+        points: Liefert statt der Transaktionen eine auf höchstens `points`
+            Punkte ausgedünnte Kontostandskurve (`kontostand_verlauf`); eine
+            gerade Zahl ab 2, andere Werte ergeben einen ValueError.
+        rolling: Ergänzt rollierende 7/30/90-Tage-Cashflows gesamt und je
+            `mcc` zum Ende des Zeitraums (`rollierend`).
+        df: Ein mit `_load()` geladener Datensatz, der statt des im Prozess
+            gehaltenen (`_dataset()`) verwendet wird.
+
     Returns:
         Dict: Dictionary mit Kontostand-Verlauf und Statistiken
         {
@@ -107,6 +372,9 @@ def get_balance_over_time(user_id: str="00909ba7-ad01-42f1-9074-2773c7d3cf2c", c
                 },
                 ...
             ],
+            "paginierung": {...},        # nur mit `limit`
+            "kontostand_verlauf": [...],  # nur mit `points`, ersetzt "transaktionen"
+            "rollierend": {...},          # nur mit `rolling`
             "statistiken": {
                 "gesamt": {...},
                 "nach_typ": {...},
@@ -114,42 +382,73 @@ def get_balance_over_time(user_id: str="00909ba7-ad01-42f1-9074-2773c7d3cf2c", c
             }
         }
     """
-    df = _load(csv_path)
-    
-    if user_id not in df["userId"].unique():
-        raise ValueError(f"Benutzer '{user_id}' nicht in {csv_path} gefunden")
-    
-    # Filtere nach Benutzer und sortiere nach Datum
-    df_user = (
-        df[df["userId"] == user_id]
-        .sort_values("bookingDate")
-        .reset_index(drop=True)
-    )
-    
-    # Berechne den kumulativen Kontostand
-    df_user["balance"] = df_user["signed_amount"].cumsum()
-    
-    # Formatiere die Transaktionen
-    transactions = []
-    for _, row in df_user.iterrows():
-        transactions.append({
-            "timestamp": row["bookingDate"].isoformat(),
-            "balance": round(row["balance"], 2),
-            "transaction": {
-                "amount": round(row["amount"], 2),
-                "type": row["type"],
-                "side": row["side"],
-                "currency": row["currency"]
-            }
-        })
-    
-    # Berechne Statistiken
-    statistics = _calculate_statistics(df_user)
-    
-    return {
-        "transaktionen": transactions,
-        "statistiken": statistics
-    }
+    if df is None:
+        df_user = _dataset(csv_path).user_frame(user_id, csv_path)
+    else:
+        df_user = _user_frame(df, user_id, csv_path)
+    lo, hi = _window(df_user, start, end)
+    df_window = df_user.iloc[lo:hi]
+
+    result: Dict[str, Any] = {}
+    if points is not None:
+        if points < 2 or points % 2:
+            raise ValueError(f"points muss eine gerade Zahl ab 2 sein, nicht {points}")
+        idx = _downsample(df_window["balance"].to_numpy(), points)
+        sampled = df_window.iloc[idx]
+        result["kontostand_verlauf"] = [
+            {"timestamp": timestamp.isoformat(), "balance": balance}
+            for timestamp, balance in zip(sampled["bookingDate"], sampled["balance"].round(2).tolist())
+        ]
+    elif limit is not None:
+        page_start = max(lo, cursor or 0)
+        page_end = min(hi, page_start + limit)
+        result["transaktionen"] = _format_transactions(df_user.iloc[page_start:page_end])
+        result["paginierung"] = {
+            "cursor": page_start,
+            "limit": limit,
+            "naechster_cursor": page_end if page_end < hi else None,
+            "gesamt": hi - lo
+        }
+    else:
+        result["transaktionen"] = _format_transactions(df_window)
+
+    # Berechne Statistiken über den gewählten Zeitraum
+    result["statistiken"] = _calculate_statistics(df_window)
+    if rolling:
+        # Die Fenster zum Ende des Zeitraums dürfen auf frühere Buchungen zurückgreifen
+        result["rollierend"] = _calculate_rolling(df_user.iloc[:hi])
+    return result
+
+
+def _iter_ndjson(df_window: pd.DataFrame, chunk_size: int) -> Iterator[str]:
+    """Serialisiert den Verlauf blockweise; erst zum Schluss folgen die Statistiken."""
+    for chunk_start in range(0, len(df_window), chunk_size):
+        chunk = df_window.iloc[chunk_start:chunk_start + chunk_size]
+        yield "".join(
+            json.dumps(record, ensure_ascii=False) + "\n"
+            for record in _format_transactions(chunk)
+        )
+    yield json.dumps({"statistiken": _calculate_statistics(df_window)}, ensure_ascii=False) + "\n"
+
+
+def stream_balance_over_time(
+    user_id: str="00909ba7-ad01-42f1-9074-2773c7d3cf2c",
+    csv_path: str = DEFAULT_CSV,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[str]:
+    """Liefert den Kontostand-Verlauf als NDJSON-Blöcke.
+
+    Jede Zeile ist eine Transaktion im Format von `get_balance_over_time()`,
+    die letzte Zeile enthält `{"statistiken": {...}}`. Laden und Validierung
+    passieren sofort, damit ein unbekannter Benutzer noch vor dem ersten
+    Byte als Fehler gemeldet werden kann; die Serialisierung läuft danach
+    blockweise, sodass nie die komplette Liste im Speicher liegt.
+    """
+    df_user = _dataset(csv_path).user_frame(user_id, csv_path)
+    lo, hi = _window(df_user, start, end)
+    return _iter_ndjson(df_user.iloc[lo:hi], chunk_size)
 
 
 if __name__ == "__main__":
@@ -165,7 +464,6 @@ if __name__ == "__main__":
     
     try:
         result = get_balance_over_time(user_id, csv_path)
-        import json
         print(json.dumps(result, indent=2, ensure_ascii=False))
     except Exception as e:
         print(f"Fehler aufgetreten: {str(e)}")
@@ -0,0 +1,262 @@
+"""Rate-limited, prioritised calls to the external providers.
+
+Finnhub, Mistral, Perplexity and logo.dev each enforce a request quota.
+Every call to one of them goes through the provider's `Upstream`
+(``upstream("finnhub").call(key, fn)``):
+
+* a token bucket (``rate`` requests per second, bursts of up to
+  ``burst``) decides when the next request may start,
+* waiting calls start by priority class, then in arrival order:
+  INTERACTIVE (a client waits for the answer) before PREFETCH (warmup)
+  before BATCH (batch_insights),
+* a call whose key is already queued or running joins that call instead
+  of sending the same request again; a waiting interactive caller lifts
+  the queued call to its own class,
+* a 429 pauses the whole provider for Retry-After (or an exponential
+  backoff without one) and puts the call back at the head of its class,
+  up to MAX_RETRIES times.
+
+The priority travels in a context variable: a background job sets it
+once with ``with priority(BATCH):`` and every call beneath it, including
+calls made via ``asyncio.to_thread``, is scheduled accordingly. A plain
+thread pool does not copy the context; submit through
+``contextvars.copy_context().run`` there.
+
+Limits are the DEFAULT_LIMITS below, overridden per provider by
+UPSTREAM_LIMITS (JSON, ``{"finnhub": [rate, burst], ...}``); a rate of
+0 disables the limit for that provider. They apply per process: with
+several gunicorn workers (or a batch run next to the server) split the
+provider's quota between them.
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple, TypeVar
+
+from metrics import Counter, Histogram, upstream_call
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, PREFETCH, BATCH = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PREFETCH: "prefetch", BATCH: "batch"}
+
+# Requests per second and burst size per provider
+DEFAULT_LIMITS: Dict[str, Tuple[float, int]] = {
+    "finnhub": (1.0, 30),        # free plan: 60 per minute, at most 30 per second
+    "mistral": (1.0, 1),         # free plan: 1 per second
+    "perplexity": (50 / 60, 5),  # 50 per minute for sonar models
+    "logo": (10.0, 10),
+}
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+T = TypeVar("T")
+
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+upstream_scheduled = Counter(
+    "upstream_scheduled_total", "Calls to external providers by scheduling outcome (sent, coalesced, rate_limited).",
+    ("provider", "priority", "outcome"),
+)
+upstream_queue_duration = Histogram(
+    "upstream_queue_seconds", "Time calls to external providers waited for their turn.", ("provider", "priority")
+)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Schedule the upstream calls made inside the block with priority *level*."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    # openai errors carry status_code, requests' HTTPError only the response
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from the Retry-After header of the failed response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Call:
+    """One queued request; orders by priority class, then arrival."""
+
+    __slots__ = ("priority", "seq", "future", "attempts")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.future: Future = Future()
+        self.attempts = 0
+
+    def __lt__(self, other: "_Call") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Upstream:
+    """Token bucket and priority queue of one provider, shared by all threads of the process."""
+
+    def __init__(self, provider: str, rate: float, burst: int):
+        self.provider = provider
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._queue: list = []
+        self._pending: Dict[Hashable, _Call] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def call(self, key: Optional[Hashable], fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``fn(*args, **kwargs)`` when the provider's limit and queue allow it.
+
+        Calls with the same *key* that overlap share one request and its
+        result or exception; None never coalesces. *fn* must raise on a
+        429 for it to be retried.
+        """
+        level = _priority.get()
+        with self._cond:
+            pending = self._pending.get(key) if key is not None else None
+            if pending is None:
+                call = _Call(level, next(self._seq))
+                if key is not None:
+                    self._pending[key] = call
+            elif level < pending.priority and pending in self._queue:
+                pending.priority = level
+                heapq.heapify(self._queue)
+        if pending is not None:
+            upstream_scheduled.inc(self.provider, PRIORITY_NAMES[level], "coalesced")
+            return pending.future.result()
+
+        try:
+            result = self._run(call, fn, args, kwargs)
+        except BaseException as e:
+            self._finish(key, call)
+            call.future.set_exception(e)
+            raise
+        self._finish(key, call)
+        call.future.set_result(result)
+        return result
+
+    def _finish(self, key: Optional[Hashable], call: _Call):
+        if key is not None:
+            with self._cond:
+                if self._pending.get(key) is call:
+                    del self._pending[key]
+
+    def _run(self, call: _Call, fn: Callable[..., T], args, kwargs) -> T:
+        while True:
+            self._acquire(call)
+            try:
+                with upstream_call(self.provider):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if _status(e) != 429 or call.attempts >= MAX_RETRIES:
+                    raise
+                call.attempts += 1
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (call.attempts - 1))
+                upstream_scheduled.inc(self.provider, PRIORITY_NAMES[call.priority], "rate_limited")
+                logger.info("%s rate limited, pausing %.1fs (attempt %d)", self.provider, delay, call.attempts)
+                self._pause(delay)
+
+    def _delay(self, now: float) -> float:
+        """Seconds until the next request may start."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.rate <= 0:
+            return 0.0
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def _acquire(self, call: _Call):
+        """Block until *call* is first in the queue and a token is available, then take it."""
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, call)
+            # A new head may have arrived ahead of the one waiting for a token
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._queue[0] is call:
+                        delay = self._delay(time.monotonic())
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                # Interrupted while waiting: do not block the calls behind it
+                self._queue.remove(call)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            if self.rate > 0:
+                self._tokens -= 1
+            self._cond.notify_all()
+        upstream_queue_duration.observe(time.monotonic() - started, self.provider, PRIORITY_NAMES[call.priority])
+        upstream_scheduled.inc(self.provider, PRIORITY_NAMES[call.priority], "sent")
+
+    def _pause(self, delay: float):
+        """Stop every request to this provider for *delay* seconds."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            self._cond.notify_all()
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def _limits() -> Dict[str, Tuple[float, int]]:
+    limits = dict(DEFAULT_LIMITS)
+    for provider, (rate, burst) in json.loads(os.getenv("UPSTREAM_LIMITS") or "{}").items():
+        limits[provider] = (float(rate), int(burst))
+    return limits
+
+
+def upstream(provider: str) -> Upstream:
+    """The process-wide scheduler of *provider*, created on first use."""
+    scheduler = _upstreams.get(provider)
+    if scheduler is None:
+        with _upstreams_lock:
+            scheduler = _upstreams.get(provider)
+            if scheduler is None:
+                rate, burst = _limits().get(provider, (0.0, 1))
+                scheduler = _upstreams[provider] = Upstream(provider, rate, burst)
+    return scheduler